@@ -13,15 +13,52 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
+import argparse
+import bisect
+import math
 import os
-
 import subprocess
+import sys
+import textwrap
+
+from stepImpl import FLAPS, GEAR_RATIO_INPUT_STEPS, GEAR_RATIO_OUTPUT_FLAPS
+
+SOFTWARE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'software'))
+
+# Move times come from the driver's model of the firmware, so that the report agrees with what the driver predicts
+sys.path.insert(0, SOFTWARE_PATH)
+from splitflap.travel import move_micros
 
 MIN_PERIOD_MICROS = 1650
 MAX_PERIOD_MICROS = 20000
 ACCEL_TIME_MICROS = 200000
 IDLE_PERIOD_MICROS = 1200
 
+# How long the acceleration takes to ramp up to its full value, and back down to nothing, in an S-curve profile
+JERK_TIME_MICROS = 50000
+
+# An example torque curve, as (steps per second, torque in mN*m) pairs, with the rough shape of a 28BYJ-48's pull-out
+# torque. Pass your own measurements with --torque-curve.
+TORQUE_CURVE = [(0, 60), (100, 55), (200, 48), (300, 40), (400, 32), (500, 24), (600, 17), (700, 11), (800, 6)]
+# Torque taken up by friction and the flaps, in mN*m
+LOAD_TORQUE = 8
+# Acceleration, in steps/s^2, that each mN*m of torque to spare gives the rotor
+ACCEL_PER_TORQUE = 600
+# The share of the torque to spare that a torque-curve profile uses to speed up
+TORQUE_MARGIN = 0.5
+# How sharply the chance of a step skipping rises as the torque needed approaches the torque available
+SKIP_SOFTNESS = 0.02
+
+# The firmware indexes ACCEL_STEP_PERIODS with a uint8_t and stores its periods as uint16_t
+MAX_PERIODS = 255
+MAX_PERIOD_VALUE = 65535
+
+REPORT_FLAPS = [1, 10, 40]
+# Simulated time allowed for a message to settle when checking a profile; a full revolution takes a few seconds
+SETTLE_LIMIT_MICROS = 20 * 1000000
+
+PROFILES = ['trapezoid', 's-curve', 'torque']
+
 _TEMPLATE = """/*
    Copyright 2017 Scott Bezek and the splitflap contributors
 
@@ -51,39 +88,260 @@ namespace Acceleration {{
 #endif
 """
 
+# The same table for the driver, which predicts how long moves take from it
+_PYTHON_TEMPLATE = """# NOTE: THIS FILE IS AUTOGENERATED! DO NOT MODIFY!
+# To update, run `{script_path}`
 
-def run(output_file_path):
-    min_velocity = 1000000 / float(MAX_PERIOD_MICROS)
-    max_velocity = 1000000 / float(MIN_PERIOD_MICROS)
+# Matches ACCEL_STEP_PERIODS in arduino/splitflap/acceleration.h: the step period, in microseconds, at each speed. The
+# firmware speeds up or slows down by one entry per step.
+ACCEL_STEP_PERIODS = [
+{periods_lines}
+]
+"""
 
-    t = 0
-    ramp_periods = [IDLE_PERIOD_MICROS]
-    while t < ACCEL_TIME_MICROS:
-        velocity = min_velocity + (max_velocity - min_velocity) * float(t) / ACCEL_TIME_MICROS
-        if velocity > max_velocity:
-            velocity = max_velocity
 
+def _ramp(velocity_at):
+    # Samples a ramp one step at a time: each step's period comes from the velocity, in steps per second, at the time
+    # it starts. Stops once the profile reaches top speed or returns None.
+    max_velocity = 1000000 / float(MIN_PERIOD_MICROS)
+    t = 0
+    ramp_periods = []
+    while True:
+        velocity = velocity_at(t, 1000000 / float(ramp_periods[-1]) if ramp_periods else 0)
+        if velocity is None:
+            break
+        velocity = min(velocity, max_velocity)
         period = int(1000000 / velocity)
-        
         ramp_periods.append(period)
         t += period
-    assert len(ramp_periods) <= 255, 'number of ramp periods would exceed a uint8_t'
+        if velocity >= max_velocity:
+            break
+    return ramp_periods
+
+
+def trapezoid_profile(accel_time=ACCEL_TIME_MICROS):
+    # Speeds up at a constant rate, from the slowest to the fastest speed over `accel_time`
+    min_velocity = 1000000 / float(MAX_PERIOD_MICROS)
+    max_velocity = 1000000 / float(MIN_PERIOD_MICROS)
+
+    def velocity_at(t, _):
+        if t >= accel_time:
+            return None
+        return min_velocity + (max_velocity - min_velocity) * float(t) / accel_time
+    return _ramp(velocity_at)
+
+
+def s_curve_profile(accel_time=ACCEL_TIME_MICROS, jerk_time=JERK_TIME_MICROS):
+    # Jerk-limited: the acceleration ramps up over `jerk_time`, holds, and ramps back down over `jerk_time` so that it
+    # reaches top speed smoothly after `accel_time`
+    if not 0 <= 2 * jerk_time <= accel_time:
+        raise ValueError('Jerk time {} must be at most half the acceleration time {}'.format(jerk_time, accel_time))
+    min_velocity = 1000000 / float(MAX_PERIOD_MICROS)
+    max_velocity = 1000000 / float(MIN_PERIOD_MICROS)
+    accel = (max_velocity - min_velocity) / float(accel_time - jerk_time)
 
+    def velocity_at(t, _):
+        if t >= accel_time:
+            return None
+        if t < jerk_time:
+            return min_velocity + accel * t * t / (2.0 * jerk_time)
+        if t < accel_time - jerk_time:
+            return min_velocity + accel * (t - jerk_time / 2.0)
+        return max_velocity - accel * (accel_time - t) ** 2 / (2.0 * jerk_time)
+    return _ramp(velocity_at)
+
+
+def _torque_at(torque_curve, velocity):
+    # Linear interpolation between the measured points, holding the last one beyond them
+    speeds = [speed for speed, _ in torque_curve]
+    index = bisect.bisect_right(speeds, velocity)
+    if index == 0:
+        return torque_curve[0][1]
+    if index == len(torque_curve):
+        return torque_curve[-1][1]
+    (speed_a, torque_a), (speed_b, torque_b) = torque_curve[index - 1], torque_curve[index]
+    return torque_a + (torque_b - torque_a) * (velocity - speed_a) / float(speed_b - speed_a)
+
+
+def torque_profile(torque_curve=TORQUE_CURVE, load_torque=LOAD_TORQUE, accel_per_torque=ACCEL_PER_TORQUE,
+                   margin=TORQUE_MARGIN):
+    # Speeds up as hard as `margin` of the torque to spare at each speed allows, so it accelerates quickly where the
+    # motor is strong and levels off at the speed where the torque runs out
+    min_velocity = 1000000 / float(MAX_PERIOD_MICROS)
+
+    def velocity_at(t, velocity):
+        if velocity == 0:
+            return min_velocity
+        accel = margin * (_torque_at(torque_curve, velocity) - load_torque) * accel_per_torque
+        if accel <= 0:
+            return None
+        # each entry in the table is one step further on
+        next_velocity = math.sqrt(velocity * velocity + 2 * accel)
+        if next_velocity * (1 - 1e-3) <= velocity:
+            return None
+        return next_velocity
+    return _ramp(velocity_at)
+
+
+def fit_periods(ramp_periods):
+    # Fits a ramp into the firmware's table: periods that only get shorter, each within a uint16_t, and few enough,
+    # with the idle period in front, to be indexed by a uint8_t. A ramp that's too long is cut short, which lowers its
+    # top speed rather than making it accelerate any harder. A period shorter than the motor can step is an error in
+    # the profile, which no table could fix.
+    for period in ramp_periods:
+        if int(round(period)) < MIN_PERIOD_MICROS:
+            raise ValueError('Period {} is shorter than the minimum of {} microseconds'.format(
+                period,
+                MIN_PERIOD_MICROS,
+            ))
+    fitted = []
+    for period in ramp_periods[:MAX_PERIODS - 1]:
+        period = min(int(round(period)), MAX_PERIOD_VALUE)
+        if fitted:
+            period = min(period, fitted[-1])
+        fitted.append(period)
+    return [IDLE_PERIOD_MICROS] + fitted
+
+
+def build_profile(name, args):
+    if name == 'trapezoid':
+        ramp_periods = trapezoid_profile(args.accel_time)
+    elif name == 's-curve':
+        ramp_periods = s_curve_profile(args.accel_time, args.jerk_time)
+    elif name == 'torque':
+        ramp_periods = torque_profile(args.torque_curve, args.load_torque, args.accel_per_torque, args.torque_margin)
+    else:
+        raise ValueError('Unknown profile: {}'.format(name))
+    return fit_periods(ramp_periods)
+
+
+def flap_steps(flaps):
+    # Steps to move `flaps` flaps on from the home flap, rounding up as GetTargetStepForFlapIndex() does
+    return -(-flaps * GEAR_RATIO_INPUT_STEPS // GEAR_RATIO_OUTPUT_FLAPS)
+
+
+def skip_model(torque_curve=TORQUE_CURVE, load_torque=LOAD_TORQUE, accel_per_torque=ACCEL_PER_TORQUE,
+               softness=SKIP_SOFTNESS):
+    # A skip_probability function for stepSim.SplitflapSimulator: the chance of a step at each speed not moving the
+    # rotor, rising steeply as the torque needed to hold that speed and to change to it nears the torque available
+    def skip_probability(periods):
+        probabilities = []
+        previous_velocity = 0
+        for speed, period in enumerate(periods):
+            if speed == 0:
+                probabilities.append(0)
+                continue
+            velocity = 1000000 / float(period)
+            # over the one step from the speed below
+            accel = abs(velocity * velocity - previous_velocity * previous_velocity) / 2
+            needed = load_torque + accel / accel_per_torque
+            available = _torque_at(torque_curve, velocity)
+            ratio = needed / available if available > 0 else float('inf')
+            exponent = (ratio - 1) / softness
+            probabilities.append(1.0 if exponent > 700 else 1 / (1 + math.exp(-exponent)))
+            previous_velocity = velocity
+        return probabilities
+    return skip_probability
+
+
+def check_profile(periods, skip_probability, num_modules=100, messages=50, seed=0):
+    # Runs a wall through random messages in the simulator. Returns how often the modules missed home, per thousand
+    # revolutions, and how many modules failed: gave up looking for home, or were still going when a message should
+    # long since have settled, as a stalled module never finds home where it expects it.
+    import random
+    # the simulator needs numpy, which generating the table doesn't
+    from stepSim import STATE_NORMAL, SplitflapSimulator
+
+    rng = random.Random(seed)
+    simulator = SplitflapSimulator(num_modules, periods=periods, seed=seed, skip_probability=skip_probability)
+    simulator.run_until_idle(SETTLE_LIMIT_MICROS)
+    for _ in range(messages):
+        if not simulator.is_idle():
+            break
+        simulator.go_to_flaps(''.join(rng.choice(FLAPS) for _ in range(num_modules)))
+        simulator.run_until_idle(SETTLE_LIMIT_MICROS)
+    revolutions = max(simulator.steps_taken.sum() / float(GEAR_RATIO_INPUT_STEPS), 1)
+    failed = int(((simulator.state != STATE_NORMAL) | simulator.is_active()).sum())
+    return 1000 * simulator.count_missed_home.sum() / revolutions, failed
+
+
+def report(args):
+    skip_probability = skip_model(args.torque_curve, args.load_torque, args.accel_per_torque)
+    print('{:<10} {:>6} {:>8}  {}{}'.format(
+        'profile',
+        'steps',
+        'min us',
+        ''.join('{:>10}'.format('{} flap{}'.format(flaps, '' if flaps == 1 else 's')) for flaps in REPORT_FLAPS),
+        '' if args.no_simulate else '  missed home /1000 revs  failed modules',
+    ))
+    for name in PROFILES:
+        periods = build_profile(name, args)
+        line = '{:<10} {:>6} {:>8}  {}'.format(
+            name,
+            len(periods) - 1,
+            periods[-1],
+            ''.join('{:>9.3f}s'.format(move_micros(flap_steps(flaps), periods) / 1000000.0) for flaps in REPORT_FLAPS),
+        )
+        if not args.no_simulate:
+            missed_home, failed = check_profile(periods, skip_probability, args.modules, args.messages, args.seed)
+            line += '  {:>22.3f}  {:>14}'.format(missed_home, failed)
+        print(line)
+
+
+def _read_torque_curve(path):
+    # One "steps per second,torque" pair per line, in mN*m
+    torque_curve = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                speed, torque = line.split(',')
+                torque_curve.append((float(speed), float(torque)))
+    return sorted(torque_curve)
+
+
+def run(output_file_path, periods, python_output_file_path=None):
     git_root = subprocess.check_output(
         ['git', 'rev-parse', '--show-toplevel'],
         cwd=os.path.dirname(os.path.abspath(__file__)),
-    ).strip()
+    ).strip().decode('utf-8')
     script_path = os.path.relpath(os.path.abspath(__file__), os.path.abspath(git_root))
-    with open(output_file_path, 'wb') as f:
+    with open(output_file_path, 'w') as f:
         f.write(_TEMPLATE.format(
-            periods_array=', '.join([str(x) for x in ramp_periods]),
-            max_accel_step=len(ramp_periods) - 1,
+            periods_array=', '.join([str(x) for x in periods]),
+            max_accel_step=len(periods) - 1,
             script_path=script_path,
         ))
+    if python_output_file_path is not None:
+        with open(python_output_file_path, 'w') as f:
+            f.write(_PYTHON_TEMPLATE.format(
+                periods_lines='\n'.join(textwrap.wrap(', '.join([str(x) for x in periods]) + ',', width=120,
+                                                      initial_indent='    ', subsequent_indent='    ')),
+                script_path=script_path,
+            ))
 
 
 if __name__ == '__main__':
-    output_file_path = os.path.join(os.path.dirname(__file__), 'acceleration.h')
-    run(
-        output_file_path,
-    )
+    parser = argparse.ArgumentParser(description='Generate the acceleration table in acceleration.h, and compare '
+                                                 'acceleration profiles')
+    parser.add_argument('--profile', choices=PROFILES, default='trapezoid', help='profile to write to acceleration.h')
+    parser.add_argument('--accel-time', type=int, default=ACCEL_TIME_MICROS, help='microseconds to reach top speed')
+    parser.add_argument('--jerk-time', type=int, default=JERK_TIME_MICROS,
+                        help='microseconds for the acceleration of an S-curve to ramp up or down')
+    parser.add_argument('--torque-curve', type=_read_torque_curve, default=TORQUE_CURVE,
+                        help='CSV of measured "steps per second,torque in mN*m"')
+    parser.add_argument('--load-torque', type=float, default=LOAD_TORQUE)
+    parser.add_argument('--accel-per-torque', type=float, default=ACCEL_PER_TORQUE)
+    parser.add_argument('--torque-margin', type=float, default=TORQUE_MARGIN)
+    parser.add_argument('--report', action='store_true', help='compare the profiles instead of writing the table')
+    parser.add_argument('--no-simulate', action='store_true', help="don't check the profiles in the simulator")
+    parser.add_argument('--modules', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.report:
+        report(args)
+    else:
+        run(os.path.join(os.path.dirname(__file__), 'acceleration.h'), build_profile(args.profile, args),
+            os.path.join(SOFTWARE_PATH, 'splitflap', 'acceleration.py'))
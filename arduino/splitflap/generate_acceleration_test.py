@@ -0,0 +1,131 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from generate_acceleration import (
+    ACCEL_PER_TORQUE,
+    ACCEL_TIME_MICROS,
+    IDLE_PERIOD_MICROS,
+    JERK_TIME_MICROS,
+    LOAD_TORQUE,
+    MAX_PERIOD_MICROS,
+    MAX_PERIOD_VALUE,
+    MAX_PERIODS,
+    MIN_PERIOD_MICROS,
+    PROFILES,
+    SOFTWARE_PATH,
+    TORQUE_CURVE,
+    TORQUE_MARGIN,
+    build_profile,
+    check_profile,
+    fit_periods,
+    run,
+    skip_model,
+    trapezoid_profile,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# The defaults the command line would give build_profile()
+DEFAULT_ARGS = argparse.Namespace(
+    accel_time=ACCEL_TIME_MICROS,
+    jerk_time=JERK_TIME_MICROS,
+    torque_curve=TORQUE_CURVE,
+    load_torque=LOAD_TORQUE,
+    accel_per_torque=ACCEL_PER_TORQUE,
+    torque_margin=TORQUE_MARGIN,
+)
+
+
+class GenerateAccelerationTestCase(unittest.TestCase):
+    def test_trapezoid_reproduces_acceleration_h(self):
+        directory = tempfile.mkdtemp()
+        try:
+            output_file_path = os.path.join(directory, 'acceleration.h')
+            python_output_file_path = os.path.join(directory, 'acceleration.py')
+            run(output_file_path, fit_periods(trapezoid_profile()), python_output_file_path)
+            with open(output_file_path) as f:
+                generated = f.read()
+            with open(python_output_file_path) as f:
+                python_generated = f.read()
+        finally:
+            shutil.rmtree(directory)
+
+        with open(os.path.join(os.path.dirname(__file__), 'acceleration.h')) as f:
+            self.assertEqual(f.read(), generated)
+        # and the driver's copy, which it predicts travel times from
+        with open(os.path.join(SOFTWARE_PATH, 'splitflap', 'acceleration.py')) as f:
+            self.assertEqual(f.read(), python_generated)
+
+    def test_fit_periods_limits(self):
+        # too long, too slow to fit a uint16_t, and speeding back up
+        ramp_periods = [100000, 70000.4, 30000, 40000] + [4000] * 300
+        periods = fit_periods(ramp_periods)
+
+        self.assertEqual(MAX_PERIODS, len(periods))
+        self.assertEqual(IDLE_PERIOD_MICROS, periods[0])
+        self.assertEqual([MAX_PERIOD_VALUE, MAX_PERIOD_VALUE, 30000, 30000, 4000], periods[1:6])
+        self.assertTrue(all(a >= b for a, b in zip(periods[1:], periods[2:])))
+        self.assertTrue(all(isinstance(period, int) for period in periods))
+
+    def test_fit_periods_rejects_periods_too_short_to_step(self):
+        for ramp_periods in ([20000, 5000, MIN_PERIOD_MICROS - 1], [20000, 0.2], [4000] * MAX_PERIODS + [1000]):
+            with self.assertRaises(ValueError):
+                fit_periods(ramp_periods)
+        self.assertEqual([IDLE_PERIOD_MICROS, MIN_PERIOD_MICROS], fit_periods([MIN_PERIOD_MICROS - 0.4]))
+
+    def test_fit_periods_rounds(self):
+        self.assertEqual([IDLE_PERIOD_MICROS, 2000, 1999, 1999], fit_periods([2000.4, 1998.6, 2001]))
+        self.assertEqual([IDLE_PERIOD_MICROS], fit_periods([]))
+
+    def test_profiles_fit_table(self):
+        for name in PROFILES:
+            periods = build_profile(name, DEFAULT_ARGS)
+            # from the slowest speed to the fastest, only ever speeding up
+            self.assertLessEqual(len(periods), MAX_PERIODS, name)
+            self.assertEqual(IDLE_PERIOD_MICROS, periods[0], name)
+            self.assertEqual(MAX_PERIOD_MICROS, periods[1], name)
+            self.assertTrue(all(a >= b for a, b in zip(periods[1:], periods[2:])), name)
+            self.assertGreater(periods[1], periods[-1], name)
+            self.assertTrue(all(MIN_PERIOD_MICROS <= period <= MAX_PERIOD_VALUE for period in periods[1:]), name)
+
+        with self.assertRaises(ValueError):
+            build_profile('linear', DEFAULT_ARGS)
+
+    def test_skip_model(self):
+        skip_probability = skip_model()
+        probabilities = skip_probability(build_profile('trapezoid', DEFAULT_ARGS))
+        self.assertEqual(0, probabilities[0])
+        self.assertTrue(all(probability < 1e-3 for probability in probabilities))
+
+        # past the speed where the motor has any torque to spare, steps all but always skip
+        self.assertGreater(skip_probability([IDLE_PERIOD_MICROS, MAX_PERIOD_MICROS, 1250])[2], 0.999)
+        # and the harder a step speeds up, the more likely it is to skip
+        probabilities = [skip_probability([IDLE_PERIOD_MICROS, MAX_PERIOD_MICROS, previous, 2300])[3]
+                         for previous in (2350, 2400, 2450)]
+        self.assertTrue(all(a < b for a, b in zip(probabilities, probabilities[1:])))
+        self.assertTrue(all(0 <= probability <= 1 for probability in probabilities))
+
+    @unittest.skipUnless(numpy, 'the simulator needs numpy')
+    def test_check_profile(self):
+        skip_probability = skip_model()
+        missed_home, failed = check_profile(build_profile('trapezoid', DEFAULT_ARGS), skip_probability, num_modules=10,
+                                            messages=5)
+        self.assertEqual((0, 0), (missed_home, failed))
+
+        # reaching top speed in a quarter of the time asks more of the motor than it has
+        missed_home, failed = check_profile(fit_periods(trapezoid_profile(ACCEL_TIME_MICROS / 4)), skip_probability,
+                                            num_modules=10, messages=5)
+        self.assertGreater(missed_home + failed, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
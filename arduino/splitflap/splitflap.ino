@@ -52,9 +52,13 @@ const uint8_t flaps[] = {
 #include "bell.h"
 
 
-#define RECV_BUFFER_SIZE (NUM_MODULES + 1)
+// Large enough for a sparse update ('%' followed by a 3 byte index/flap triple per module)
+#define RECV_BUFFER_SIZE (3 * NUM_MODULES + 1)
+// Modules are looped over with uint8_t indexes and addressed by 2 hex digits in sparse updates
+static_assert(NUM_MODULES <= 255, "NUM_MODULES must fit in a uint8_t");
 int recv_buffer[RECV_BUFFER_SIZE];
-uint8_t recv_count = 0;
+// The buffer holds more than 255 bytes once NUM_MODULES is above 84
+uint16_t recv_count = 0;
 
 #if NEOPIXEL_DEBUGGING_ENABLED
 auto pixelType = NEO_GRB + NEO_KHZ800; // NOLINT(hicpp-signed-bitwise)
@@ -99,7 +103,7 @@ void setup() {
 
   Serial.print(FAVR("{\"type\":\"init\", \"num_modules\":"));
   Serial.print(NUM_MODULES);
-  Serial.print(FAVR("}\n"));
+  Serial.print(FAVR(", \"sparse_update\":true}\n"));
 
 #if NEOPIXEL_DEBUGGING_ENABLED
   strip.setBrightness(64);
@@ -157,6 +161,72 @@ inline int8_t FindFlapIndex(uint8_t character) {
     return -1;
 }
 
+inline int8_t HexValue(int character) {
+    if (character >= '0' && character <= '9') {
+      return character - '0';
+    } else if (character >= 'a' && character <= 'f') {
+      return character - 'a' + 10;
+    }
+    return -1;
+}
+
+// Binary framing for controller output, enabled by the 'B' command. Each frame is a sync byte, the body length
+// (uint16, little endian), the frame type, the body and a CRC-8 (polynomial 0x07) of everything after the sync byte.
+// See software/splitflap/binary_protocol.py for the frame bodies.
+#define FRAME_SYNC (0xA5)
+#define FRAME_MOVE_ECHO (0x02)
+#define FRAME_STATUS (0x03)
+#define FRAME_NO_OP (0x04)
+
+bool binary_protocol = false;
+uint8_t frame_crc = 0;
+
+inline void FrameWrite(uint8_t b) {
+    Serial.write(b);
+    frame_crc ^= b;
+    for (uint8_t i = 0; i < 8; i++) {
+      frame_crc = (frame_crc & 0x80) ? (frame_crc << 1) ^ 0x07 : frame_crc << 1;
+    }
+}
+
+inline void FrameStart(uint8_t type, uint16_t length) {
+    Serial.write(FRAME_SYNC);
+    frame_crc = 0;
+    FrameWrite(length & 0xFF);
+    FrameWrite(length >> 8);
+    FrameWrite(type);
+}
+
+inline void FrameEnd() {
+    Serial.write(frame_crc);
+    Serial.flush();
+}
+
+inline void StartMoveEcho(uint16_t length) {
+    if (binary_protocol) {
+      FrameStart(FRAME_MOVE_ECHO, length);
+    } else {
+      Serial.print(FAVR("{\"type\":\"move_echo\", \"dest\":\""));
+    }
+}
+
+inline void WriteMoveEcho(uint8_t c) {
+    if (binary_protocol) {
+      FrameWrite(c);
+    } else {
+      Serial.write(c);
+    }
+}
+
+inline void EndMoveEcho() {
+    if (binary_protocol) {
+      FrameEnd();
+    } else {
+      Serial.print(FAVR("\"}\n"));
+      Serial.flush();
+    }
+}
+
 bool was_stopped = false;
 bool pending_no_op = false;
 bool bell_on_stop = false;
@@ -226,6 +296,31 @@ inline void run_iteration() {
               case 'A':
                 dump_status();
                 break;
+              case 'B':
+                // Acknowledged in json, since the host can't know whether to expect frames until it sees this
+                Serial.print(FAVR("{\"type\":\"protocol\", \"protocol\":\"binary\"}\n"));
+                Serial.flush();
+                binary_protocol = true;
+                break;
+              case '%':
+                // Sparse update: a 2 hex digit module index followed by a flap character, for each module to move
+                StartMoveEcho(recv_count - 1);
+                for (uint16_t i = 1; i + 2 < recv_count; i += 3) {
+                  int8_t high = HexValue(recv_buffer[i]);
+                  int8_t low = HexValue(recv_buffer[i + 1]);
+                  int8_t index = FindFlapIndex(recv_buffer[i + 2]);
+                  if (high != -1 && low != -1 && index != -1) {
+                    uint8_t module_index = (high << 4) | low;
+                    if (module_index < NUM_MODULES) {
+                      modules[module_index].GoToFlapIndex(index, SplitflapModule::FLAP_REFRESH_NONE);
+                    }
+                  }
+                }
+                for (uint16_t i = 1; i < recv_count; i++) {
+                  WriteMoveEcho(recv_buffer[i]);
+                }
+                EndMoveEcho();
+                break;
               default:
                 if ((op_code & OP_CODE_UPDATE_MASK) == OP_CODE_UPDATE_MASK) {
                     SplitflapModule::FlapRefresh refresh = op_code & OP_CODE_FORCE_REFRESH_MASK 
@@ -234,30 +329,33 @@ inline void run_iteration() {
 
                     bell_on_stop = op_code & OP_CODE_BELL_MASK;
 
-                    Serial.print(FAVR("{\"type\":\"move_echo\", \"refresh\":"));
-                    if (refresh == SplitflapModule::FLAP_REFRESH_FORCE) {
-                    Serial.print(FAVR("\"force\""));
+                    if (binary_protocol) {
+                      FrameStart(FRAME_MOVE_ECHO, recv_count - 1);
                     } else {
-                      Serial.print(FAVR("\"none\""));
-                    }
+                      Serial.print(FAVR("{\"type\":\"move_echo\", \"refresh\":"));
+                      if (refresh == SplitflapModule::FLAP_REFRESH_FORCE) {
+                      Serial.print(FAVR("\"force\""));
+                      } else {
+                        Serial.print(FAVR("\"none\""));
+                      }
 
-                    Serial.print(FAVR(", \"bell\":"));
-                    if (bell_on_stop) {
-                      Serial.print(FAVR("\"true\""));
-                    } else {
-                      Serial.print(FAVR("\"false\""));
-                    }
+                      Serial.print(FAVR(", \"bell\":"));
+                      if (bell_on_stop) {
+                        Serial.print(FAVR("\"true\""));
+                      } else {
+                        Serial.print(FAVR("\"false\""));
+                      }
 
-                    Serial.print(FAVR(", \"dest\":\""));
-                    for (uint8_t i = 1; i < recv_count; i++) {
+                      Serial.print(FAVR(", \"dest\":\""));
+                    }
+                    for (uint16_t i = 1; i < recv_count; i++) {
                       int8_t index = FindFlapIndex(recv_buffer[i]);
-                      if (index != -1) {
+                      if (index != -1 && i - 1 < NUM_MODULES) {
                         modules[i - 1].GoToFlapIndex(index, refresh);
                       }
-                      Serial.write(recv_buffer[i]);
+                      WriteMoveEcho(recv_buffer[i]);
                     }
-                    Serial.print(FAVR("\"}\n"));
-                    Serial.flush();
+                    EndMoveEcho();
                 } else {
                   pending_no_op = true;
                 }
@@ -289,16 +387,15 @@ inline void run_iteration() {
             recv_count = 0;
             break;
           case '\n':
-              Serial.print(FAVR("{\"type\":\"move_echo\", \"dest\":\""));
-              for (uint8_t i = 0; i < recv_count; i++) {
+              StartMoveEcho(recv_count);
+              for (uint16_t i = 0; i < recv_count; i++) {
                 int8_t index = FindFlapIndex(recv_buffer[i]);
                 if (index != -1) {
                   modules[i].GoToFlapIndex(index);
                 }
-                Serial.write(recv_buffer[i]);
+                WriteMoveEcho(recv_buffer[i]);
               }
-              Serial.print(FAVR("\"}\n"));
-              Serial.flush();
+              EndMoveEcho();
               break;
           default:
             if (recv_count > NUM_MODULES - 1) {
@@ -312,8 +409,13 @@ inline void run_iteration() {
 #endif
 
       if (pending_no_op && all_stopped) {
-        Serial.print(FAVR("{\"type\":\"no_op\"}\n"));
-        Serial.flush();
+        if (binary_protocol) {
+          FrameStart(FRAME_NO_OP, 0);
+          FrameEnd();
+        } else {
+          Serial.print(FAVR("{\"type\":\"no_op\"}\n"));
+          Serial.flush();
+        }
         pending_no_op = false;
       }
   
@@ -375,7 +477,51 @@ void loop() {
 
 #pragma clang diagnostic pop
 
+void dump_status_binary() {
+  uint8_t error_count = 0;
+  for (uint8_t i = 0; i < NUM_MODULES; i++) {
+    if (modules[i].count_missed_home || modules[i].count_unexpected_home) {
+      error_count++;
+    }
+  }
+
+  FrameStart(FRAME_STATUS, NUM_MODULES + 1 + 3 * error_count);
+  for (uint8_t i = 0; i < NUM_MODULES; i++) {
+    uint8_t state = 3;
+    switch (modules[i].state) {
+      case NORMAL:
+        state = 0;
+        break;
+#if HOME_CALIBRATION_ENABLED
+      case LOOK_FOR_HOME:
+        state = 1;
+        break;
+      case SENSOR_ERROR:
+        state = 2;
+        break;
+#endif
+      case PANIC:
+        state = 3;
+        break;
+    }
+    FrameWrite((state << 6) | modules[i].GetCurrentFlapIndex());
+  }
+  FrameWrite(error_count);
+  for (uint8_t i = 0; i < NUM_MODULES; i++) {
+    if (modules[i].count_missed_home || modules[i].count_unexpected_home) {
+      FrameWrite(i);
+      FrameWrite(modules[i].count_missed_home);
+      FrameWrite(modules[i].count_unexpected_home);
+    }
+  }
+  FrameEnd();
+}
+
 void dump_status() {
+  if (binary_protocol) {
+    dump_status_binary();
+    return;
+  }
   Serial.print(FAVR("{\"type\":\"status\", \"modules\":["));
   for (uint8_t i = 0; i < NUM_MODULES; i++) {
     Serial.print(FAVR("{\"state\":\""));
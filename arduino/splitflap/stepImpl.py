@@ -1,8 +1,9 @@
+import heapq
 import logging
 import random
 import time
 import traceback
-from threading import Thread
+from threading import Thread, Condition
 
 NUM_FLAPS = 40
 FLAPS = [
@@ -41,10 +42,10 @@ MAX_SPEED = len(PERIOD_FROM_SPEED) - 1
 
 # This is "rough" because it's integer division; it shouldn't be used for movement calculations or the error would
 # accumulate.
-_ROUGH_STEPS_PER_FLAP = GEAR_RATIO_INPUT_STEPS / GEAR_RATIO_OUTPUT_FLAPS
+_ROUGH_STEPS_PER_FLAP = GEAR_RATIO_INPUT_STEPS // GEAR_RATIO_OUTPUT_FLAPS
 
 # The number of steps in either direction that's acceptable error for the home sensor
-HOME_ERROR_MARGIN_STEPS = _ROUGH_STEPS_PER_FLAP / 4
+HOME_ERROR_MARGIN_STEPS = _ROUGH_STEPS_PER_FLAP // 4
 
 # After finding the home position, how long to wait before considering another home blip to be an unexpected error
 UNEXPECTED_HOME_START_BUFFER_STEPS = _ROUGH_STEPS_PER_FLAP * 5
@@ -69,7 +70,12 @@ def micros():
 
 class Splitflap(object):
 
-    def __init__(self):
+    # `rng` provides the random home sensor readings (the `random` module by default); pass a seeded random.Random for
+    # reproducible runs. `clock` gives the time in microseconds for update().
+    def __init__(self, rng=random, clock=micros):
+        self._rng = rng
+        self._clock = clock
+
         # Enable for auto-calibration via home sensor feedback. Disable for basic open-loop control.
         self.home_calibration_enabled = True
 
@@ -102,7 +108,7 @@ class Splitflap(object):
         self.state = STATE_LOOK_FOR_HOME if self.home_calibration_enabled else STATE_NORMAL
 
     def _get_flap_floor(self, step):
-        return step * GEAR_RATIO_OUTPUT_FLAPS / GEAR_RATIO_INPUT_STEPS
+        return step * GEAR_RATIO_OUTPUT_FLAPS // GEAR_RATIO_INPUT_STEPS
 
     def go_to_flap(self, flap_char):
         if self.state != STATE_NORMAL or self.current_speed != 0:
@@ -133,7 +139,7 @@ class Splitflap(object):
 
         # Round UP when dividing so that the inverse calculation on the result (_get_flap_floor) returns the expected
         # result.
-        result = gear_ratio_input_steps_flaps_destination / GEAR_RATIO_OUTPUT_FLAPS
+        result = gear_ratio_input_steps_flaps_destination // GEAR_RATIO_OUTPUT_FLAPS
         if gear_ratio_input_steps_flaps_destination % GEAR_RATIO_OUTPUT_FLAPS != 0:
             result += 1
         return result
@@ -200,96 +206,113 @@ class Splitflap(object):
         self.missed_home_step = new_missed_home_step
         self.home_state = HOME_STATE_IGNORE
 
+    def is_idle(self):
+        # Nothing changes until the next command: stopped with nowhere to go, or stopped in an error state
+        if self.current_speed != 0:
+            return False
+        if self.state == STATE_NORMAL:
+            return self.delta_steps == 0
+        return self.state != STATE_LOOK_FOR_HOME
+
+    def next_update_micros(self):
+        return self.last_update_micros + self.current_period
+
     def update(self):
-        now = micros()
+        now = self._clock()
         delta_time = now - self.last_update_micros
         if delta_time >= self.current_period:
-            self.last_update_micros = now
-
-            if self.state == STATE_NORMAL:
-                reset_to_home = False
-                if self.home_calibration_enabled:
-                    found_home = self.check_home()
-                    if self.home_state == HOME_STATE_IGNORE:
-                        if found_home:
-                            logger.debug('Ignoring HOME')
-                        if self.current_step == self.unexpected_home_start_step:
-                            self.home_state = HOME_STATE_UNEXPECTED
-                    elif self.home_state == HOME_STATE_UNEXPECTED:
-                        if found_home:
-                            logger.warn('Unexpected home! At {}. Unexpected range {}-{}; missed at {}.'.format(
-                                self.current_step,
-                                self.unexpected_home_start_step,
-                                self.unexpected_home_end_step,
-                                self.missed_home_step,
-                            ))
-                            reset_to_home = True
-                        elif self.current_step == self.unexpected_home_end_step:
-                            self.home_state = HOME_STATE_EXPECTED
-                    elif self.home_state == HOME_STATE_EXPECTED:
-                        if found_home:
-                            logger.debug('Found expected home.')
-                            self._update_expected_home()
-                        elif self.current_step == self.missed_home_step:
-                            logger.warn('Missed expected home! At {}. Expected between {} and {}.'.format(
-                                self.current_step,
-                                self.unexpected_home_end_step,
-                                self.missed_home_step,
-                            ))
-                            reset_to_home = True
-
-                if reset_to_home:
-                    self.go_home()
-                    target_speed = 0
-                else:
-                    # Update speed based on distance to target
-                    if self.delta_steps > MAX_SPEED:
-                        target_speed = MAX_SPEED
-                    else:
-                        target_speed = self.delta_steps
-            elif self.state == STATE_LOOK_FOR_HOME:
-                assert self.home_calibration_enabled
-                self.steps_looking_for_home += 1
-                found_home = self.check_home()
-                if found_home:
-                    logger.info('Found home!')
-                    self.state = STATE_NORMAL
-                    target_speed = 0
+            self.step(now)
 
-                    # Reset frame of reference
-                    self.current_step = 0
-                    self.unexpected_home_start_step = 0
-                    self.unexpected_home_end_step = 0
-                    self.missed_home_step = 0
-                    self._update_expected_home()
+    def step(self, now):
+        # One update of the motor and homing state machine, due at `now`
+        self.last_update_micros = now
 
-                    self._go_to_target_flap_index()
-                else:
-                    if self.steps_looking_for_home >= MAX_STEPS_LOOKING_FOR_HOME:
-                        logger.info('Gave up looking for home!')
-                        self.state = STATE_SENSOR_ERROR
-                        target_speed = 0
-                    else:
-                        target_speed = 5
+        if self.state == STATE_NORMAL:
+            reset_to_home = False
+            if self.home_calibration_enabled:
+                found_home = self.check_home()
+                if self.home_state == HOME_STATE_IGNORE:
+                    if found_home:
+                        logger.debug('Ignoring HOME')
+                    if self.current_step == self.unexpected_home_start_step:
+                        self.home_state = HOME_STATE_UNEXPECTED
+                elif self.home_state == HOME_STATE_UNEXPECTED:
+                    if found_home:
+                        logger.warning('Unexpected home! At {}. Unexpected range {}-{}; missed at {}.'.format(
+                            self.current_step,
+                            self.unexpected_home_start_step,
+                            self.unexpected_home_end_step,
+                            self.missed_home_step,
+                        ))
+                        reset_to_home = True
+                    elif self.current_step == self.unexpected_home_end_step:
+                        self.home_state = HOME_STATE_EXPECTED
+                elif self.home_state == HOME_STATE_EXPECTED:
+                    if found_home:
+                        logger.debug('Found expected home.')
+                        self._update_expected_home()
+                    elif self.current_step == self.missed_home_step:
+                        logger.warning('Missed expected home! At {}. Expected between {} and {}.'.format(
+                            self.current_step,
+                            self.unexpected_home_end_step,
+                            self.missed_home_step,
+                        ))
+                        reset_to_home = True
+
+            if reset_to_home:
+                self.go_home()
+                target_speed = 0
             else:
+                # Update speed based on distance to target
+                if self.delta_steps > MAX_SPEED:
+                    target_speed = MAX_SPEED
+                else:
+                    target_speed = self.delta_steps
+        elif self.state == STATE_LOOK_FOR_HOME:
+            assert self.home_calibration_enabled
+            self.steps_looking_for_home += 1
+            found_home = self.check_home()
+            if found_home:
+                logger.info('Found home!')
+                self.state = STATE_NORMAL
                 target_speed = 0
 
-            # Update motor
-            if self.current_speed < target_speed:
-                self.current_speed += 1
-            elif self.current_speed > target_speed:
-                self.current_speed -= 1
-
-            self.current_period = PERIOD_FROM_SPEED[self.current_speed]
+                # Reset frame of reference
+                self.current_step = 0
+                self.unexpected_home_start_step = 0
+                self.unexpected_home_end_step = 0
+                self.missed_home_step = 0
+                self._update_expected_home()
 
-            if self.current_speed > 0:
-                self.current_step = (self.current_step + 1) % GEAR_RATIO_INPUT_STEPS
-                self.current_phase = (self.current_phase + 1) % 4
-                if self.delta_steps > 0:
-                    self.delta_steps -= 1
-            # self.set_motor()
-
-            logger.info('update: cs={}, delta={}, cp={}, us={}, ue={}, mh={}, speed={}, period={}, [flap {!r}]'.format(
+                self._go_to_target_flap_index()
+            else:
+                if self.steps_looking_for_home >= MAX_STEPS_LOOKING_FOR_HOME:
+                    logger.info('Gave up looking for home!')
+                    self.state = STATE_SENSOR_ERROR
+                    target_speed = 0
+                else:
+                    target_speed = 5
+        else:
+            target_speed = 0
+
+        # Update motor
+        if self.current_speed < target_speed:
+            self.current_speed += 1
+        elif self.current_speed > target_speed:
+            self.current_speed -= 1
+
+        self.current_period = PERIOD_FROM_SPEED[self.current_speed]
+
+        if self.current_speed > 0:
+            self.current_step = (self.current_step + 1) % GEAR_RATIO_INPUT_STEPS
+            self.current_phase = (self.current_phase + 1) % 4
+            if self.delta_steps > 0:
+                self.delta_steps -= 1
+        # self.set_motor()
+
+        # this runs for every step, so skip formatting the message unless it's going to be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('update: cs={}, delta={}, cp={}, us={}, ue={}, mh={}, speed={}, period={}, [flap {!r}]'.format(
                 self.current_step,
                 self.delta_steps,
                 self.current_phase,
@@ -301,56 +324,135 @@ class Splitflap(object):
                 FLAPS[self._get_flap_floor(self.current_step) % NUM_FLAPS],
             ))
 
-            # Check modular arithmetic invariant
-            assert self.current_step < GEAR_RATIO_INPUT_STEPS
-            assert self.current_step >= 0
+        # Check modular arithmetic invariant
+        assert self.current_step < GEAR_RATIO_INPUT_STEPS
+        assert self.current_step >= 0
 
     def check_home(self):
         # TODO: fake this
         result = None
         if self.state == STATE_LOOK_FOR_HOME:
-            result = random.random() < (1.5 / (NUM_FLAPS * _ROUGH_STEPS_PER_FLAP))
+            result = self._rng.random() < (1.5 / (NUM_FLAPS * _ROUGH_STEPS_PER_FLAP))
         elif self.state == STATE_NORMAL:
             if self.home_state == HOME_STATE_UNEXPECTED:
-                result = random.random() < 0.00005
+                result = self._rng.random() < 0.00005
             elif self.home_state == HOME_STATE_EXPECTED:
-                result = random.random() < 0.1
+                result = self._rng.random() < 0.1
 
         if result is None:
-            result = random.random() < 0.001
+            result = self._rng.random() < 0.001
 
         if result:
             logger.debug('HOME!')
         return result
 
 
+# Runs modules in simulated time. Each module's next update is kept in a priority queue and the simulation jumps
+# straight to whichever is due first, so it runs as fast as updates can be computed rather than in real time, and with
+# a seed it does the same thing every time. Modules with nothing to do aren't scheduled again until they're given a
+# command.
+class EventSimulator(object):
+
+    def __init__(self, num_modules, seed=None):
+        seeds = random.Random(seed)
+        self.now = 0
+        self.modules = [
+            Splitflap(rng=random.Random(seeds.getrandbits(64)), clock=self._micros) for _ in range(num_modules)
+        ]
+        self._events = []
+        self._scheduled = [False] * num_modules
+        for index in range(num_modules):
+            self._schedule(index)
+
+    def _micros(self):
+        return self.now
+
+    def _schedule(self, index):
+        if not self._scheduled[index]:
+            next_update = max(self.now, self.modules[index].next_update_micros())
+            heapq.heappush(self._events, (next_update, index))
+            self._scheduled[index] = True
+
+    def next_event_micros(self):
+        return self._events[0][0] if len(self._events) > 0 else None
+
+    def go_to_flap(self, index, flap_char):
+        self.modules[index].go_to_flap(flap_char)
+        self._schedule(index)
+
+    def go_to_flaps(self, text):
+        for index, flap_char in enumerate(text[:len(self.modules)]):
+            self.go_to_flap(index, flap_char)
+
+    def go_home(self, index):
+        self.modules[index].go_home()
+        self._schedule(index)
+
+    def _run(self, until):
+        events = self._events
+        while len(events) > 0 and events[0][0] <= until:
+            now, index = heapq.heappop(events)
+            self.now = now
+            module = self.modules[index]
+            module.step(now)
+            if module.is_idle():
+                self._scheduled[index] = False
+            else:
+                heapq.heappush(events, (module.next_update_micros(), index))
+
+    def run_until(self, until):
+        # Runs every update due up to `until` microseconds
+        self._run(until)
+        self.now = max(self.now, until)
+
+    def run_until_idle(self, limit=3600 * 1000000):
+        # Runs until every module has stopped, or for at most `limit` microseconds. Returns the time of the last update.
+        until = self.now + limit
+        self._run(until)
+        if len(self._events) > 0:
+            self.now = until
+        return self.now
+
+    def get_flaps(self):
+        return ''.join(FLAPS[module._get_flap_floor(module.current_step) % NUM_FLAPS] for module in self.modules)
+
+
 def run():
     logging.basicConfig(level=logging.DEBUG)
 
-    splitflap = Splitflap()
+    # Driven by the event simulator, paced to real time: the thread sleeps until the next update is due rather than
+    # spinning on update()
+    simulator = EventSimulator(1)
+    start = micros()
+    condition = Condition()
 
     def run_thread():
         # noinspection PyBroadException
         try:
-            while True:
-                splitflap.update()
+            with condition:
+                while True:
+                    simulator.run_until(micros() - start)
+                    next_event = simulator.next_event_micros()
+                    if next_event is None:
+                        condition.wait()
+                    else:
+                        condition.wait(max(0, next_event - (micros() - start)) / 1000000.0)
         except:
             logger.fatal('Exception:\n{}'.format(traceback.format_exc()))
 
     t = Thread(target=run_thread)
-    t.setDaemon(True)
+    t.daemon = True
     t.start()
     while True:
-        i = raw_input(">")
-        if i == '@':
-            splitflap.go_home()
-        else:
-            splitflap.go_to_flap(i)
+        i = input(">")
+        with condition:
+            simulator.run_until(micros() - start)
+            if i == '@':
+                simulator.go_home(0)
+            else:
+                simulator.go_to_flap(0, i)
+            condition.notify()
 
 
 if __name__ == '__main__':
     run()
-
-
-
-
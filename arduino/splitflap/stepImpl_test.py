@@ -0,0 +1,89 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from stepImpl import (
+    MAX_SPEED,
+    PERIOD_FROM_SPEED,
+    STATE_LOOK_FOR_HOME,
+    STATE_NORMAL,
+    EventSimulator,
+)
+
+# Steps the sensor stand-in takes looking for home before it sees the magnet
+HOME_AFTER_STEPS = 100
+
+
+def _trace(simulator):
+    # Records every update the simulator runs, as (time, module index, step, speed, state)
+    trace = []
+    for index, module in enumerate(simulator.modules):
+        def step(now, index=index, module=module, step=module.step):
+            step(now)
+            trace.append((now, index, module.current_step, module.current_speed, module.state))
+        module.step = step
+    return trace
+
+
+# Stands in for a module's random home sensor readings: the magnet is only seen once the module has been looking for
+# home for a while, so a home expected while moving is always missed
+class _SensorStandIn(object):
+    def __init__(self):
+        self.module = None
+
+    def random(self):
+        if self.module.state == STATE_LOOK_FOR_HOME and self.module.steps_looking_for_home >= HOME_AFTER_STEPS:
+            return 0
+        return 1
+
+
+class EventSimulatorTestCase(unittest.TestCase):
+    def _run_messages(self, seed):
+        simulator = EventSimulator(4, seed=seed)
+        trace = _trace(simulator)
+        simulator.run_until_idle()
+        for text in ('abcd', 'zyxw', '0123', 'abcd'):
+            simulator.go_to_flaps(text)
+            simulator.run_until_idle()
+        return trace, simulator.get_flaps()
+
+    def test_seeded_runs_are_identical(self):
+        trace, flaps = self._run_messages(3)
+        self.assertGreater(len(trace), 0)
+        self.assertEqual((trace, flaps), self._run_messages(3))
+        self.assertNotEqual(trace, self._run_messages(4)[0])
+
+    def test_missed_home_is_found_again(self):
+        simulator = EventSimulator(1, seed=0)
+        module = simulator.modules[0]
+        module._rng = _SensorStandIn()
+        module._rng.module = module
+        trace = _trace(simulator)
+        simulator.run_until_idle()
+        self.assertEqual(STATE_NORMAL, module.state)
+
+        # round to the home flap and on past it, where home is expected but never seen
+        simulator.go_to_flaps('z')
+        simulator.run_until_idle()
+        del trace[:]
+        simulator.go_to_flaps(' ')
+        simulator.run_until_idle()
+        simulator.go_to_flaps('a')
+        simulator.run_until_idle()
+
+        states = [state for _, _, _, _, state in trace]
+        missed = states.index(STATE_LOOK_FOR_HOME)
+        found = missed + states[missed:].index(STATE_NORMAL)
+        # one update looking for home per step, each no longer than the slowest period while moving
+        self.assertEqual(HOME_AFTER_STEPS, found - missed)
+        self.assertLessEqual(trace[found][0] - trace[missed][0], HOME_AFTER_STEPS * PERIOD_FROM_SPEED[1])
+        self.assertGreaterEqual(trace[found][0] - trace[missed][0], HOME_AFTER_STEPS * PERIOD_FROM_SPEED[MAX_SPEED])
+        # back in its new frame of reference, and on to the flap it was sent to
+        self.assertEqual(STATE_NORMAL, module.state)
+        self.assertEqual('a', simulator.get_flaps())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,398 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from stepImpl import (
+    FLAPS,
+    GEAR_RATIO_INPUT_STEPS,
+    GEAR_RATIO_OUTPUT_FLAPS,
+    HOME_ERROR_MARGIN_STEPS,
+    HOME_STATE_EXPECTED,
+    HOME_STATE_IGNORE,
+    HOME_STATE_UNEXPECTED,
+    MAX_STEPS_LOOKING_FOR_HOME,
+    NUM_FLAPS,
+    PERIOD_FROM_SPEED,
+    UNEXPECTED_HOME_START_BUFFER_STEPS,
+    _ROUGH_STEPS_PER_FLAP,
+)
+
+# States, as small integers so that they can be kept in an array
+STATE_NORMAL = 0
+STATE_LOOK_FOR_HOME = 1
+STATE_SENSOR_ERROR = 2
+STATE_PANIC = 3
+
+# Speed used while looking for home, as in stepImpl.Splitflap.update()
+LOOK_FOR_HOME_SPEED = 5
+
+# How many steps of the rotor's travel the home sensor sees the home magnet for
+HOME_SENSOR_STEPS = _ROUGH_STEPS_PER_FLAP // 4
+
+
+def _target_step_for_flap_index(from_step, target_flap_index):
+    # stepImpl.Splitflap._get_target_step_for_flap_index(), for arrays of modules
+    from_flap = from_step * GEAR_RATIO_OUTPUT_FLAPS // GEAR_RATIO_INPUT_STEPS
+    from_flap_index = np.where(from_flap >= NUM_FLAPS, from_flap - NUM_FLAPS, from_flap)
+    delta_flaps = np.where(
+        target_flap_index > from_flap_index,
+        target_flap_index - from_flap_index,
+        NUM_FLAPS + target_flap_index - from_flap_index,
+    )
+    destination = (from_flap + delta_flaps) * GEAR_RATIO_INPUT_STEPS
+    return destination // GEAR_RATIO_OUTPUT_FLAPS + (destination % GEAR_RATIO_OUTPUT_FLAPS != 0)
+
+
+# Simulates `num_modules` modules at once, each running the same motion and homing state machine as
+# stepImpl.Splitflap.update(), with every per-module field held in an array. Time is simulated, in microseconds: each
+# module keeps the time of its next update, and modules are stepped together one update at a time. Between the updates
+# where the homing state machine could do something, a module's motion only depends on the acceleration table, so
+# speeding up, cruising and slowing down are each jumped over in one go.
+#
+# The rotor position is tracked separately from the module's own step count, so that the home sensor fires where the
+# magnet really is. `skip_probability` is the chance that a step doesn't move the rotor, either a number or a function
+# taking an array of step periods. `spurious_home_probability` is the chance of the sensor blipping on any update.
+class SplitflapSimulator(object):
+    def __init__(self, num_modules, periods=PERIOD_FROM_SPEED, seed=None, home_calibration_enabled=True,
+                 skip_probability=0, spurious_home_probability=0):
+        self.num_modules = num_modules
+        self.periods = np.asarray(periods, dtype=np.int64)
+        self.max_speed = len(periods) - 1
+        # a table too short to reach the usual speed looks for home at its top speed
+        self._look_for_home_speed = min(LOOK_FOR_HOME_SPEED, self.max_speed)
+        self.home_calibration_enabled = home_calibration_enabled
+        self._rng = np.random.default_rng(seed)
+        self._spurious_home_probability = spurious_home_probability
+
+        # Running totals of the step periods and skip probabilities over the speeds, so that the time taken and steps
+        # skipped over a change in speed can be found without stepping through it
+        if callable(skip_probability):
+            skip_probability = skip_probability(self.periods)
+        self._skip_table = np.broadcast_to(np.asarray(skip_probability, dtype=np.float64), self.periods.shape)
+        self._period_sums = np.concatenate([[0], np.cumsum(self.periods)])
+        self._skip_sums = np.concatenate([[0], np.cumsum(self._skip_table)])
+
+        self.now = 0
+
+        def zeros():
+            return np.zeros(num_modules, dtype=np.int64)
+
+        self.target_flap_index = zeros()
+        self.current_step = zeros()
+        self.delta_steps = zeros()
+        self.home_state = zeros()
+        self.unexpected_home_start_step = zeros()
+        self.unexpected_home_end_step = zeros()
+        self.missed_home_step = zeros()
+        self.steps_looking_for_home = zeros()
+        self.current_speed = zeros()
+        self.current_period = np.full(num_modules, self.periods[0])
+        self.state = np.full(num_modules, STATE_LOOK_FOR_HOME if home_calibration_enabled else STATE_NORMAL)
+
+        self.last_update = zeros()
+        self.next_update = zeros()
+        # where the rotor really is, in steps from the home magnet; modules start wherever they were left
+        self.position = self._rng.integers(0, GEAR_RATIO_INPUT_STEPS, num_modules) if home_calibration_enabled \
+            else zeros()
+        # updates left before the next spurious home blip
+        self._spurious_home_countdown = self._sample_spurious_home_countdown(num_modules)
+
+        # Wear and error counters
+        self.steps_taken = zeros()
+        self.count_missed_home = zeros()
+        self.count_unexpected_home = zeros()
+
+    def _sample_spurious_home_countdown(self, size):
+        if self._spurious_home_probability <= 0:
+            return np.full(size, np.iinfo(np.int64).max // 2)
+        return self._rng.geometric(self._spurious_home_probability, size) - 1
+
+    def get_flaps(self):
+        # The flap each module shows, from where its rotor really is
+        flap_indexes = (self.position % GEAR_RATIO_INPUT_STEPS) * GEAR_RATIO_OUTPUT_FLAPS // GEAR_RATIO_INPUT_STEPS
+        return ''.join(FLAPS[index] for index in flap_indexes)
+
+    def get_states(self):
+        return self.state.copy()
+
+    def is_active(self):
+        return (self.state == STATE_LOOK_FOR_HOME) | (self.current_speed > 0) | \
+            ((self.state == STATE_NORMAL) & (self.delta_steps > 0))
+
+    def is_idle(self):
+        return not np.any(self.is_active())
+
+    def go_to_flaps(self, text, force_refresh=False):
+        # Like the firmware's GoToFlapIndex(): modules that are moving or not in a normal state ignore the command, and
+        # modules already headed for their flap are left alone unless forced
+        target = np.array([FLAPS.index(flap) for flap in text.ljust(self.num_modules)[:self.num_modules]])
+        accepted = (self.state == STATE_NORMAL) & (self.current_speed == 0)
+        if not force_refresh:
+            accepted &= target != self.target_flap_index
+        self.target_flap_index[accepted] = target[accepted]
+        self._go_to_target_flap_index(accepted)
+        self.next_update[accepted] = np.maximum(self.next_update[accepted], self.now)
+        return accepted
+
+    def go_home(self, modules=None):
+        if modules is None:
+            modules = np.ones(self.num_modules, dtype=bool)
+        modules = self._go_home(modules)
+        self.next_update[modules] = np.maximum(self.next_update[modules], self.now)
+
+    def _go_home(self, modules):
+        modules = modules & (self.state != STATE_PANIC)
+        self.state[modules] = STATE_LOOK_FOR_HOME
+        self.steps_looking_for_home[modules] = 0
+        return modules
+
+    def _go_to_target_flap_index(self, modules):
+        self.delta_steps[modules] = _target_step_for_flap_index(
+            self.current_step[modules], self.target_flap_index[modules]) - self.current_step[modules]
+
+    def _update_expected_home(self, modules):
+        # See stepImpl.Splitflap._update_expected_home()
+        expected_home = _target_step_for_flap_index(self.missed_home_step[modules], 0)
+        self.unexpected_home_start_step[modules] = \
+            (self.current_step[modules] + UNEXPECTED_HOME_START_BUFFER_STEPS) % GEAR_RATIO_INPUT_STEPS
+        self.unexpected_home_end_step[modules] = (expected_home - HOME_ERROR_MARGIN_STEPS) % GEAR_RATIO_INPUT_STEPS
+        self.missed_home_step[modules] = (expected_home + HOME_ERROR_MARGIN_STEPS) % GEAR_RATIO_INPUT_STEPS
+        self.home_state[modules] = HOME_STATE_IGNORE
+
+    def _jump_steps(self, modules, until):
+        # How many updates each module can take, and which way its speed changes on each, before the next update where
+        # anything other than its position and speed could change. Speeding up, holding top speed and slowing down are
+        # all predictable between the updates where it could see the home sensor, reaches a home window boundary or
+        # runs out of time.
+        speed = self.current_speed
+        normal = self.state == STATE_NORMAL
+        looking = self.state == STATE_LOOK_FOR_HOME
+        target_speed = np.select(
+            [normal, looking],
+            [np.minimum(self.delta_steps, self.max_speed), self._look_for_home_speed],
+            0,
+        )
+        direction = np.sign(target_speed - speed)
+
+        steps = np.select(
+            [direction < 0, looking, normal & (direction > 0), normal & (speed == self.max_speed)],
+            [
+                # every update but the last, where it comes to a stop without stepping
+                speed - 1,
+                np.where(direction > 0, self._look_for_home_speed - speed,
+                         MAX_STEPS_LOOKING_FOR_HOME - self.steps_looking_for_home - 1),
+                np.minimum(self.max_speed - speed, (self.delta_steps - speed + 1) // 2),
+                self.delta_steps - self.max_speed,
+            ],
+            0,
+        )
+
+        rotor = self.position % GEAR_RATIO_INPUT_STEPS
+        to_sensor = np.where(rotor < HOME_SENSOR_STEPS, 0, GEAR_RATIO_INPUT_STEPS - rotor)
+        steps = np.minimum(steps, self._spurious_home_countdown)
+        if self.home_calibration_enabled:
+            boundary = np.select(
+                [self.home_state == HOME_STATE_IGNORE, self.home_state == HOME_STATE_UNEXPECTED],
+                [self.unexpected_home_start_step, self.unexpected_home_end_step],
+                self.missed_home_step,
+            )
+            to_boundary = (boundary - self.current_step) % GEAR_RATIO_INPUT_STEPS
+            steps = np.where(normal, np.minimum(steps, to_boundary), steps)
+            # blips are ignored until the first boundary
+            steps = np.where(looking | (normal & (self.home_state != HOME_STATE_IGNORE)),
+                             np.minimum(steps, to_sensor), steps)
+
+        # the last update has to be due by `until`
+        remaining = until - self.next_update
+        period_sums = self._period_sums
+        in_time = np.select(
+            [direction > 0, direction < 0],
+            [
+                np.searchsorted(period_sums, period_sums[speed + 1] + remaining, side='right') - speed - 1,
+                speed - np.searchsorted(period_sums, period_sums[speed] - remaining, side='left') + 1,
+            ],
+            remaining // self.current_period + 1,
+        )
+        steps = np.minimum(steps, in_time)
+        return np.where(modules, np.maximum(steps, 0), 0), direction
+
+    def _jump(self, modules, until):
+        steps, direction = self._jump_steps(modules, until)
+        jumping = steps > 0
+        if not np.any(jumping):
+            return
+        steps = steps[jumping]
+        direction = direction[jumping]
+        speed = self.current_speed[jumping]
+
+        # the speed after each update sets the period to the next, so the time taken is a sum over the speeds passed
+        # through
+        period_sums = self._period_sums
+        last_speed = speed + direction * steps
+        elapsed = np.select(
+            [direction > 0, direction < 0],
+            [period_sums[last_speed + 1] - period_sums[speed + 1], period_sums[speed] - period_sums[last_speed]],
+            steps * self.current_period[jumping],
+        )
+        skip_sums = self._skip_sums
+        # clipped, as the running totals can be a rounding error outside 0 and 1
+        skip_probability = np.clip(np.select(
+            [direction > 0, direction < 0],
+            [skip_sums[last_speed + 1] - skip_sums[speed + 1], skip_sums[speed] - skip_sums[last_speed]],
+            steps * self._skip_table[speed],
+        ) / steps, 0, 1)
+        last_period = self.periods[last_speed]
+
+        self.current_speed[jumping] = last_speed
+        self.current_period[jumping] = last_period
+        self.current_step[jumping] = (self.current_step[jumping] + steps) % GEAR_RATIO_INPUT_STEPS
+        self.position[jumping] += steps - self._rng.binomial(steps, skip_probability)
+        self.steps_taken[jumping] += steps
+        self.delta_steps[jumping] = np.maximum(self.delta_steps[jumping] - steps, 0)
+        looking = self.state[jumping] == STATE_LOOK_FOR_HOME
+        self.steps_looking_for_home[jumping] += np.where(looking, steps, 0)
+        self._spurious_home_countdown[jumping] -= steps
+        self.next_update[jumping] += elapsed
+        self.last_update[jumping] = self.next_update[jumping] - last_period
+
+    def _check_home(self, modules):
+        found = (self.position % GEAR_RATIO_INPUT_STEPS) < HOME_SENSOR_STEPS
+        spurious = modules & (self._spurious_home_countdown <= 0)
+        self._spurious_home_countdown[modules] -= 1
+        self._spurious_home_countdown[spurious] = self._sample_spurious_home_countdown(np.count_nonzero(spurious))
+        return modules & (found | spurious)
+
+    def _update(self, modules):
+        # One call of stepImpl.Splitflap.update() for every module in `modules`
+        found_home = self._check_home(modules)
+        normal = modules & (self.state == STATE_NORMAL)
+        looking = modules & (self.state == STATE_LOOK_FOR_HOME)
+        target_speed = np.zeros(self.num_modules, dtype=np.int64)
+
+        reset_to_home = np.zeros(self.num_modules, dtype=bool)
+        if self.home_calibration_enabled:
+            ignoring = normal & (self.home_state == HOME_STATE_IGNORE)
+            unexpected = normal & (self.home_state == HOME_STATE_UNEXPECTED)
+            expected = normal & (self.home_state == HOME_STATE_EXPECTED)
+
+            unexpected_home = unexpected & found_home
+            missed_home = expected & ~found_home & (self.current_step == self.missed_home_step)
+            self.home_state[ignoring & (self.current_step == self.unexpected_home_start_step)] = HOME_STATE_UNEXPECTED
+            self.home_state[unexpected & ~found_home & (self.current_step == self.unexpected_home_end_step)] = \
+                HOME_STATE_EXPECTED
+            self._update_expected_home(expected & found_home)
+
+            self.count_unexpected_home += unexpected_home
+            self.count_missed_home += missed_home
+            reset_to_home = unexpected_home | missed_home
+            self._go_home(reset_to_home)
+
+        moving_on = normal & ~reset_to_home
+        target_speed[moving_on] = np.minimum(self.delta_steps[moving_on], self.max_speed)
+
+        self.steps_looking_for_home[looking] += 1
+        found = looking & found_home
+        self.state[found] = STATE_NORMAL
+        self.current_step[found] = 0
+        self.unexpected_home_start_step[found] = 0
+        self.unexpected_home_end_step[found] = 0
+        self.missed_home_step[found] = 0
+        self._update_expected_home(found)
+        self._go_to_target_flap_index(found)
+        # the rotor is wherever the sensor saw the magnet; that's step 0 from now on
+        self.position[found] -= self.position[found] % GEAR_RATIO_INPUT_STEPS
+
+        gave_up = looking & ~found_home & (self.steps_looking_for_home >= MAX_STEPS_LOOKING_FOR_HOME)
+        self.state[gave_up] = STATE_SENSOR_ERROR
+        target_speed[looking & ~found_home & ~gave_up] = self._look_for_home_speed
+
+        speed = self.current_speed
+        speed[modules] += np.sign(target_speed[modules] - speed[modules])
+        self.current_period[modules] = self.periods[speed[modules]]
+
+        stepping = modules & (speed > 0)
+        self.current_step[stepping] = (self.current_step[stepping] + 1) % GEAR_RATIO_INPUT_STEPS
+        self.position[stepping] += 1 - self._rng.binomial(1, self._skip_table[speed[stepping]])
+        self.steps_taken[stepping] += 1
+        self.delta_steps[stepping & (self.delta_steps > 0)] -= 1
+
+        self.last_update[modules] = self.next_update[modules]
+        self.next_update[modules] += self.current_period[modules]
+
+    def run_until(self, until):
+        # Runs every module up to simulated time `until`, in microseconds
+        while True:
+            due = self.is_active() & (self.next_update <= until)
+            if not np.any(due):
+                break
+            self._jump(due, until)
+            due &= self.next_update <= until
+            if np.any(due):
+                self._update(due)
+        self.now = max(self.now, until)
+
+    def run_until_idle(self, limit=None):
+        # Runs until every module has stopped, or for at most `limit` microseconds. Returns the time the last one
+        # stopped, which the simulation is left at.
+        start = self.now
+        self.run_until(start + (limit if limit is not None else 3600 * 1000000))
+        if self.is_idle():
+            self.now = max(start, int(np.max(self.last_update)))
+        return self.now
+
+
+def run(num_modules=500, hours=1.0, message_interval=10.0, seed=0, skip_probability=0, spurious_home_probability=0):
+    # Simulates a wall showing a new random message every `message_interval` seconds, or as soon as the last one has
+    # settled if that takes longer, and reports throughput and wear
+    words = ['departures', 'arrivals', 'boarding', 'delayed', 'on time', 'gate', 'cancelled', 'platform', 'now']
+    rng = random.Random(seed)
+    simulator = SplitflapSimulator(num_modules, seed=seed, skip_probability=skip_probability,
+                                   spurious_home_probability=spurious_home_probability)
+
+    start = time.perf_counter()
+    simulator.run_until_idle()
+    end_time = simulator.now + int(hours * 3600 * 1000000)
+    settle_times = []
+    while simulator.now < end_time:
+        text = ''
+        while len(text) < num_modules:
+            text += rng.choice(words) + ' ' + str(rng.randrange(100)) + ' '
+        sent_at = simulator.now
+        simulator.go_to_flaps(text[:num_modules])
+        settled_at = simulator.run_until_idle()
+        settle_times.append((settled_at - sent_at) / 1000000.0)
+        simulator.run_until(max(settled_at, sent_at + int(message_interval * 1000000)))
+    elapsed = time.perf_counter() - start
+
+    settle_times.sort()
+    print('simulated {} modules for {:.1f}h in {:.1f}s'.format(num_modules, hours, elapsed))
+    print('messages: {}, settle time p50 {:.2f}s, p99 {:.2f}s, max {:.2f}s'.format(
+        len(settle_times),
+        settle_times[len(settle_times) // 2],
+        settle_times[int(len(settle_times) * 0.99)],
+        settle_times[-1],
+    ))
+    print('steps per module: mean {:.0f}, max {} ({:.0f} revolutions)'.format(
+        np.mean(simulator.steps_taken),
+        np.max(simulator.steps_taken),
+        np.max(simulator.steps_taken) / float(GEAR_RATIO_INPUT_STEPS),
+    ))
+    print('missed home: {}, unexpected home: {}, sensor errors: {}'.format(
+        np.sum(simulator.count_missed_home),
+        np.sum(simulator.count_unexpected_home),
+        np.count_nonzero(simulator.state == STATE_SENSOR_ERROR),
+    ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate a wall of splitflap modules in simulated time')
+    parser.add_argument('--modules', type=int, default=500)
+    parser.add_argument('--hours', type=float, default=1.0)
+    parser.add_argument('--interval', type=float, default=10.0, help='seconds between messages')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-probability', type=float, default=0)
+    parser.add_argument('--spurious-home-probability', type=float, default=0)
+    args = parser.parse_args()
+    run(args.modules, args.hours, args.interval, args.seed, args.skip_probability, args.spurious_home_probability)
@@ -0,0 +1,88 @@
+import random
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from stepImpl import FLAPS, STATE_NORMAL as IMPL_STATE_NORMAL, EventSimulator
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+else:
+    from stepSim import STATE_NORMAL, SplitflapSimulator
+
+NUM_MODULES = 6
+
+# Past the first update of a module at rest, which the event simulator runs a second in
+START_MICROS = 2000000
+
+
+def _random_texts(rng, count):
+    return [''.join(rng.choice(FLAPS) for _ in range(NUM_MODULES)) for _ in range(count)]
+
+
+@unittest.skipUnless(np, 'stepSim needs numpy')
+class SplitflapSimulatorTestCase(unittest.TestCase):
+    def test_settle_times_match_event_simulator(self):
+        # without homing, so that stepImpl's random home sensor can't send a module looking for home
+        simulator = SplitflapSimulator(NUM_MODULES, seed=1, home_calibration_enabled=False)
+        event_simulator = EventSimulator(NUM_MODULES, seed=1)
+        for module in event_simulator.modules:
+            module.home_calibration_enabled = False
+            module.state = IMPL_STATE_NORMAL
+        simulator.run_until(START_MICROS)
+        event_simulator.run_until(START_MICROS)
+
+        settle_times = []
+        event_settle_times = []
+        for text in _random_texts(random.Random(1), 10):
+            sent_at = simulator.now
+            simulator.go_to_flaps(text, force_refresh=True)
+            settle_times.append(simulator.run_until_idle() - sent_at)
+
+            event_sent_at = event_simulator.now
+            event_simulator.go_to_flaps(text)
+            event_settle_times.append(event_simulator.run_until_idle() - event_sent_at)
+
+            self.assertEqual(text, simulator.get_flaps())
+            self.assertEqual(text, event_simulator.get_flaps())
+
+        self.assertEqual(event_settle_times, settle_times)
+        self.assertEqual(0, np.sum(simulator.count_missed_home))
+
+    def test_jumping_ahead_matches_stepping(self):
+        stepped = SplitflapSimulator(NUM_MODULES, seed=2)
+        # every update run on its own, rather than speeding up, cruising and slowing down each in one go
+        stepped._jump = lambda modules, until: None
+        jumped = SplitflapSimulator(NUM_MODULES, seed=2)
+
+        for simulator in (stepped, jumped):
+            simulator.run_until_idle()
+        self.assertEqual(stepped.now, jumped.now)
+
+        for text in _random_texts(random.Random(2), 4):
+            for simulator in (stepped, jumped):
+                simulator.go_to_flaps(text)
+                simulator.run_until_idle()
+            self.assertEqual(stepped.now, jumped.now)
+            self.assertEqual(text, jumped.get_flaps())
+
+        self.assertTrue(np.all(jumped.state == STATE_NORMAL))
+        for name in ('position', 'current_step', 'steps_taken', 'home_state', 'next_update'):
+            np.testing.assert_array_equal(getattr(stepped, name), getattr(jumped, name), err_msg=name)
+
+    def test_table_shorter_than_look_for_home_speed(self):
+        # a module that misses home looks for it at the table's top speed
+        simulator = SplitflapSimulator(2, periods=[1200, 20000, 10000], seed=3, skip_probability=0.5)
+        simulator.run_until_idle()
+        simulator.go_to_flaps('ab')
+        simulator.run_until_idle()
+        self.assertTrue(np.all(simulator.current_speed <= 2))
+        self.assertFalse(np.any(simulator.is_active()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,94 +1,432 @@
 import re
-from collections import deque
+import functools
+import itertools
+
+_REDUNDANT_SPACES = re.compile(r'\s\s+')
+
+_READ_SIZE = 64 * 1024
+
+# Characters of a long line normalized and split into words at a time
+_WORD_WINDOW = 4096
+
+# Input lines longer than this are broken up as they're read rather than once they've been read whole
+LONG_LINE_LENGTH = 4096
+
+
+# A str.translate table that lower-cases characters and maps anything the validator rejects to a space. Characters
+# that aren't in the table yet are worked out on first use and remembered.
+class _TranslationTable(dict):
+    def __init__(self, char_validator_func, alphabet=None):
+        super().__init__()
+        self._char_validator_func = char_validator_func
+        if alphabet is not None:
+            for char in alphabet:
+                self[ord(char)] = char
+                if char.upper().lower() == char:
+                    self[ord(char.upper())] = char
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint).lower()
+        if not self._char_validator_func(char):
+            char = ' '
+        self[codepoint] = char
+        return char
+
+
+# One screenful of a multi-row display: `rows` holds each row of text, already justified and padded to the width of the
+# display, and text() gives them all as a single string for SplitflapBase.set_text.
+class Page:
+    __slots__ = ('rows',)
+
+    def __init__(self, rows):
+        self.rows = tuple(rows)
+
+    def __eq__(self, other):
+        if isinstance(other, Page):
+            return self.rows == other.rows
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.rows)
+
+    def __repr__(self):
+        return 'Page({!r})'.format(self.rows)
+
+    def __str__(self):
+        return '\n'.join(self.rows)
+
+    def text(self):
+        return ''.join(self.rows)
+
+
+LINE_BREAKING_GREEDY = 'greedy'
+LINE_BREAKING_OPTIMAL = 'optimal'
 
 
 class MessageFormatter:
-    def __init__(self, line_length, char_validator_func):
+    # Formatted messages are kept in an LRU cache of `cache_size` entries, keyed by the message, line length and
+    # validator. Passing the display's `alphabet` builds the character table up front instead of calling the validator.
+    # `line_breaking` picks how lines longer than the display are broken: LINE_BREAKING_GREEDY fills each line in turn,
+    # while LINE_BREAKING_OPTIMAL uses no more lines than that but evens out their lengths.
+    def __init__(self, line_length, char_validator_func=None, alphabet=None, cache_size=256,
+                 line_breaking=LINE_BREAKING_GREEDY):
+        if char_validator_func is None:
+            char_validator_func = alphabet.__contains__
+        if line_breaking not in (LINE_BREAKING_GREEDY, LINE_BREAKING_OPTIMAL):
+            raise ValueError('Unknown line breaking: {!r}'.format(line_breaking))
         self._line_length = line_length
+        self._line_breaking = line_breaking
         self._char_validator_func = char_validator_func
+        self._translation_table = _TranslationTable(char_validator_func, alphabet)
+        self._format_cached = functools.lru_cache(maxsize=cache_size)(self._format)
+        self._format_pages_cached = functools.lru_cache(maxsize=cache_size)(self._format_pages)
 
-    def _break_line(self, line):
-        broken_lines = []
+    def cache_info(self):
+        # named tuple of hits, misses, maxsize and currsize
+        return self._format_cached.cache_info()
+
+    def cache_clear(self):
+        self._format_cached.cache_clear()
+        self._format_pages_cached.cache_clear()
 
+    def _break_line(self, line):
         if len(line) <= self._line_length:
-            broken_lines.append(line)
-        else:
-            words = deque(line.split(' '))
-            line = ''
-            word = words.popleft()
-            while word is not None:
-                if len(word) > self._line_length:
-                    if len(line) > 0:
-                        line += ' '
-
-                    break_index = self._line_length - len(line)
-                    first_part = word[0: break_index]
-                    second_part = word[break_index:]
-                    line += first_part
-                    broken_lines.append(line)
+            return [line]
+        return list(self._iter_break_words(line.split(' ')))
+
+    def _iter_break_words(self, words):
+        # Greedy breaking of a line longer than the display, given its words in order, yielding each row as soon as
+        # it's full
+        line = ''
+        for word in words:
+            while len(word) > self._line_length:
+                if len(line) > 0 and len(line) + 1 >= self._line_length:
+                    # no room for any of the word after a space, so it starts the next line
+                    yield line
                     line = ''
-                    word = second_part
-                else:
-                    if len(line) + len(word) < self._line_length:
-                        if len(line) > 0:
-                            line += ' '
-                        line += word
-                    else:
-                        broken_lines.append(line)
-                        line = word
-
-                    if len(words) > 0:
-                        word = words.popleft()
-                    else:
-                        word = None
+                if len(line) > 0:
+                    line += ' '
 
-            if len(line) > 0:
-                broken_lines.append(line)
+                break_index = self._line_length - len(line)
+                line += word[0: break_index]
+                yield line
+                line = ''
+                word = word[break_index:]
 
+            if len(line) == 0:
+                line = word
+            elif len(line) + 1 + len(word) <= self._line_length:
+                line += ' ' + word
+            else:
+                yield line
+                line = word
+
+        if len(line) > 0:
+            yield line
+
+    def _break_line_optimal(self, line):
+        # Minimum raggedness line breaking (in the style of Knuth and Plass, without hyphenation): the sum of the squared
+        # space left at the end of every line but the last is minimized over all breaks that use the fewest lines.
+        # Words longer than a line are split into line-length pieces first.
+        length = self._line_length
+        if len(line) <= length:
+            return [line]
+
+        words = []
+        split_words = False
+        for word in line.split(' '):
+            if len(word) == 0:
+                continue
+            while len(word) > length:
+                split_words = True
+                words.append(word[:length])
+                word = word[length:]
+            words.append(word)
+        if len(words) == 0:
+            return ['']
+
+        # best[j] is the (line count, raggedness) of the best way to set the first j words, and breaks[j] where the
+        # last of those lines starts. A line holds at most (length + 1) // 2 words, which bounds how far back each
+        # step has to look and keeps this linear in the number of words.
+        max_words = (length + 1) // 2
+        best = [(0, 0)] + [None] * len(words)
+        breaks = [0] * (len(words) + 1)
+        for j in range(1, len(words) + 1):
+            width = -1
+            for i in range(j - 1, max(-1, j - 1 - max_words), -1):
+                width += len(words[i]) + 1
+                if width > length:
+                    break
+                lines, raggedness = best[i]
+                cost = (lines + 1, raggedness + (0 if j == len(words) else (length - width) ** 2))
+                if best[j] is None or cost < best[j]:
+                    best[j] = cost
+                    breaks[j] = i
+
+        broken_lines = []
+        j = len(words)
+        while j > 0:
+            i = breaks[j]
+            broken_lines.append(' '.join(words[i:j]))
+            j = i
+        broken_lines.reverse()
+
+        if split_words:
+            # splitting long words up front can cost a line that filling out the line before them wouldn't have
+            greedy_lines = self._break_line(line)
+            if len(greedy_lines) < len(broken_lines) and \
+                    all(len(greedy_line) <= length for greedy_line in greedy_lines):
+                return greedy_lines
         return broken_lines
 
     def format(self, message):
-        # break on newlines
-        lines = message.split('\n')
+        return list(self._format_cached(message, self._line_length, self._char_validator_func))
+
+    def _format(self, message, line_length, char_validator_func):
+        return tuple(self.format_iter(message))
 
-        formatted_lines = []
+    def format_iter(self, source):
+        # Yields the same lines as format(), but lazily. `source` may be a string, a file-like object or an iterable of
+        # strings. Lines longer than LONG_LINE_LENGTH are broken greedily, whatever the line breaking, as their words
+        # are read, so the first lines come out just as soon however long the input is.
+        for line, words, leading_colon, trailing_colon in self._iter_source_lines(source):
+            if words is not None:
+                broken_lines = self._iter_break_words(words)
+            elif self._line_breaking == LINE_BREAKING_OPTIMAL:
+                broken_lines = self._break_line_optimal(line)
+            else:
+                broken_lines = self._break_line(line)
+            for broken_line in broken_lines:
+                yield self._justify(broken_line, leading_colon, trailing_colon)
 
-        for line in lines:
-            leading_colon = False
-            trailing_colon = False
+    def _iter_source_lines(self, source):
+        # Yields (line, words, leading_colon, trailing_colon) for each input line, with its justification markers
+        # stripped off. A line of up to LONG_LINE_LENGTH characters is read whole and normalized into `line`. A longer
+        # one comes as `words` instead: an iterator that normalizes and splits the line as it's read, giving the same
+        # words as line.split(' ') would. Only a long line with a leading ':' that isn't already all in memory has to be
+        # read to its end first, since whether it's centered or right-justified depends on how it ends.
+        pieces = _iter_line_pieces(source)
+        for piece, line_ended in pieces:
+            parts = [piece]
+            length = len(piece)
+            while not line_ended and length <= LONG_LINE_LENGTH:
+                piece, line_ended = next(pieces)
+                parts.append(piece)
+                length += len(piece)
+            if length <= LONG_LINE_LENGTH:
+                line, leading_colon, trailing_colon = self._normalize_line(''.join(parts))
+                yield line, None, leading_colon, trailing_colon
+                continue
 
+            text = ''.join(parts)
+            leading_colon = text[0] == ':'
+            if leading_colon:
+                text = text[1:]
+                if not line_ended:
+                    text += ''.join(_iter_rest_of_line(pieces))
+                    line_ended = True
+
+            if line_ended:
+                trailing_colon = text[-1:] == ':'
+                if trailing_colon:
+                    text = text[:-1]
+                yield None, self._iter_words([text], False), leading_colon, trailing_colon
+            else:
+                # left-justified whether or not it ends in a ':', which is dropped once it's known to be the last
+                # character
+                yield None, self._iter_words(itertools.chain([text], _iter_rest_of_line(pieces)), True), False, False
+
+    def _iter_words(self, pieces, strip_trailing_colon):
+        # The words of a line, normalized as by _normalize_line(), from the pieces of raw text it arrives in
+        held = ''
+        words = _WordSplitter()
+        for piece in pieces:
+            for start in range(0, len(piece), _WORD_WINDOW):
+                window = held + piece[start:start + _WORD_WINDOW]
+                if strip_trailing_colon:
+                    held, window = window[-1:], window[:-1]
+                yield from words.feed(window.translate(self._translation_table))
+        if held != ':':
+            yield from words.feed(held.translate(self._translation_table))
+        yield words.last()
+
+    def _normalize_line(self, line):
+        # Returns the line lower-cased, with unsupported characters and runs of spaces replaced by single spaces, and
+        # with its justification markers stripped off
+        leading_colon = False
+        trailing_colon = False
+
+        if len(line) > 0:
+            if line[0] == ':':
+                leading_colon = True
+                line = line[1:]
+            if line[-1:] == ':':
+                trailing_colon = True
+                line = line[:-1]
+
+        # lower-case and convert unsupported characters to spaces
+        normalized_line = line.translate(self._translation_table)
+        # remove redundant spaces
+        normalized_line = _REDUNDANT_SPACES.sub(" ", normalized_line)
+
+        return normalized_line, leading_colon, trailing_colon
+
+    def _justify(self, line, leading_colon, trailing_colon):
+        trimmed_line = line[0: self._line_length]
+        if leading_colon and not trailing_colon:
+            return trimmed_line.rjust(self._line_length)
+        elif leading_colon and trailing_colon:
+            return trimmed_line.center(self._line_length)
+        else:
+            return trimmed_line.ljust(self._line_length)
+
+    def format_pages(self, message, rows, hyphen=None):
+        # Lays a message out as pages of `rows` rows by `line_length` columns; see format_pages_iter
+        return list(self._format_pages_cached(message, rows, hyphen, self._line_length, self._char_validator_func))
+
+    def _format_pages(self, message, rows, hyphen, line_length, char_validator_func):
+        return tuple(self.format_pages_iter(message, rows, hyphen))
+
+    def format_pages_iter(self, source, rows, hyphen=None):
+        # Yields Pages of `rows` rows, reading `source` as format_iter() does. Each input line is broken into as few
+        # rows as greedy breaking would give but with their lengths evened out, and every row keeps the justification
+        # of the line it came from. Words too long for a row are split to fill the row they start on, with `hyphen`
+        # (which the display must be able to show) added where they're split.
+        if hyphen is not None and not all(self._char_validator_func(char) for char in hyphen):
+            raise ValueError('Hyphen {!r} can\'t be displayed'.format(hyphen))
+
+        page_rows = []
+        for line, words, leading_colon, trailing_colon in self._iter_source_lines(source):
+            if words is None:
+                rows_of_line = self._balanced_wrap(line.split(' '), hyphen or '')
+            else:
+                # too long to even out, so wrapped as its words arrive
+                rows_of_line = _iter_wrap(words, self._line_length, hyphen or '')
+            for row in rows_of_line:
+                page_rows.append(self._justify(row, leading_colon, trailing_colon))
+                if len(page_rows) == rows:
+                    yield Page(page_rows)
+                    page_rows = []
+
+        if len(page_rows) > 0:
+            page_rows.extend([' ' * self._line_length] * (rows - len(page_rows)))
+            yield Page(page_rows)
+
+    def _balanced_wrap(self, words, hyphen):
+        lines = _wrap(words, self._line_length, hyphen)
+        longest_word = max(len(word) for word in words)
+        if len(lines) <= 1 or longest_word > self._line_length:
+            # narrowing the lines would only move where long words are split
+            return lines
+
+        # find the narrowest width that doesn't need any more lines
+        low = longest_word
+        high = self._line_length
+        while low < high:
+            width = (low + high) // 2
+            if len(_wrap(words, width, hyphen)) <= len(lines):
+                high = width
+            else:
+                low = width + 1
+        return _wrap(words, low, hyphen)
+
+
+def _wrap(words, width, hyphen):
+    # Greedy word wrapping to `width` columns
+    return list(_iter_wrap(words, width, hyphen))
+
+
+def _iter_wrap(words, width, hyphen):
+    if width <= len(hyphen):
+        hyphen = ''
+
+    wrapped = False
+    line = ''
+    for word in words:
+        if len(word) == 0:
+            continue
+        if len(line) > 0 and len(line) + 1 + len(word) <= width:
+            line += ' ' + word
+            continue
+        if len(word) <= width:
             if len(line) > 0:
-                if line[0] is ':':
-                    leading_colon = True
-                    line = line[1:]
-                if line[-1] is ':':
-                    trailing_colon = True
-                    line = line[:-1]
-
-            def map_to_valid_char(char):
-                char = char.lower()
-                if not self._char_validator_func(char):
-                    return ' '
-                else:
-                    return char
-
-            # convert unsupported characters to spaces
-            normalized_line = "".join(map(map_to_valid_char, line))
-            # remove redundant spaces
-            normalized_line = re.sub("\s\s+", " ", normalized_line)
-
-            broken_lines = self._break_line(normalized_line)
-
-            # pad to width
-            for i in range(0, len(broken_lines)):
-                trimmed_line = broken_lines[i][0: self._line_length]
-                if leading_colon and not trailing_colon:
-                    broken_lines[i] = trimmed_line.rjust(self._line_length)
-                elif leading_colon and trailing_colon:
-                    broken_lines[i] = trimmed_line.center(self._line_length)
-                else:
-                    broken_lines[i] = trimmed_line.ljust(self._line_length)
-
-            formatted_lines.extend(broken_lines)
-
-        return formatted_lines
+                yield line
+                wrapped = True
+            line = word
+            continue
+
+        # split the word, starting with whatever room is left on the current line
+        if len(line) > 0:
+            room = width - len(line) - 1 - len(hyphen)
+            if room > 0:
+                yield line + ' ' + word[:room] + hyphen
+                wrapped = True
+                word = word[room:]
+            else:
+                yield line
+                wrapped = True
+        cut = width - len(hyphen)
+        while len(word) > width:
+            yield word[:cut] + hyphen
+            wrapped = True
+            word = word[cut:]
+        line = word
+
+    if len(line) > 0 or not wrapped:
+        yield line
+
+
+def _iter_chunks(source):
+    if isinstance(source, str):
+        yield source
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(_READ_SIZE)
+            if len(chunk) == 0:
+                return
+            yield chunk
+    else:
+        yield from source
+
+
+def _iter_line_pieces(source):
+    # Splits text on newlines like str.split('\n'), including the empty line after a trailing newline, as (piece,
+    # line_ended) pairs: each line arrives in one or more pieces, as it's read, the last of them with line_ended set. A
+    # line of a string source always arrives in a single piece.
+    for chunk in _iter_chunks(source):
+        start = 0
+        end = chunk.find('\n')
+        while end >= 0:
+            yield chunk[start:end], True
+            start = end + 1
+            end = chunk.find('\n', start)
+        if start < len(chunk):
+            yield chunk[start:], False
+    yield '', True
+
+
+def _iter_rest_of_line(pieces):
+    # The remaining pieces of the line being read from an _iter_line_pieces() iterator
+    line_ended = False
+    while not line_ended:
+        piece, line_ended = next(pieces)
+        yield piece
+
+
+# Splits normalized text into words as it arrives, keeping only the empty words that str.split(' ') would give for the
+# text once runs of spaces have been collapsed: one for a leading space, and one for a trailing space.
+class _WordSplitter:
+    def __init__(self):
+        self._partial = ''
+        self._first = True
+
+    def feed(self, text):
+        words = (self._partial + text).split(' ')
+        self._partial = words.pop()
+        for word in words:
+            if len(word) > 0 or self._first:
+                yield word
+            self._first = False
+
+    def last(self):
+        return self._partial
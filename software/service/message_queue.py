@@ -0,0 +1,166 @@
+import itertools
+import time
+
+# Messages are listed with at most this many pages
+PREVIEW_PAGES = 32
+
+
+class QueuedMessage:
+    # `pages` holds what to send to the display for each step of the message: strings, or Pages from MessageFormatter. It
+    # can be any iterable that can be iterated more than once, so that a long message can be formatted as it's
+    # displayed rather than up front. A message with a `starts_at` time is held back until then. The pages of a
+    # `reorder` message may be shown in whatever order takes the least flap travel, and a `blank_hold` message also
+    # shows a blank page wherever it costs the least.
+    def __init__(self, message_id, pages, priority, expires_at, min_dwell, key, force_refresh, starts_at=None,
+                 reorder=False, blank_hold=False):
+        self.id = message_id
+        self.pages = pages
+        self.priority = priority
+        self.expires_at = expires_at
+        self.min_dwell = min_dwell
+        self.key = key
+        self.force_refresh = force_refresh
+        self.starts_at = starts_at
+        self.reorder = reorder
+        self.blank_hold = blank_hold
+        # replaces whatever is showing at once, ignoring its dwell time
+        self.preempt = False
+
+    def text(self):
+        pages = list(itertools.islice(self.pages, PREVIEW_PAGES + 1))
+        text = '\n'.join(str(page) for page in pages[:PREVIEW_PAGES]).upper() + '\n'
+        if len(pages) > PREVIEW_PAGES:
+            text += '...\n'
+        return text
+
+    def to_dict(self, now):
+        return {
+            'id': self.id,
+            'key': self.key,
+            'priority': self.priority,
+            'expires_in': None if self.expires_at is None else max(0, self.expires_at - now),
+            'starts_in': None if self.starts_at is None else max(0, self.starts_at - now),
+            'min_dwell': self.min_dwell,
+            'text': self.text(),
+        }
+
+
+# Messages waiting to be displayed, highest priority first and in arrival order within a priority. Pushing a message
+# with the same key as one that's already waiting updates that entry instead of adding another, so a producer that
+# sends a burst of updates only gets its latest one displayed.
+class MessageQueue:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._entries = []
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        self._expire()
+        return len(self._entries)
+
+    def _expire(self):
+        now = self._clock()
+        self._entries = [entry for entry in self._entries if entry.expires_at is None or entry.expires_at > now]
+
+    def _insert(self, entry):
+        index = len(self._entries)
+        while index > 0 and self._entries[index - 1].priority < entry.priority:
+            index -= 1
+        self._entries.insert(index, entry)
+
+    def _due(self, now):
+        for entry in self._entries:
+            if entry.starts_at is None or entry.starts_at <= now:
+                return entry
+        return None
+
+    def push(self, pages, priority=0, ttl=None, min_dwell=0, key=None, force_refresh=False, delay=None, reorder=False,
+             blank_hold=False):
+        # `ttl` and `delay` are both in seconds from now
+        now = self._clock()
+        expires_at = None if ttl is None else now + ttl
+        starts_at = None if delay is None else now + delay
+        if key is not None:
+            for entry in self._entries:
+                if entry.key == key:
+                    entry.pages = pages
+                    entry.expires_at = expires_at
+                    entry.starts_at = starts_at
+                    entry.min_dwell = min_dwell
+                    entry.force_refresh = force_refresh
+                    entry.reorder = reorder
+                    entry.blank_hold = blank_hold
+                    if entry.priority != priority:
+                        self._entries.remove(entry)
+                        entry.priority = priority
+                        self._insert(entry)
+                    return entry
+
+        entry = QueuedMessage(next(self._ids), pages, priority, expires_at, min_dwell, key, force_refresh, starts_at,
+                              reorder, blank_hold)
+        self._insert(entry)
+        return entry
+
+    def peek(self):
+        # The entry that would be popped next. Entries that haven't reached their start time are passed over.
+        self._expire()
+        return self._due(self._clock())
+
+    def pop(self):
+        self._expire()
+        entry = self._due(self._clock())
+        if entry is not None:
+            self._entries.remove(entry)
+        return entry
+
+    def next_start(self):
+        # The earliest start time of the entries still being held back, or None if there aren't any
+        now = self._clock()
+        start_times = [
+            entry.starts_at for entry in self._entries if entry.starts_at is not None and entry.starts_at > now
+        ]
+        return min(start_times) if len(start_times) > 0 else None
+
+    def entries(self):
+        self._expire()
+        return list(self._entries)
+
+    def get(self, message_id):
+        for entry in self._entries:
+            if entry.id == message_id:
+                return entry
+        return None
+
+    def drop(self, message_id):
+        entry = self.get(message_id)
+        if entry is None:
+            return False
+        self._entries.remove(entry)
+        return True
+
+    def clear(self):
+        self._entries = []
+
+    def move(self, message_id, position):
+        # Moves an entry to `position` in the queue, taking on the priority of the entry it's placed before (or after,
+        # at the end) so that later pushes keep it there
+        entry = self.get(message_id)
+        if entry is None:
+            return False
+        self._entries.remove(entry)
+        position = max(0, min(position, len(self._entries)))
+        if position < len(self._entries):
+            entry.priority = max(entry.priority, self._entries[position].priority)
+        if position > 0:
+            entry.priority = min(entry.priority, self._entries[position - 1].priority)
+        self._entries.insert(position, entry)
+        return True
+
+    def set_priority(self, message_id, priority):
+        entry = self.get(message_id)
+        if entry is None:
+            return False
+        self._entries.remove(entry)
+        entry.priority = priority
+        self._insert(entry)
+        return True
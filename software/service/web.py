@@ -2,23 +2,42 @@ import os
 import asyncio
 import logging
 import datetime
-from asyncio import CancelledError, shield
+import json
+import math
+import time
+from asyncio import CancelledError
 
-from quart import Quart, request, make_response
+from quart import Quart, request, make_response, jsonify
 
 from quart_cors import cors
 
-from service.message_formatter import MessageFormatter
+from service.message_formatter import MessageFormatter, LINE_BREAKING_GREEDY
+from service.message_queue import MessageQueue
+from splitflap.broadcast import Broadcaster
+from splitflap.instrumentation import format_prometheus
+from splitflap.sequencing import plan_sequence
+from splitflap.status import FLAPS, flap_index
 
 
+# Shows the time, changing on each second boundary. Only the modules whose digit changes are sent, and each change is
+# sent early by how long the modules it moves are expected to take to get there, so that they land on the second. Those
+# travel times are learned from how long earlier changes took to be reported in a status. `clock` gives the time of day
+# in seconds since the epoch.
 class SplitflapClock:
-    def __init__(self, splitflap):
+    def __init__(self, splitflap, clock=time.time, smoothing=0.25, max_lead=0.9):
         self._splitflap = splitflap
+        self._clock = clock
+        self._smoothing = smoothing
+        self._max_lead = max_lead
         self._clock_task = None
         self._current_text = None
+        self._target = None
+        # learned seconds per flap moved, for each module, or None until the module has been timed
+        self._flap_times = [None] * splitflap.get_num_modules()
 
-    def select(self):
-        pass
+    def prepare(self):
+        # The first frame is the time now, sent as soon as the clock is entered
+        return self._format_time(self._clock())
 
     @staticmethod
     def _on_clock_task_done(task):
@@ -29,49 +48,165 @@ class SplitflapClock:
         except Exception as e:
             logging.error(f'exception thrown from clock task: {repr(e)}')
 
-    def enter(self):
-        self._clock_task = asyncio.create_task(self._run_clock())
+    def enter(self, first_frame=None):
+        self._clock_task = asyncio.create_task(self._run_clock(first_frame))
         self._clock_task.add_done_callback(self._on_clock_task_done)
-        pass
 
-    async def exit(self):
+    def exit(self):
+        # The command being sent when the clock is left isn't waited for: it finishes on its own, and the next mode's
+        # first command goes out as soon as the controller is done with it
         if self._clock_task is not None:
             self._clock_task.cancel()
-            await self._clock_task
+            self._clock_task = None
         self._current_text = None
+        self._target = None
+
+    def _format_time(self, timestamp):
+        # on narrower displays the start is cut off, so that the seconds still show
+        num_modules = self._splitflap.get_num_modules()
+        now = datetime.datetime.fromtimestamp(timestamp)
+        return now.strftime('%m.%H.%M.%S').rjust(num_modules)[-num_modules:].lower()
+
+    def _distances(self, text):
+        # How many flaps each module has to move to show `text`. Flaps only turn one way, so going back means going
+        # round.
+        status = self._splitflap.get_status()
+        return [
+            (flap_index(flap) - flap_index(module['flap'])) % len(FLAPS)
+            for module, flap in zip(status, text)
+        ]
+
+    def get_lead_time(self, text):
+        # How long before it should show, `text` has to be sent
+        lead = 0
+        for distance, flap_time in zip(self._distances(text), self._flap_times):
+            if distance > 0 and flap_time is not None:
+                lead = max(lead, distance * flap_time)
+        return min(lead, self._max_lead)
+
+    def _learn(self, distances, elapsed):
+        # The status comes back once the module with the furthest to go has got there, so that's the module whose
+        # travel time was measured
+        furthest = max(distances)
+        if furthest == 0:
+            return
+        flap_time = elapsed / furthest
+        for module_index, distance in enumerate(distances):
+            if distance == furthest:
+                previous = self._flap_times[module_index]
+                if previous is None:
+                    self._flap_times[module_index] = flap_time
+                else:
+                    self._flap_times[module_index] = previous + self._smoothing * (flap_time - previous)
+
+    async def _run_clock(self, first_frame=None):
+        if first_frame is not None:
+            self._target = math.floor(self._clock())
+            await self._splitflap.set_text(first_frame, False)
+            self._current_text = first_frame
 
-    async def _run_clock(self):
         while True:
-            now = datetime.datetime.now()
-            text = now.strftime('%m.%H.%M.%S').rjust(self._splitflap.get_num_modules()).lower()
-            if text != self._current_text:
-                self._current_text = text
-                if False:
-                    self._splitflap.set_text(text)
-                else:
-                    self._splitflap.update_text(text)
-            await asyncio.sleep(0.25)
+            now = self._clock()
+            target = math.floor(now) + 1
+            if self._target is not None and target <= self._target:
+                # finished early, because the lead time was over-estimated; don't send the same second again
+                target = self._target + 1
+            text = self._format_time(target)
+
+            delay = target - self.get_lead_time(text) - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            distances = self._distances(text)
+            sent_at = self._clock()
+            # not forcing a refresh, so only the modules that change are sent
+            await self._splitflap.set_text(text, False)
+            self._learn(distances, self._clock() - sent_at)
+            self._current_text = text
+            self._target = target
+
+
+# Counts down, in hours, minutes and seconds, to a time set with set_duration(), changing on each second boundary just
+# as the clock does, and stays on zero once it gets there
+class SplitflapCountdown(SplitflapClock):
+    def __init__(self, splitflap, clock=time.time, **kwargs):
+        super().__init__(splitflap, clock, **kwargs)
+        self._deadline = None
+
+    def set_duration(self, seconds):
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or not 0 <= seconds < math.inf:
+            raise ValueError('Invalid countdown: {!r}'.format(seconds))
+        self._deadline = self._clock() + seconds
+
+    def _format_time(self, timestamp):
+        num_modules = self._splitflap.get_num_modules()
+        remaining = 0 if self._deadline is None else max(0, math.ceil(self._deadline - timestamp))
+        minutes, seconds = divmod(remaining, 60)
+        hours, minutes = divmod(minutes, 60)
+        return '{}.{:02d}.{:02d}'.format(hours, minutes, seconds).rjust(num_modules)[-num_modules:]
+
+
+# Messages longer than this are formatted line by line as they're displayed, rather than all at once before the first line
+# can be shown
+STREAMING_THRESHOLD = 4096
+
+
+class _StreamedMessage:
+    def __init__(self, format_iter, message, *args):
+        self._format_iter = format_iter
+        self._message = message
+        self._args = args
+
+    def __iter__(self):
+        return self._format_iter(self._message, *self._args)
 
 
 class SplitflapMessenger:
-    def __init__(self, splitflap):
+    # On displays with more than one row, messages are laid out and shown a page at a time. `hyphen` is added where
+    # words too long for a row are split across rows. `line_breaking` is passed on to MessageFormatter. `on_change` is
+    # called whenever the current message changes.
+    def __init__(self, splitflap, line_interval=2, clock=time.monotonic, hyphen=None,
+                 line_breaking=LINE_BREAKING_GREEDY, on_change=None):
         self._splitflap = splitflap
-        self._formatter = MessageFormatter(self._splitflap.get_num_modules(),
-                                           lambda char: self._splitflap.is_in_alphabet(char))
-        self._message_task = None
-        self._message_task_cancel = False
-        self._force_refresh = False
+        self._formatter = MessageFormatter(self._splitflap.get_columns(),
+                                           self._splitflap.is_in_alphabet,
+                                           alphabet=self._splitflap.get_alphabet(),
+                                           line_breaking=line_breaking)
+        self._rows = self._splitflap.get_rows()
+        self._hyphen = hyphen
+        self._line_interval = line_interval
+        self._clock = clock
+        self._queue = MessageQueue(clock)
+        self._queue_task = None
+        # set whenever the queue changes, so that the queue task can check whether to replace what it's showing
+        self._wakeup = None
+        self._current = None
+        self._current_started = None
         self._message_text = ''
-
-    def select(self):
-        self._splitflap.clear_text()
-
-    def enter(self):
-        pass
+        # the page last shown, to show again when the messenger is re-entered
+        self._current_page = None
+        self._on_change = on_change
+        # ids of the queued messages loaded by the last load_timeline()
+        self._timeline_ids = []
+
+    def prepare(self):
+        # The first frame is the page that was showing when the messenger was last left, or a blank one if there hasn't
+        # been one yet. The rest of its message isn't shown again.
+        if self._current_page is None:
+            return self._format('')
+        return [self._current_page]
+
+    def enter(self, first_frame=None):
+        if len(self._queue) == 0 and first_frame is not None:
+            self._show(first_frame, False)
+        elif len(self._queue) > 0:
+            self._wake()
 
     def exit(self):
-        if self._message_task is not None:
-            self._message_task_cancel = True
+        if self._queue_task is not None:
+            self._queue_task.cancel()
+            self._queue_task = None
+        self._current = None
 
     def _check_module_status(self):
         normal_module_count = 0
@@ -83,96 +218,372 @@ class SplitflapMessenger:
         if normal_module_count == 0:
             raise RuntimeError('all modules in error state')
 
-    def _on_display_message_task_done(self, task):
-        self._message_task = None
+    def _on_queue_task_done(self, task):
+        if self._queue_task is task:
+            self._queue_task = None
         # noinspection PyBroadException
         try:
             task.exception()
         except CancelledError as e:
             pass
         except Exception as e:
-            logging.error(f'exception thrown from clock task: {repr(e)}')
+            logging.error(f'exception thrown from message queue task: {repr(e)}')
 
-    async def _display_message(self, message):
-        for line in message:
-            if self._message_task_cancel:
-                return
+    @staticmethod
+    def _on_set_text_done(task):
+        # noinspection PyBroadException
+        try:
+            task.exception()
+        except CancelledError as e:
+            pass
+        except Exception as e:
+            logging.error(f'exception thrown from set_text: {repr(e)}')
+
+    def _set_message_text(self, text):
+        if text == self._message_text:
+            return
+        self._message_text = text
+        if self._on_change is not None:
+            self._on_change()
+
+    def _wake(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._queue_task is None:
+            self._queue_task = asyncio.ensure_future(self._run_queue())
+            self._queue_task.add_done_callback(self._on_queue_task_done)
+
+    def _preempt_at(self):
+        # The clock time from which the next queued message may replace the one being shown, or None if it has to
+        # wait for it to finish. Higher priority messages, newer versions of the one being shown and scheduled messages
+        # that have reached their start time only have to wait for its minimum dwell time.
+        if self._current is None:
+            return None
+        dwell_end = self._current_started + self._current.min_dwell
+        next_message = self._queue.peek()
+        if next_message is not None:
+            if next_message.preempt:
+                return self._current_started
+            if next_message.priority > self._current.priority or next_message.starts_at is not None or \
+                    (next_message.key is not None and next_message.key == self._current.key):
+                return dwell_end
+        next_start = self._queue.next_start()
+        if next_start is not None:
+            return max(next_start, dwell_end)
+        return None
+
+    async def _wait(self, until=None, task=None):
+        # Waits for `task` to finish or, without a task, until the clock reaches `until`. Returns True as soon as a
+        # queued message should replace the current one instead.
+        while True:
+            self._wakeup.clear()
+            now = self._clock()
+            preempt_at = self._preempt_at()
+            if preempt_at is not None and preempt_at <= now:
+                return True
+            if task is not None and task.done():
+                return False
+            if task is None and until <= now:
+                return False
+
+            deadlines = [deadline for deadline in (until, preempt_at) if deadline is not None]
+            timeout = min(deadlines) - now if len(deadlines) > 0 else None
+            wakeup_task = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({wakeup_task} if task is None else {wakeup_task, task},
+                                   timeout=timeout,
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                wakeup_task.cancel()
+
+    def _sequence(self, message):
+        # The pages of `message` in the order they're to be shown in. Streamed messages are always shown in order.
+        if not (message.reorder or message.blank_hold) or isinstance(message.pages, _StreamedMessage):
+            return message.pages
+        pages = list(message.pages)
+        order = plan_sequence([page if isinstance(page, str) else page.text() for page in pages],
+                              self._splitflap.get_text(),
+                              reorder=message.reorder,
+                              blank_hold=message.blank_hold,
+                              force_refresh=message.force_refresh)
+        blank = ' ' * (self._rows * self._splitflap.get_columns())
+        return [blank if index is None else pages[index] for index in order]
 
+    async def _display_message(self, message):
+        # when the line being shown has had its line_interval, so the next one can be sent
+        shown_until = None
+        for page in self._sequence(message):
             self._check_module_status()
-            self._splitflap.set_text(line, self._force_refresh)
-            await asyncio.sleep(2)
+            text = page if isinstance(page, str) else page.text()
+            if shown_until is not None and await self._wait(until=shown_until):
+                return
+            self._current_page = page
+            # Each line shows for line_interval from when it's settled: when its flaps are predicted to have got there,
+            # or when the status confirms they have if that's later. Moving the flaps doesn't count towards it.
+            settled_at = self._clock() + self._splitflap.estimate_travel_time(text, message.force_refresh)
+            set_text_task = asyncio.ensure_future(self._splitflap.set_text(text, message.force_refresh))
+            if await self._wait(task=set_text_task):
+                # The command may already be with the controller, so leave it to finish rather than cancelling it;
+                # the splitflap runs the next message's first line as soon as the controller is idle again.
+                set_text_task.add_done_callback(self._on_set_text_done)
+                return
+            set_text_task.result()
+            shown_until = max(settled_at, self._clock()) + self._line_interval
 
-    async def set_message(self, message, force_refresh):
-        if self._message_task is not None:
-            # since we've shielded our task from cancellation, set the cancel flag and wait for it to complete
-            # TODO: this means that we may have to wait up to the inter-line interval before we can set the message
-            self._message_task_cancel = True
-            await self._message_task
+        if shown_until is not None and await self._wait(until=shown_until):
+            return
+        await self._wait(until=self._current_started + message.min_dwell)
 
+    async def _run_queue(self):
+        while True:
+            message = self._queue.pop()
+            if message is None:
+                self._current = None
+                self._wakeup.clear()
+                next_start = self._queue.next_start()
+                timeout = None if next_start is None else max(0, next_start - self._clock())
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._current = message
+            self._current_started = self._clock()
+            self._set_message_text(message.text())
+            # noinspection PyBroadException
+            try:
+                await self._display_message(message)
+            except CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f'exception thrown while displaying message: {repr(e)}')
+
+    def _format(self, message):
+        if self._rows == 1:
+            if len(message) > STREAMING_THRESHOLD:
+                return _StreamedMessage(self._formatter.format_iter, message)
+            return self._formatter.format(message)
+
+        if len(message) > STREAMING_THRESHOLD:
+            return _StreamedMessage(self._formatter.format_pages_iter, message, self._rows, self._hyphen)
+        return self._formatter.format_pages(message, self._rows, self._hyphen)
+
+    def _show(self, pages, force_refresh, reorder=False, blank_hold=False):
+        # Replaces whatever is showing right away, ahead of anything queued
+        for entry in self._queue.entries():
+            if entry.preempt:
+                # replaced before it got to show
+                self._queue.drop(entry.id)
+        entry = self._queue.push(pages, force_refresh=force_refresh, reorder=reorder, blank_hold=blank_hold)
+        entry.preempt = True
+        self._queue.move(entry.id, 0)
+        self._set_message_text(entry.text())
+        self._wake()
+
+    # `reorder` lets the lines of a message, such as the items of a list or a ticker, be shown in whatever order takes
+    # the least flap travel from what's showing. `blank_hold` adds a blank line, placed where it costs the least.
+    async def set_message(self, message, force_refresh, reorder=False, blank_hold=False):
         self._check_module_status()
+        self._show(self._format(message), force_refresh, reorder, blank_hold)
+        return self._message_text
 
-        message = self._formatter.format(message)
-
-        self._message_task_cancel = False
-        # need to shield so that the task doesn't get canceled with the request
-        self._message_task = shield(asyncio.create_task(self._display_message(message)))
-        self._message_task.add_done_callback(self._on_display_message_task_done)
+    async def enqueue_message(self, message, force_refresh, priority=0, ttl=None, min_dwell=0, key=None, reorder=False,
+                              blank_hold=False):
+        self._check_module_status()
 
-        self._message_text = '\n'.join(message).upper() + '\n'
-        self._force_refresh = force_refresh
+        entry = self._queue.push(self._format(message), priority, ttl, min_dwell, key, force_refresh,
+                                 reorder=reorder, blank_hold=blank_hold)
+        self._wake()
+        return entry
+
+    async def load_timeline(self, messages):
+        # Schedules a playlist, replacing the one loaded before. Each message is a dict with its `text` and `duration`
+        # in seconds, and optionally its `start` in seconds from now (by default, when the one before it ends),
+        # `force_refresh`, `reorder`, `blank_hold` and `priority`. Every message is checked and formatted before any is
+        # scheduled, so a bad one leaves the current timeline in place.
+        if not isinstance(messages, list):
+            raise ValueError('Timeline must be a list of messages')
+        self._check_module_status()
 
-        return self._message_text
+        scheduled = []
+        start = 0
+        for index, message in enumerate(messages):
+            if not isinstance(message, dict):
+                raise ValueError('Message {} is not an object'.format(index))
+            text = message.get('text')
+            if not isinstance(text, str):
+                raise ValueError('Message {} has no text'.format(index))
+            start = message.get('start', start)
+            duration = message.get('duration')
+            for name, value in (('start', start), ('duration', duration)):
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                    raise ValueError('Message {} has an invalid {}: {!r}'.format(index, name, value))
+            if duration == 0:
+                # it would expire as it became due, and never show
+                raise ValueError('Message {} has a zero duration'.format(index))
+            flags = {}
+            for name in ('force_refresh', 'reorder', 'blank_hold'):
+                flags[name] = message.get(name, False)
+                if not isinstance(flags[name], bool):
+                    raise ValueError('Message {} has an invalid {}: {!r}'.format(index, name, flags[name]))
+            priority = message.get('priority', 0)
+            if isinstance(priority, bool) or not isinstance(priority, int):
+                raise ValueError('Message {} has an invalid priority: {!r}'.format(index, priority))
+
+            scheduled.append((start, duration, self._format(text), flags, priority))
+            start += duration
+
+        for message_id in self._timeline_ids:
+            self._queue.drop(message_id)
+        # queued in start order, so that messages that are due together play in that order
+        scheduled.sort(key=lambda item: item[0])
+        entries = [
+            self._queue.push(pages, priority, ttl=start + duration, min_dwell=duration, delay=start, **flags)
+            for start, duration, pages, flags, priority in scheduled
+        ]
+        self._timeline_ids = [entry.id for entry in entries]
+        self._wake()
+        return entries
 
     def get_message(self):
         return self._message_text
 
+    def describe_entries(self, entries):
+        # The queued messages as dicts, with their times relative to the messenger's clock
+        now = self._clock()
+        return [entry.to_dict(now) for entry in entries]
 
-if __name__ == '__main__':
-    splitflap_host = os.environ.get('SPLITFLAP_ESP_LINK_HOST')
-    splitflap_device = os.environ.get('SPLITFLAP_DEV')
-    splitflap = None
-    if splitflap_host is not None:
-        from splitflap.transport import EspLinkTransport
-        from splitflap.splitflap import Splitflap
+    def get_queue(self):
+        return self.describe_entries(self._queue.entries())
 
-        print(f'connecting to ESP-Link at address: {splitflap_host}' )
+    def drop_queued_message(self, message_id):
+        return self._queue.drop(message_id)
 
-        transport = EspLinkTransport(splitflap_host)
-        transport.open()
-        splitflap = Splitflap(transport)
-    elif splitflap_device is not None:
-        from splitflap.transport import SerialTransport
-        from splitflap.splitflap import Splitflap
+    def move_queued_message(self, message_id, position):
+        if not self._queue.move(message_id, position):
+            return False
+        self._wake()
+        return True
 
-        print(f'connecting to serial port: {splitflap_device}' )
+    def set_queued_message_priority(self, message_id, priority):
+        if not self._queue.set_priority(message_id, priority):
+            return False
+        self._wake()
+        return True
 
-        transport = SerialTransport(splitflap_device, 38400)
-        transport.open()
-        splitflap = Splitflap(transport)
-    else:
-        from splitflap.splitflap import MockSplitflap
 
-        print(f'using mock splitflap' )
+MESSAGE_MODE_NAME = 'message'
+CLOCK_MODE_NAME = 'clock'
+COUNTDOWN_MODE_NAME = 'countdown'
 
-        splitflap = MockSplitflap(12)
+# Factories for the modes every app offers, by name. Each is called with the splitflap, once it has started, and a
+# function to call whenever what the mode reports as its message changes.
+#
+# A mode has:
+#   prepare(): returns the first frame to show when it's entered, or None to leave the display as it is. It's called
+#     before the mode that's being left exits, so it can't hold up the switch.
+#   enter(first_frame): starts the mode from the frame prepare() returned, without waiting for it to be shown.
+#   exit(): stops the mode. It may return an awaitable, but mustn't wait for the flaps to stop.
+MODE_FACTORIES = {}
 
-    MESSAGE_MODE_NAME = 'message'
-    CLOCK_MODE_NAME = 'clock'
 
-    modes = {
-        MESSAGE_MODE_NAME: SplitflapMessenger(splitflap),
-        CLOCK_MODE_NAME: SplitflapClock(splitflap)
-    }
+def register_mode(name, factory):
+    MODE_FACTORIES[name] = factory
+
+
+register_mode(MESSAGE_MODE_NAME, lambda splitflap, on_change: SplitflapMessenger(splitflap, on_change=on_change))
+register_mode(CLOCK_MODE_NAME, lambda splitflap, on_change: SplitflapClock(splitflap))
+register_mode(COUNTDOWN_MODE_NAME, lambda splitflap, on_change: SplitflapCountdown(splitflap))
+
+
+def _parse_flag(value):
+    # Query string flags, such as ?reorder=1. A flag given without a value is set.
+    return value.lower() in ('', '1', 'true', 'yes')
+
+
+def _query_number(args, name, number_type, default, minimum=None):
+    # A number from the query string, or `default` if it isn't there. Raises ValueError if it isn't a finite number of
+    # `number_type` of at least `minimum`.
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        number = number_type(value)
+    except ValueError:
+        raise ValueError('Invalid {}: {!r}'.format(name, value))
+    if not -math.inf < number < math.inf or (minimum is not None and number < minimum):
+        raise ValueError('Invalid {}: {!r}'.format(name, value))
+    return number
+
+
+def create_app(splitflap, transport=None, static_folder=None, metrics=None, mode_factories=None):
+    if mode_factories is None:
+        mode_factories = MODE_FACTORIES
+    modes = {}
 
     active_mode = None
     active_mode_name = None
 
-    app = Quart(__name__, static_url_path='', static_folder=os.environ.get('WEBAPP_BUILD_PATH'))
+    # Status events for /api/events are built once, by whatever changed, and shared by every client streaming them
+    status_events = Broadcaster()
+    status_task = None
+
+    app = Quart(__name__, static_url_path='', static_folder=static_folder)
     app = cors(app, allow_origin="*")
 
+    def _status_snapshot():
+        status = splitflap.get_status()
+        return {
+            'mode': active_mode_name,
+            'message': modes[MESSAGE_MODE_NAME].get_message() if MESSAGE_MODE_NAME in modes else None,
+            'modules': None if status is None else [{key: module[key] for key in module} for module in status],
+        }
+
+    def _publish_status():
+        event = 'data: {}\n\n'.format(json.dumps(_status_snapshot()))
+        if event != status_events.latest:
+            status_events.publish(event)
+
+    async def _watch_status():
+        async for _ in splitflap.status_updates():
+            _publish_status()
+
+    @app.before_serving
+    async def start_splitflap():
+        nonlocal status_task
+
+        if transport is not None:
+            await transport.open()
+        await splitflap.start()
+
+        # modes size themselves from the module count, which isn't known until the controller has inited
+        for mode_name, factory in mode_factories.items():
+            modes[mode_name] = factory(splitflap, _publish_status)
+
+        _publish_status()
+        status_task = asyncio.ensure_future(_watch_status())
+
+    @app.after_serving
+    async def stop_splitflap():
+        if active_mode is not None:
+            exit_task = active_mode.exit()
+            if exit_task is not None:
+                await exit_task
+        if status_task is not None:
+            status_task.cancel()
+            try:
+                await status_task
+            except CancelledError:
+                pass
+        await splitflap.stop()
+        if transport is not None:
+            await transport.close()
+
     async def _activate_mode(mode_name):
-        global active_mode
-        global active_mode_name
+        nonlocal active_mode
+        nonlocal active_mode_name
 
         if active_mode_name == mode_name:
             return None
@@ -181,24 +592,25 @@ if __name__ == '__main__':
             raise AssertionError('invalid mode name')
 
         new_mode = modes[mode_name]
+        first_frame = new_mode.prepare()
 
         if active_mode is not None:
             exit_task = active_mode.exit()
             if exit_task is not None:
                 await exit_task
 
+        # straight from whatever the last mode left showing to the new mode's first frame
         active_mode = new_mode
-        active_mode.enter()
+        active_mode.enter(first_frame)
         active_mode_name = mode_name
+        _publish_status()
 
         return active_mode
 
     @app.route('/api/mode', methods=['PUT'])
     async def select_mode():
         mode_name = await request.get_data()
-        new_mode = await _activate_mode(mode_name.decode("utf-8"))
-        if new_mode is not None:
-            new_mode.select()
+        await _activate_mode(mode_name.decode("utf-8"))
 
         return await make_response(mode_name, 200)
 
@@ -211,15 +623,148 @@ if __name__ == '__main__':
 
         message_text = m.decode("utf-8")
 
-        if request.method == 'PUT':
-            current_message = await active_mode.set_message(message_text, True)
-        elif request.method == 'POST':
-            current_message = await active_mode.set_message(message_text, False)
-        elif request.method == 'GET':
+        if request.method == 'GET':
             current_message = active_mode.get_message()
+        elif request.method in ('PUT', 'POST'):
+            force_refresh = request.method == 'PUT'
+            reorder = request.args.get('reorder', False, type=_parse_flag)
+            blank_hold = request.args.get('blank', False, type=_parse_flag)
+            if any(arg in request.args for arg in ('priority', 'ttl', 'dwell', 'key')):
+                try:
+                    priority = _query_number(request.args, 'priority', int, 0)
+                    ttl = _query_number(request.args, 'ttl', float, None, minimum=0)
+                    min_dwell = _query_number(request.args, 'dwell', float, 0, minimum=0)
+                except ValueError as e:
+                    return await make_response(str(e), 400)
+                # queue behind whatever is showing rather than replacing it
+                entry = await active_mode.enqueue_message(
+                    message_text,
+                    force_refresh,
+                    priority=priority,
+                    ttl=ttl,
+                    min_dwell=min_dwell,
+                    key=request.args.get('key'),
+                    reorder=reorder,
+                    blank_hold=blank_hold,
+                )
+                return jsonify({'id': entry.id, 'text': entry.text()})
+            current_message = await active_mode.set_message(message_text, force_refresh, reorder, blank_hold)
         else:
             raise(AssertionError('unexpected request type'))
 
         return await make_response(current_message, 200)
 
+    @app.route('/api/timeline', methods=['PUT', 'POST'])
+    async def api_timeline_request():
+        messages = await request.get_json(force=True, silent=True)
+
+        if active_mode_name != MESSAGE_MODE_NAME:
+            await _activate_mode(MESSAGE_MODE_NAME)
+
+        try:
+            entries = await active_mode.load_timeline(messages)
+        except ValueError as e:
+            return await make_response(str(e), 400)
+        return jsonify(active_mode.describe_entries(entries))
+
+    @app.route('/api/countdown', methods=['PUT'])
+    async def api_countdown_request():
+        # Starts counting down from the number of seconds given
+        seconds = await request.get_json(force=True, silent=True)
+        if COUNTDOWN_MODE_NAME not in modes:
+            return await make_response('no countdown mode', 404)
+        try:
+            modes[COUNTDOWN_MODE_NAME].set_duration(seconds)
+        except ValueError as e:
+            return await make_response(str(e), 400)
+        await _activate_mode(COUNTDOWN_MODE_NAME)
+        return await make_response(str(seconds), 200)
+
+    @app.route('/api/queue', methods=['GET'])
+    async def api_queue_request():
+        return jsonify(modes[MESSAGE_MODE_NAME].get_queue())
+
+    @app.route('/api/queue/<int:message_id>', methods=['DELETE', 'PATCH'])
+    async def api_queue_entry_request(message_id):
+        messenger = modes[MESSAGE_MODE_NAME]
+        if request.method == 'DELETE':
+            found = messenger.drop_queued_message(message_id)
+        else:
+            changes = await request.get_json(force=True, silent=True)
+            if not isinstance(changes, dict):
+                return await make_response('Changes must be a JSON object', 400)
+            for name in ('priority', 'position'):
+                if name in changes and (isinstance(changes[name], bool) or not isinstance(changes[name], int)):
+                    return await make_response('Invalid {}: {!r}'.format(name, changes[name]), 400)
+            found = True
+            if 'priority' in changes:
+                found = messenger.set_queued_message_priority(message_id, changes['priority'])
+            if found and 'position' in changes:
+                found = messenger.move_queued_message(message_id, changes['position'])
+
+        if not found:
+            return await make_response('no such queued message', 404)
+        return jsonify(messenger.get_queue())
+
+    @app.route('/api/status', methods=['GET'])
+    async def api_status_request():
+        return jsonify(_status_snapshot())
+
+    @app.route('/api/events', methods=['GET'])
+    async def api_events_request():
+        # Server-sent events: the current status straight away, then each new one. A client that can't keep up skips
+        # to the latest status rather than queueing stale ones.
+        async def send_events():
+            async for event in status_events.subscribe(replay_latest=True):
+                yield event.encode('utf-8')
+
+        response = await make_response(send_events(), 200, {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+        })
+        response.timeout = None
+        return response
+
+    @app.route('/api/metrics', methods=['GET'])
+    async def api_metrics_request():
+        body = format_prometheus(metrics if metrics is not None else [])
+        return await make_response(body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+    return app
+
+
+if __name__ == '__main__':
+    splitflap_host = os.environ.get('SPLITFLAP_ESP_LINK_HOST')
+    splitflap_device = os.environ.get('SPLITFLAP_DEV')
+    splitflap = None
+    transport = None
+    metrics = []
+    if splitflap_host is not None:
+        from splitflap.async_transport import AsyncEspLinkTransport
+        from splitflap.async_splitflap import AsyncSplitflap
+        from splitflap.instrumentation import AsyncInstrumentedTransport
+
+        print(f'connecting to ESP-Link at address: {splitflap_host}' )
+
+        transport = AsyncInstrumentedTransport(AsyncEspLinkTransport(splitflap_host), name=splitflap_host)
+        metrics.append(transport.metrics)
+        splitflap = AsyncSplitflap(transport)
+    elif splitflap_device is not None:
+        from splitflap.async_transport import AsyncSerialTransport
+        from splitflap.async_splitflap import AsyncSplitflap
+        from splitflap.instrumentation import AsyncInstrumentedTransport
+
+        print(f'connecting to serial port: {splitflap_device}' )
+
+        transport = AsyncInstrumentedTransport(AsyncSerialTransport(splitflap_device, 38400), name=splitflap_device)
+        metrics.append(transport.metrics)
+        splitflap = AsyncSplitflap(transport)
+    else:
+        from splitflap.async_splitflap import AsyncMockSplitflap
+
+        print(f'using mock splitflap' )
+
+        splitflap = AsyncMockSplitflap(12)
+
+    app = create_app(splitflap, transport, os.environ.get('WEBAPP_BUILD_PATH'), metrics)
     app.run(host='0.0.0.0')
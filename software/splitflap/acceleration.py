@@ -0,0 +1,11 @@
+# NOTE: THIS FILE IS AUTOGENERATED! DO NOT MODIFY!
+# To update, run `arduino/splitflap/generate_acceleration.py`
+
+# Matches ACCEL_STEP_PERIODS in arduino/splitflap/acceleration.h: the step period, in microseconds, at each speed. The
+# firmware speeds up or slows down by one entry per step.
+ACCEL_STEP_PERIODS = [
+    1200, 20000, 9469, 7579, 6535, 5842, 5335, 4944, 4629, 4369, 4149, 3959, 3794, 3648, 3518, 3401, 3295, 3198, 3110,
+    3028, 2953, 2883, 2818, 2757, 2700, 2646, 2596, 2548, 2503, 2460, 2419, 2380, 2343, 2308, 2274, 2242, 2211, 2182,
+    2153, 2126, 2099, 2074, 2049, 2026, 2003, 1981, 1959, 1939, 1919, 1899, 1880, 1862, 1844, 1827, 1810, 1794, 1778,
+    1762, 1747, 1733, 1718, 1704, 1691, 1677, 1664, 1651,
+]
@@ -0,0 +1,142 @@
+import asyncio
+
+from splitflap.broadcast import Broadcaster
+from splitflap.splitflap import MockSplitflap, _ControllerSplitflap
+
+
+class AsyncSplitflap(_ControllerSplitflap):
+    def __init__(self, transport):
+        super().__init__()
+        self._transport = transport
+
+        self._command_lock = None
+        self._reader_task = None
+        self._reader_exception = None
+        self._status_waiters = []
+        self._status_broadcaster = Broadcaster()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def start(self):
+        # created here rather than in __init__ so that it's bound to the running loop
+        self._command_lock = asyncio.Lock()
+        self._resuming = getattr(self._transport, 'resumed', False)
+        self._reconnect_count = getattr(self._transport, 'reconnect_count', 0)
+        initial_status = self._wait_for_status()
+        self._reader_task = asyncio.ensure_future(self._read_loop())
+        await initial_status
+        return self
+
+    async def stop(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self._transport.readline()
+                status = self._handle_line(line)
+                if self._is_resync_status(status):
+                    self._status_broadcaster.publish(status)
+                elif status is not None:
+                    self._publish_status(status)
+        except asyncio.CancelledError:
+            # nothing will read the statuses these are waiting for
+            waiters, self._status_waiters = self._status_waiters, []
+            for waiter in waiters:
+                waiter.cancel()
+            raise
+        except Exception as e:
+            self._reader_exception = e
+            waiters, self._status_waiters = self._status_waiters, []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            raise
+
+    def _publish_status(self, status):
+        waiters, self._status_waiters = self._status_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(status)
+
+        self._status_broadcaster.publish(status)
+
+    def _wait_for_status(self):
+        future = asyncio.get_running_loop().create_future()
+        if self._reader_exception is not None:
+            future.set_exception(self._reader_exception)
+        else:
+            self._status_waiters.append(future)
+        return future
+
+    def status_updates(self):
+        # Async iterator over new statuses. Subscribers that fall behind skip to the latest one.
+        return self._status_broadcaster.subscribe()
+
+    async def _send_command(self, line):
+        status = self._wait_for_status()
+        await self._transport.write(line)
+        return await status
+
+    async def _run_command(self, line):
+        # Once a command has been sent, its echo and status have to be read before the next one is, or they'd be taken
+        # for the next command's. So if the caller is cancelled, the command lock is held until the command finishes.
+        command = asyncio.ensure_future(self._send_command(line))
+        try:
+            return await asyncio.shield(command)
+        except asyncio.CancelledError:
+            await asyncio.wait([command])
+            raise
+
+    async def set_text(self, text, force_refresh):
+        async with self._command_lock:
+            line = self._encode_set_text(text, force_refresh)
+            if line is None:
+                return self._last_status
+            return await self._run_command(line)
+
+    async def recalibrate_all(self):
+        async with self._command_lock:
+            return await self._run_command('@\n')
+
+
+class AsyncMockSplitflap(MockSplitflap):
+    def __init__(self, num_modules, move_delay=0):
+        super().__init__(num_modules)
+        self._move_delay = move_delay
+        self._status_broadcaster = Broadcaster()
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        pass
+
+    def status_updates(self):
+        return self._status_broadcaster.subscribe()
+
+    def estimate_travel_time(self, text, force_refresh):
+        return self._move_delay
+
+    async def set_text(self, text, force_refresh):
+        await asyncio.sleep(self._move_delay)
+        status = super().set_text(text, force_refresh)
+        self._status_broadcaster.publish(status)
+        return status
+
+    async def recalibrate_all(self):
+        await asyncio.sleep(self._move_delay)
+        status = super().recalibrate_all()
+        self._status_broadcaster.publish(status)
+        return status
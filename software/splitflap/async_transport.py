@@ -0,0 +1,105 @@
+import asyncio
+
+from splitflap.transport import http_session, configure_socket, reset_url
+
+
+class AsyncSerialTransport(object):
+    def __init__(self, device, baud_rate):
+        self._reader = None
+        self._writer = None
+        self._device = device
+        self._baud_rate = baud_rate
+        # see SerialTransport.on_write
+        self.on_write = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self):
+        import serial_asyncio
+
+        self._reader, self._writer = await serial_asyncio.open_serial_connection(
+            url=self._device,
+            baudrate=self._baud_rate,
+        )
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    async def readline(self):
+        line = await self._reader.readline()
+        return line.decode('utf-8')
+
+    async def write(self, data):
+        if self.on_write is not None:
+            self.on_write(data)
+        self._writer.write(data.encode('utf-8'))
+        await self._writer.drain()
+
+
+class AsyncEspLinkTransport(object):
+    def __init__(self, host, port=23, http_port=80):
+        self._reader = None
+        self._writer = None
+        self._host = host
+        self._port = port
+        self._http_port = http_port
+        self._partial_line = b''
+        # see EspLinkTransport.on_write and EspLinkTransport.reconnect_count
+        self.on_write = None
+        self.reconnect_count = 0
+        self.resumed = False
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self, reset=True):
+        # See EspLinkTransport.open()
+        await self._open_socket()
+
+        self.resumed = not reset
+        if reset:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, http_session().post, reset_url(self._host, self._http_port))
+        else:
+            await self.write('A\n')
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    async def _open_socket(self):
+        await self.close()
+
+        self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        configure_socket(self._writer.get_extra_info('socket'))
+
+    async def readline(self):
+        while True:
+            line = await self._reader.readline()
+            if line.endswith(b'\n'):
+                line = self._partial_line + line
+                self._partial_line = b''
+                return line.decode('utf-8')
+
+            # the connection dropped; hold on to whatever arrived before it did and reconnect, asking for a status in
+            # case one was sent while we were disconnected
+            self._partial_line += line
+            await self._open_socket()
+            await self.write('A\n')
+            self.reconnect_count += 1
+
+    async def write(self, string):
+        if self.on_write is not None:
+            self.on_write(string)
+        self._writer.write(string.encode('utf-8'))
+        await self._writer.drain()
@@ -0,0 +1,174 @@
+import struct
+
+from splitflap.status import FLAPS
+
+# Binary framing for controller output, enabled by sending the 'B' command. Each frame is:
+#
+#   0xA5 | body length (uint16, little endian) | frame type | body | CRC-8
+#
+# where the CRC (polynomial 0x07, initial value 0) covers the length, type and body. Bodies are:
+#
+#   init:      number of modules (uint16 le), flags (bit 0: sparse update supported)
+#   move_echo: the destination text, as sent in the command
+#   status:    one byte per module (state << 6 | flap index), then the number of modules with non-zero error counters
+#              followed by a (module index, missed home count, unexpected home count) triple for each of them
+#   no_op:     empty
+
+FRAME_SYNC = 0xA5
+
+FRAME_INIT = 0x01
+FRAME_MOVE_ECHO = 0x02
+FRAME_STATUS = 0x03
+FRAME_NO_OP = 0x04
+
+INIT_FLAG_SPARSE_UPDATE = 0x01
+
+MAX_BODY_LENGTH = 4096
+
+_HEADER = struct.Struct('<BHB')
+
+
+def _make_crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+_CRC8_TABLE = _make_crc8_table()
+
+# split a status byte into its state and flap index with a single bytes.translate each
+_STATE_FROM_BYTE = bytes(byte >> 6 for byte in range(256))
+_FLAP_FROM_BYTE = bytes(byte & 0x3F for byte in range(256))
+
+
+def crc8(data, crc=0):
+    for byte in data:
+        crc = _CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def encode_frame(frame_type, body=b''):
+    header = _HEADER.pack(FRAME_SYNC, len(body), frame_type)
+    return header + body + bytes([crc8(body, crc8(header[1:]))])
+
+
+def encode_init(num_modules, sparse_update=False):
+    flags = INIT_FLAG_SPARSE_UPDATE if sparse_update else 0
+    return encode_frame(FRAME_INIT, struct.pack('<HB', num_modules, flags))
+
+
+def encode_move_echo(dest):
+    return encode_frame(FRAME_MOVE_ECHO, dest.encode('utf-8'))
+
+
+def encode_status(status):
+    body = bytearray((state << 6) | flap for state, flap in zip(status.states, status.flaps))
+    errors = [
+        module_index
+        for module_index in range(len(status))
+        if status.count_missed_home[module_index] or status.count_unexpected_home[module_index]
+    ]
+    body.append(len(errors))
+    for module_index in errors:
+        body.append(module_index)
+        body.append(min(status.count_missed_home[module_index], 255))
+        body.append(min(status.count_unexpected_home[module_index], 255))
+    return encode_frame(FRAME_STATUS, bytes(body))
+
+
+def encode_no_op():
+    return encode_frame(FRAME_NO_OP)
+
+
+def decode_init(body):
+    num_modules, flags = struct.unpack_from('<HB', body)
+    return num_modules, bool(flags & INIT_FLAG_SPARSE_UPDATE)
+
+
+def decode_move_echo(body):
+    return bytes(body).decode('utf-8')
+
+
+def decode_status(body, status):
+    # Fills in `status` from a status frame body. Returns False, leaving it unchanged, if the body is malformed.
+    num_modules = len(status)
+    if len(body) < num_modules + 1:
+        return False
+    module_bytes = body[:num_modules]
+    flaps = bytes(module_bytes).translate(_FLAP_FROM_BYTE)
+    if max(flaps, default=0) >= len(FLAPS):
+        return False
+
+    error_count = body[num_modules]
+    if len(body) != num_modules + 1 + 3 * error_count:
+        return False
+    error_offsets = range(num_modules + 1, len(body), 3)
+    if any(body[offset] >= num_modules for offset in error_offsets):
+        return False
+
+    status.states[:] = bytes(module_bytes).translate(_STATE_FROM_BYTE)
+    status.flaps[:] = flaps
+    for module_index in range(num_modules):
+        status.count_missed_home[module_index] = 0
+        status.count_unexpected_home[module_index] = 0
+    for offset in error_offsets:
+        module_index = body[offset]
+        status.count_missed_home[module_index] = body[offset + 1]
+        status.count_unexpected_home[module_index] = body[offset + 2]
+    return True
+
+
+# Splits a byte stream into frames. Bytes that can't be part of a valid frame (including frames with a bad CRC) are
+# skipped, so the decoder resynchronizes on the next sync byte.
+class FrameDecoder(object):
+    def __init__(self):
+        self._buffer = bytearray()
+        self._start = 0
+        self.dropped_bytes = 0
+
+    def feed(self, data):
+        # always move to a new buffer so that bodies already handed out stay valid
+        self._buffer = self._buffer[self._start:]
+        self._buffer += data
+        self._start = 0
+
+    def next_frame(self):
+        # Returns the next complete (frame type, body) pair, or None if more data is needed. The body is a memoryview
+        # into the decoder's buffer rather than a copy.
+        view = memoryview(self._buffer)
+        while True:
+            sync = self._buffer.find(FRAME_SYNC, self._start)
+            if sync < 0:
+                self.dropped_bytes += len(self._buffer) - self._start
+                self._start = len(self._buffer)
+                return None
+            self.dropped_bytes += sync - self._start
+            self._start = sync
+
+            if len(self._buffer) - self._start < _HEADER.size:
+                return None
+            _, length, frame_type = _HEADER.unpack_from(self._buffer, self._start)
+            if length > MAX_BODY_LENGTH:
+                self._skip_byte()
+                continue
+
+            end = self._start + _HEADER.size + length
+            if len(self._buffer) < end + 1:
+                return None
+
+            if crc8(view[self._start + 1:end]) != self._buffer[end]:
+                self._skip_byte()
+                continue
+
+            body = view[self._start + _HEADER.size:end]
+            self._start = end + 1
+            return frame_type, body
+
+    def _skip_byte(self):
+        self._start += 1
+        self.dropped_bytes += 1
+
@@ -0,0 +1,31 @@
+import asyncio
+
+
+# Fans values out to any number of asyncio subscribers. A subscriber only ever has the latest value waiting for it: a
+# newer value replaces one it hasn't consumed yet, so a slow subscriber skips ahead to the current state rather than
+# falling behind or holding up the publisher.
+class Broadcaster(object):
+    def __init__(self):
+        self._queues = set()
+        self.latest = None
+
+    def __len__(self):
+        return len(self._queues)
+
+    def publish(self, value):
+        self.latest = value
+        for queue in self._queues:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(value)
+
+    async def subscribe(self, replay_latest=False):
+        queue = asyncio.Queue(maxsize=1)
+        if replay_latest and self.latest is not None:
+            queue.put_nowait(self.latest)
+        self._queues.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._queues.discard(queue)
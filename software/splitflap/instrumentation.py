@@ -0,0 +1,237 @@
+import threading
+import time
+from collections import deque
+
+from splitflap import binary_protocol
+
+# Op codes of commands that the controller answers with a move_echo and then a status once it stops moving
+_MOVE_OP_CODES = {'%', '<', '=', '>', '?'}
+
+
+class Histogram(object):
+    # Log-linear buckets in the style of HdrHistogram: values are recorded as integer multiples of `unit`, and each
+    # power of two is split into 2**`sub_bucket_bits` linear buckets, so every value keeps about the same relative
+    # precision (~3% with the default of 5 bits) no matter its magnitude.
+    def __init__(self, unit=1e-6, sub_bucket_bits=5):
+        self._unit = unit
+        self._sub_bucket_bits = sub_bucket_bits
+        self._counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def _bucket(self, value):
+        shift = max(0, value.bit_length() - self._sub_bucket_bits - 1)
+        return (value >> shift) << shift, 1 << shift
+
+    def record(self, seconds):
+        value = max(0, int(seconds / self._unit))
+        lower, _ = self._bucket(value)
+        self._counts[lower] = self._counts.get(lower, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percentile):
+        if self.count == 0:
+            return None
+        target = self.count * percentile / 100.0
+        seen = 0
+        for lower in sorted(self._counts):
+            seen += self._counts[lower]
+            if seen >= target:
+                _, width = self._bucket(lower)
+                # report the middle of the bucket, clamped to what was actually recorded
+                value = (lower + (width - 1) / 2.0) * self._unit
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+
+class TransportMetrics(object):
+    HISTOGRAMS = ('readline_seconds', 'echo_latency_seconds', 'status_latency_seconds')
+    COUNTERS = ('bytes_read', 'bytes_written', 'lines_read', 'frames_read', 'commands_written')
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+        for histogram in self.HISTOGRAMS:
+            setattr(self, histogram, Histogram())
+
+
+# Tracks everything a transport reads and writes. Shared by the blocking and asyncio transport wrappers, which only
+# differ in how they call through to the transport they wrap.
+class _TransportRecorder(object):
+    def __init__(self, metrics):
+        self.metrics = metrics
+        # write times of commands still waiting for an echo, and of echoed commands still waiting for a status
+        self._awaiting_echo = deque()
+        self._awaiting_status = []
+        self._frame_decoder = None
+
+    def written(self, data, now):
+        with self.metrics.lock:
+            self.metrics.bytes_written += len(data.encode('utf-8'))
+            for command in data.split('\n'):
+                if len(command) == 0:
+                    continue
+                self.metrics.commands_written += 1
+                if command[0] in _MOVE_OP_CODES:
+                    self._awaiting_echo.append(now)
+                elif command[0] == '@':
+                    self._awaiting_status.append(now)
+
+    def line_read(self, line, started, now):
+        with self.metrics.lock:
+            self.metrics.bytes_read += len(line.encode('utf-8'))
+            self.metrics.lines_read += 1
+            self.metrics.readline_seconds.record(now - started)
+            # cheap checks rather than parsing the json again
+            if '"move_echo"' in line:
+                self._echoed(now)
+            elif '"status"' in line:
+                self._status(now)
+
+    def bytes_read(self, data, now):
+        with self.metrics.lock:
+            self.metrics.bytes_read += len(data)
+            if self._frame_decoder is None:
+                self._frame_decoder = binary_protocol.FrameDecoder()
+            self._frame_decoder.feed(data)
+            frame = self._frame_decoder.next_frame()
+            while frame is not None:
+                self.metrics.frames_read += 1
+                if frame[0] == binary_protocol.FRAME_MOVE_ECHO:
+                    self._echoed(now)
+                elif frame[0] == binary_protocol.FRAME_STATUS:
+                    self._status(now)
+                frame = self._frame_decoder.next_frame()
+
+    def _echoed(self, now):
+        if len(self._awaiting_echo) > 0:
+            written = self._awaiting_echo.popleft()
+            self.metrics.echo_latency_seconds.record(now - written)
+            self._awaiting_status.append(written)
+
+    def _status(self, now):
+        for written in self._awaiting_status:
+            self.metrics.status_latency_seconds.record(now - written)
+        self._awaiting_status = []
+
+
+def _hook_writes(transport, recorder):
+    # Transports with an on_write hook report everything they write, including what they send of their own accord,
+    # such as the status request on a reconnect. Writes to other transports are recorded as they're passed through.
+    if hasattr(transport, 'on_write'):
+        transport.on_write = lambda data: recorder.written(data, time.perf_counter())
+
+
+class InstrumentedTransport(object):
+    # Wraps a SerialTransport, EspLinkTransport or any other object with readline/write (and optionally read), recording
+    # traffic and latency into `metrics`.
+    def __init__(self, transport, metrics=None, name='splitflap'):
+        self._transport = transport
+        self.metrics = metrics if metrics is not None else TransportMetrics(name)
+        self._recorder = _TransportRecorder(self.metrics)
+        _hook_writes(transport, self._recorder)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._transport, name)
+
+    def readline(self):
+        started = time.perf_counter()
+        line = self._transport.readline()
+        self._recorder.line_read(line, started, time.perf_counter())
+        return line
+
+    def read(self):
+        data = self._transport.read()
+        self._recorder.bytes_read(data, time.perf_counter())
+        return data
+
+    def write(self, data):
+        if not hasattr(self._transport, 'on_write'):
+            self._recorder.written(data, time.perf_counter())
+        return self._transport.write(data)
+
+
+class AsyncInstrumentedTransport(object):
+    # The asyncio counterpart of InstrumentedTransport, for AsyncSerialTransport and AsyncEspLinkTransport
+    def __init__(self, transport, metrics=None, name='splitflap'):
+        self._transport = transport
+        self.metrics = metrics if metrics is not None else TransportMetrics(name)
+        self._recorder = _TransportRecorder(self.metrics)
+        _hook_writes(transport, self._recorder)
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._transport, name)
+
+    async def readline(self):
+        started = time.perf_counter()
+        line = await self._transport.readline()
+        self._recorder.line_read(line, started, time.perf_counter())
+        return line
+
+    async def write(self, data):
+        if not hasattr(self._transport, 'on_write'):
+            self._recorder.written(data, time.perf_counter())
+        return await self._transport.write(data)
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_prometheus(metrics_list, prefix='splitflap_transport'):
+    # Renders metrics in the Prometheus text exposition format. Histograms are exported as summaries, since the
+    # quantiles are already computed here.
+    lines = []
+    for counter in TransportMetrics.COUNTERS:
+        name = '{}_{}_total'.format(prefix, counter)
+        lines.append('# TYPE {} counter'.format(name))
+        for metrics in metrics_list:
+            with metrics.lock:
+                value = getattr(metrics, counter)
+            lines.append('{}{{controller="{}"}} {}'.format(name, _escape_label(metrics.name), value))
+
+    for histogram_name in TransportMetrics.HISTOGRAMS:
+        name = '{}_{}'.format(prefix, histogram_name)
+        lines.append('# TYPE {} summary'.format(name))
+        for metrics in metrics_list:
+            label = _escape_label(metrics.name)
+            with metrics.lock:
+                histogram = getattr(metrics, histogram_name)
+                for quantile in (0.5, 0.9, 0.99, 0.999):
+                    value = histogram.percentile(quantile * 100)
+                    lines.append('{}{{controller="{}",quantile="{}"}} {}'.format(
+                        name,
+                        label,
+                        quantile,
+                        'NaN' if value is None else '{:.6f}'.format(value),
+                    ))
+                lines.append('{}_sum{{controller="{}"}} {:.6f}'.format(name, label, histogram.sum))
+                lines.append('{}_count{{controller="{}"}} {}'.format(name, label, histogram.count))
+
+    return '\n'.join(lines) + '\n'
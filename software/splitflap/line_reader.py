@@ -0,0 +1,58 @@
+# Splits a byte stream into newline-terminated lines. Bytes are read in large chunks via `recv_into`, which is called
+# with a writable memoryview and must return the number of bytes written into it. Any bytes following the last complete
+# line are kept in the buffer for the next call to `readline`.
+class LineReader(object):
+    def __init__(self, recv_into, buffer_size=4096):
+        self._recv_into = recv_into
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        # unread data is self._buffer[self._start:self._end]; everything before self._scan has no newline
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+
+    def buffered(self):
+        return self._end - self._start
+
+    def readline(self):
+        while True:
+            eol = self._buffer.find(b'\n', self._scan, self._end)
+            if eol >= 0:
+                line = bytes(self._view[self._start:eol + 1])
+                self._start = eol + 1
+                self._scan = self._start
+                if self._start == self._end:
+                    self._start = self._end = self._scan = 0
+                return line
+
+            self._scan = self._end
+            self._fill()
+
+    def read(self):
+        # Returns whatever is buffered, or the next chunk received if nothing is
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+            self._fill()
+        data = bytes(self._view[self._start:self._end])
+        self._start = self._end = self._scan = 0
+        return data
+
+    def _fill(self):
+        if self._end == len(self._buffer):
+            if self._start > 0:
+                # slide the partial line to the front of the buffer
+                pending = self._end - self._start
+                self._buffer[0:pending] = self._view[self._start:self._end]
+                self._scan -= self._start
+                self._start = 0
+                self._end = pending
+            else:
+                # a single line is bigger than the buffer; grow it
+                self._view.release()
+                self._buffer.extend(bytes(len(self._buffer)))
+                self._view = memoryview(self._buffer)
+
+        count = self._recv_into(self._view[self._end:])
+        if count <= 0:
+            raise EOFError('stream closed with {} bytes buffered'.format(self.buffered()))
+        self._end += count
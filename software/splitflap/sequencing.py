@@ -0,0 +1,145 @@
+from splitflap.status import flap_index
+from splitflap.travel import steps_between, travel_predictor
+
+# Frames are put in the best possible order by trying every order (Held-Karp) up to this many, and by improving a
+# nearest-neighbour order beyond that
+EXACT_FRAME_LIMIT = 10
+
+_MAX_IMPROVEMENT_PASSES = 20
+
+
+def total_steps(texts, start_text=None, force_refresh=False):
+    # Motor steps taken by all the modules to show each of `texts` in turn, starting from `start_text` if it's known
+    total = 0
+    previous = start_text
+    for text in texts:
+        if previous is not None:
+            for from_flap, to_flap in zip(previous, text):
+                if force_refresh or from_flap != to_flap:
+                    total += steps_between(flap_index(from_flap), flap_index(to_flap))
+        previous = text
+    return total
+
+
+def total_travel_time(texts, start_text=None, force_refresh=False, predictor=None):
+    # Seconds spent waiting for the modules to settle on each of `texts` in turn
+    predictor = predictor or travel_predictor()
+    total = 0
+    previous = start_text
+    for text in texts:
+        if previous is not None:
+            total += predictor.settle_time(previous, text, force_refresh)
+        previous = text
+    return total
+
+
+def plan_sequence(texts, start_text=None, reorder=True, blank_hold=False, force_refresh=False, predictor=None):
+    # Picks the order to show `texts` in so that the modules spend as little time moving as they can, given that flaps
+    # only turn forwards. Unless `reorder` is set the texts keep their order. With `blank_hold`, a blank frame is also
+    # shown once, wherever it costs the least: modules that have to wrap round anyway pass the blank flap for free.
+    # Returns indexes into `texts`, with None for the blank frame.
+    if len(texts) == 0:
+        return [None] if blank_hold else []
+    predictor = predictor or travel_predictor()
+
+    frames = list(texts)
+    if blank_hold:
+        frames.append(' ' * len(frames[0]))
+    costs = [[predictor.settle_time(a, b, force_refresh) for b in frames] for a in frames]
+    if start_text is None:
+        start_costs = [0] * len(frames)
+    else:
+        start_costs = [predictor.settle_time(start_text, frame, force_refresh) for frame in frames]
+
+    if not reorder:
+        order = _place_frame(list(range(len(texts))), len(texts), costs, start_costs) if blank_hold \
+            else list(range(len(texts)))
+    elif len(frames) <= EXACT_FRAME_LIMIT:
+        order = _best_order(costs, start_costs)
+    else:
+        order = _improve_order(_nearest_neighbour_order(costs, start_costs), costs, start_costs)
+
+    return [None if index == len(texts) else index for index in order]
+
+
+def _path_cost(order, costs, start_costs):
+    if len(order) == 0:
+        return 0
+    return start_costs[order[0]] + sum(costs[a][b] for a, b in zip(order, order[1:]))
+
+
+def _place_frame(order, frame, costs, start_costs):
+    # Inserts `frame` into `order` where it adds the least, preferring later places when it's a tie
+    best_order = None
+    best_cost = None
+    for position in range(len(order), -1, -1):
+        candidate = order[:position] + [frame] + order[position:]
+        cost = _path_cost(candidate, costs, start_costs)
+        if best_cost is None or cost < best_cost:
+            best_order = candidate
+            best_cost = cost
+    return best_order
+
+
+def _best_order(costs, start_costs):
+    # Held-Karp: the cheapest path through every frame, found by working out the cheapest way to end on each frame
+    # having shown each subset of the frames
+    count = len(start_costs)
+    full = (1 << count) - 1
+    best = [[None] * count for _ in range(full + 1)]
+    previous = [[None] * count for _ in range(full + 1)]
+    for frame in range(count):
+        best[1 << frame][frame] = start_costs[frame]
+
+    for shown in range(1, full + 1):
+        for last in range(count):
+            cost = best[shown][last]
+            if cost is None:
+                continue
+            for frame in range(count):
+                if shown & (1 << frame):
+                    continue
+                next_shown = shown | (1 << frame)
+                next_cost = cost + costs[last][frame]
+                if best[next_shown][frame] is None or next_cost < best[next_shown][frame]:
+                    best[next_shown][frame] = next_cost
+                    previous[next_shown][frame] = last
+
+    last = min(range(count), key=lambda frame: best[full][frame])
+    order = []
+    shown = full
+    while last is not None:
+        order.append(last)
+        shown, last = shown & ~(1 << last), previous[shown][last]
+    order.reverse()
+    return order
+
+
+def _nearest_neighbour_order(costs, start_costs):
+    remaining = list(range(len(start_costs)))
+    order = []
+    current_costs = start_costs
+    while remaining:
+        frame = min(remaining, key=lambda candidate: current_costs[candidate])
+        remaining.remove(frame)
+        order.append(frame)
+        current_costs = costs[frame]
+    return order
+
+
+def _improve_order(order, costs, start_costs):
+    # Moves one frame at a time to wherever it makes the path cheapest, until no move helps
+    best_cost = _path_cost(order, costs, start_costs)
+    for _ in range(_MAX_IMPROVEMENT_PASSES):
+        improved = False
+        for frame in list(order):
+            rest = [other for other in order if other != frame]
+            candidate = _place_frame(rest, frame, costs, start_costs)
+            cost = _path_cost(candidate, costs, start_costs)
+            if cost < best_cost:
+                order = candidate
+                best_cost = cost
+                improved = True
+        if not improved:
+            break
+    return order
@@ -1,4 +1,12 @@
 import json
+import re
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from splitflap import binary_protocol
+from splitflap.status import SplitflapStatus, STATE_NORMAL, flap_index
+from splitflap.travel import travel_predictor
 
 _ALPHABET = {
     ' ',
@@ -21,6 +29,9 @@ def validate_text(text):
         )
 
 
+_STATUS_PREFIX = re.compile(r'\{\s*"type"\s*:\s*"status"')
+
+
 class SplitflapBase(object):
     def __init__(self):
         self._last_status = None
@@ -30,12 +41,37 @@ class SplitflapBase(object):
     def is_in_alphabet(self, letter):
         return is_in_alphabet(letter)
 
+    # noinspection PyMethodMayBeStatic
+    def get_alphabet(self):
+        return frozenset(_ALPHABET)
+
     def get_status(self):
         return self._last_status
 
     def get_num_modules(self):
         return self._num_modules
 
+    # Single-row displays; SplitflapWall overrides these for walls with several rows
+    def get_rows(self):
+        return 1
+
+    def get_columns(self):
+        return self.get_num_modules()
+
+    def get_text(self):
+        # The flaps the modules are on, as of the last status, or None before the first one
+        status = self.get_status()
+        if status is None:
+            return None
+        return ''.join(module['flap'] for module in status)
+
+    def estimate_travel_time(self, text, force_refresh):
+        # Seconds the modules are expected to take to show `text`, from the flaps they're on now
+        current_text = self.get_text()
+        if current_text is None:
+            return 0
+        return travel_predictor().settle_time(current_text, text, force_refresh)
+
     def set_text(self, text, force_refresh):
         pass
 
@@ -48,95 +84,414 @@ class MockSplitflap(SplitflapBase):
     def __init__(self, num_modules):
         super().__init__()
         self._num_modules = num_modules
-        self._last_status = []
-
-        for module_index in range(0, num_modules):
-            status = {
-                'state': 'normal',
-                'flap': ' ',
-                'count_missed_home': 0,
-                'count_unexpected_home': 0
-            }
-            self._last_status.append(status)
-
+        self._last_status = SplitflapStatus(num_modules)
 
     def set_text(self, text, force_refresh):
-        print(f'MockSplitflap.set_text (force={force_refresh}): {text}')
+        print(f'MockSplitflap.set_text (force={force_refresh}): {text}')
         validate_text(text)
 
         for module_index in range(0, self._num_modules):
             if len(text) > module_index:
-                self._last_status[module_index]['flap'] = text[module_index]
+                self._last_status.flaps[module_index] = flap_index(text[module_index])
 
         return self._last_status
 
+    def estimate_travel_time(self, text, force_refresh):
+        # the mock's flaps move instantly
+        return 0
+
     def recalibrate_all(self):
         return self._last_status
 
 
-class Splitflap(SplitflapBase):
-    def __init__(self, transport):
+class _ControllerSplitflap(SplitflapBase):
+    # Tracks the state of the line-oriented protocol spoken by the controller, independent of how lines are read.
+    def __init__(self):
         super().__init__()
-        self._transport = transport
 
         self._has_inited = False
         self._num_modules = 0
+        self._supports_sparse_update = False
         self._last_command = None
         self._last_status = None
-        self._exception = None
+        # reused to parse every status line, and copied once it's known to be valid
+        self._status_buffer = None
+        self._last_status_line = None
 
-        self._loop_for_status()
+        # Set once the controller has switched to binary frames
+        self._frame_decoder = None
+        self._no_op_count = 0
 
-    def _loop_for_status(self):
-        while True:
-            line = self._transport.readline()
-            line = line.lstrip('\0').rstrip('\n')
+        # The flap each module was last told to go to, or None if it has to be sent again
+        self._target_flaps = None
+
+        # Set when the transport reconnected to a controller without resetting it, so there won't be an init. The
+        # first status takes its place.
+        self._resuming = False
+
+        # The transport's reconnect_count as of the last status read
+        self._reconnect_count = 0
+
+    def _is_resync_status(self, status):
+        # The first status read after the transport reconnects answers the status request it sent on reconnecting, not
+        # any command, and may have been sent mid-move. It's still the latest status, but mustn't complete a command.
+        if status is None:
+            return False
+        reconnect_count = getattr(self._transport, 'reconnect_count', 0)
+        if reconnect_count == self._reconnect_count:
+            return False
+        self._reconnect_count = reconnect_count
+        return True
+
+    def _handle_line(self, line):
+        line = line.lstrip('\0').rstrip('\n')
+        if self._has_inited and _STATUS_PREFIX.match(line):
+            if line == self._last_status_line:
+                # polling mostly returns the same status; nothing has changed so skip parsing it again
+                self._update_target_flaps(self._last_status)
+                return self._last_status
+            if self._status_buffer.parse(line):
+                self._last_status_line = line
+                return self._set_status(self._status_buffer)
+
+        # anything else is infrequent enough to go through json
+        try:
             data = json.loads(line)
-            t = data['type']
-            if t == 'init':
-                if self._has_inited:
-                    raise RuntimeError('Unexpected re-init!')
-                self._has_inited = True
-                self._num_modules = data['num_modules']
-            elif t == 'move_echo':
-                if not self._has_inited:
-                    raise RuntimeError('Got move_echo before init!')
-                if self._last_command is None:
-                    raise RuntimeError('Unexpected move_echo response from controller')
-                if self._last_command != data['dest']:
-                    raise RuntimeError('Bad response from controller. Expected {!r} but got {!r}'.format(
-                        self._last_command,
-                        data['dest'],
-                    ))
-            elif t == 'status':
-                if not self._has_inited:
+        except ValueError:
+            if self._resuming and not self._has_inited:
+                # joined the connection part way through a line
+                return None
+            raise
+        t = data['type']
+        if t == 'init':
+            self._handle_init(data['num_modules'], data.get('sparse_update', False))
+        elif t == 'move_echo':
+            if not self._has_inited:
+                if self._resuming:
+                    return None
+                raise RuntimeError('Got move_echo before init!')
+            self._check_move_echo(data['dest'])
+        elif t == 'status':
+            if not self._has_inited:
+                if not self._resuming:
                     raise RuntimeError('Got status before init!')
-                if len(data['modules']) != self._num_modules:
-                    raise RuntimeError('Wrong number of modules in status update. Expected {} but got {}'.format(
-                        self._num_modules,
-                        len(data['modules']),
-                    ))
-                self._last_status = data['modules']
-                return self._last_status
-            elif t == 'no_op':
-                pass
-            else:
-                raise RuntimeError('Unexpected message: {!r}'.format(data))
+                # the controller's capabilities were only in the init, so stick to full updates
+                self._handle_init(len(data['modules']), False)
+            if len(data['modules']) != self._num_modules:
+                raise RuntimeError('Wrong number of modules in status update. Expected {} but got {}'.format(
+                    self._num_modules,
+                    len(data['modules']),
+                ))
+            self._status_buffer.update_from_dicts(data['modules'])
+            self._last_status_line = line
+            return self._set_status(self._status_buffer)
+        elif t == 'no_op':
+            self._no_op_count += 1
+        elif t == 'protocol':
+            if data['protocol'] != 'binary':
+                raise RuntimeError('Unexpected protocol: {!r}'.format(data['protocol']))
+            self._frame_decoder = binary_protocol.FrameDecoder()
+        else:
+            raise RuntimeError('Unexpected message: {!r}'.format(data))
+        return None
+
+    def _handle_init(self, num_modules, sparse_update):
+        if self._has_inited:
+            raise RuntimeError('Unexpected re-init!')
+        self._has_inited = True
+        self._num_modules = num_modules
+        self._status_buffer = SplitflapStatus(self._num_modules)
+        self._supports_sparse_update = sparse_update
+
+    def _handle_frame(self, frame_type, body):
+        if frame_type == binary_protocol.FRAME_INIT:
+            self._handle_init(*binary_protocol.decode_init(body))
+        elif frame_type == binary_protocol.FRAME_MOVE_ECHO:
+            if not self._has_inited:
+                raise RuntimeError('Got move_echo before init!')
+            self._check_move_echo(binary_protocol.decode_move_echo(body))
+        elif frame_type == binary_protocol.FRAME_STATUS:
+            if not self._has_inited:
+                raise RuntimeError('Got status before init!')
+            if not binary_protocol.decode_status(body, self._status_buffer):
+                raise RuntimeError('Malformed status frame for {} modules: {!r}'.format(
+                    self._num_modules,
+                    bytes(body),
+                ))
+            return self._set_status(self._status_buffer)
+        elif frame_type == binary_protocol.FRAME_NO_OP:
+            self._no_op_count += 1
+        else:
+            raise RuntimeError('Unexpected frame type: {!r}'.format(frame_type))
+        return None
 
-    def _change_text(self, op_code, text):
+    def _check_move_echo(self, dest):
+        if self._last_command is None:
+            raise RuntimeError('Unexpected move_echo response from controller')
+        if self._last_command != dest:
+            raise RuntimeError('Bad response from controller. Expected {!r} but got {!r}'.format(
+                self._last_command,
+                dest,
+            ))
+
+    def _set_status(self, status):
+        self._last_status = status.copy()
+        self._update_target_flaps(self._last_status)
+        return self._last_status
+
+    def _update_target_flaps(self, status):
+        if self._target_flaps is None:
+            self._target_flaps = list(status.text())
+
+        if status.states.count(STATE_NORMAL) == len(status.states):
+            return
+        for module_index, state in enumerate(status.states):
+            if state != STATE_NORMAL:
+                # the module has lost track of its position, so make sure it's sent its flap again
+                self._target_flaps[module_index] = None
+
+    def _encode_set_text(self, text, force_refresh):
+        # Returns the command line to send, or None if every module is already headed to the requested flap (in which
+        # case the controller wouldn't move, and so would never send a status).
         validate_text(text)
 
-        self._last_command = text
-        self._transport.write('{}{}\n'.format(op_code, text))
+        if force_refresh or self._target_flaps is None:
+            op_code = '='
+            payload = text
+        else:
+            changed = [
+                module_index
+                for module_index, letter in enumerate(text[:self._num_modules])
+                if letter != self._target_flaps[module_index]
+            ]
+            if len(changed) == 0:
+                return None
 
-        return self._loop_for_status()
+            if self._supports_sparse_update and 3 * len(changed) < len(text):
+                op_code = '%'
+                payload = ''.join('{:02x}{}'.format(module_index, text[module_index]) for module_index in changed)
+            else:
+                op_code = '<'
+                payload = text
 
-    def set_text(self, text, force_refresh):
-        if force_refresh:
-            return self._change_text('=', text)
+        if self._target_flaps is not None:
+            for module_index, letter in enumerate(text[:self._num_modules]):
+                self._target_flaps[module_index] = letter
+
+        self._last_command = payload
+        return '{}{}\n'.format(op_code, payload)
+
+
+def _chain_future(source, target):
+    # Resolves `target` with whatever `source` resolves with
+    def copy(future):
+        if future.exception() is not None:
+            target.set_exception(future.exception())
         else:
-            return self._change_text('+', text)
+            target.set_result(future.result())
+    source.add_done_callback(copy)
+
+
+class PendingCommand(object):
+    # A pipelined command. `accepted` resolves when the controller echoes the command back; `done` resolves with the
+    # status sent once the controller has finished moving.
+    def __init__(self, sequence, text):
+        self.sequence = sequence
+        self.text = text
+        self.accepted = Future()
+        self.done = Future()
+
+
+class Splitflap(_ControllerSplitflap):
+    def __init__(self, transport, background_reader=False, max_in_flight=4, use_binary_protocol=False):
+        super().__init__()
+        self._transport = transport
+
+        # Only used with the background reader. Every status parsed by the reader thread bumps _status_count and
+        # notifies _status_condition, which also guards the protocol state.
+        self._status_condition = threading.Condition()
+        self._status_count = 0
+        self._status_callbacks = []
+        self._reader_thread = None
+        self._reader_exception = None
+
+        # Commands written but not yet completed by a status, oldest first. Only used with the background reader.
+        self._max_in_flight = max_in_flight
+        self._in_flight = deque()
+        self._command_sequence = 0
+
+        self._resuming = getattr(transport, 'resumed', False)
+        self._reconnect_count = getattr(transport, 'reconnect_count', 0)
+        self._loop_for_status()
+        if use_binary_protocol:
+            self._negotiate_binary_protocol()
+
+        if background_reader:
+            self._reader_thread = threading.Thread(target=self._read_loop, name='splitflap-reader', daemon=True)
+            self._reader_thread.start()
+
+    def _negotiate_binary_protocol(self):
+        # Controllers without binary framing treat the command as a no-op
+        no_op_count = self._no_op_count
+        self._transport.write('B\n')
+        while self._frame_decoder is None and self._no_op_count == no_op_count:
+            self._handle_line(self._transport.readline())
+
+    def is_binary_protocol(self):
+        return self._frame_decoder is not None
+
+    def _read_message(self):
+        # Blocks until a whole line (or frame, once the binary protocol is in use) has arrived
+        if self._frame_decoder is None:
+            return self._transport.readline()
+
+        frame = self._frame_decoder.next_frame()
+        while frame is None:
+            self._frame_decoder.feed(self._transport.read())
+            frame = self._frame_decoder.next_frame()
+        return frame
+
+    def _handle_message(self, message):
+        # Returns the new status if the message was a status update
+        if isinstance(message, str):
+            return self._handle_line(message)
+        return self._handle_frame(*message)
+
+    def get_status(self):
+        with self._status_condition:
+            return self._last_status
+
+    def add_status_callback(self, callback):
+        with self._status_condition:
+            self._status_callbacks.append(callback)
+
+    def remove_status_callback(self, callback):
+        with self._status_condition:
+            self._status_callbacks.remove(callback)
+
+    def _read_loop(self):
+        try:
+            while True:
+                message = self._read_message()
+                with self._status_condition:
+                    status = self._handle_message(message)
+                    if status is None:
+                        continue
+                    if self._is_resync_status(status):
+                        completed = []
+                    else:
+                        self._status_count += 1
+                        completed = self._complete_in_flight(status)
+                    self._status_condition.notify_all()
+                    callbacks = list(self._status_callbacks)
+
+                for command in completed:
+                    command.done.set_result(status)
+
+                for callback in callbacks:
+                    callback(status)
+        except Exception as e:
+            with self._status_condition:
+                self._reader_exception = e
+                failed = list(self._in_flight)
+                self._in_flight.clear()
+                self._status_condition.notify_all()
+
+            for command in failed:
+                if not command.accepted.done():
+                    command.accepted.set_exception(e)
+                command.done.set_exception(e)
+
+    def _check_move_echo(self, dest):
+        if self._reader_thread is None:
+            return super()._check_move_echo(dest)
+
+        # echoes come back in the order the commands were written
+        for command in self._in_flight:
+            if not command.accepted.done():
+                if command.text != dest:
+                    raise RuntimeError('Bad response from controller for command {}. Expected {!r} but got {!r}'.format(
+                        command.sequence,
+                        command.text,
+                        dest,
+                    ))
+                command.accepted.set_result(dest)
+                return
+        raise RuntimeError('Unexpected move_echo response from controller')
+
+    def _complete_in_flight(self, status):
+        # The controller only reports status once every module has stopped, and only reads new commands while idle,
+        # so a status completes every command it has echoed so far.
+        completed = []
+        while len(self._in_flight) > 0 and self._in_flight[0].accepted.done():
+            completed.append(self._in_flight.popleft())
+        return completed
+
+    def _wait_for_status(self, after_count):
+        with self._status_condition:
+            while self._status_count <= after_count:
+                if self._reader_exception is not None:
+                    raise RuntimeError('Splitflap reader thread failed') from self._reader_exception
+                self._status_condition.wait()
+            return self._last_status
+
+    def _loop_for_status(self):
+        while True:
+            status = self._handle_message(self._read_message())
+            if status is not None and not self._is_resync_status(status):
+                return status
+
+    def _send_command(self, command):
+        if self._reader_thread is None:
+            self._transport.write(command)
+            return self._loop_for_status()
+
+        with self._status_condition:
+            status_count = self._status_count
+            self._transport.write(command)
+        return self._wait_for_status(status_count)
+
+    def _submit(self, text, force_refresh):
+        with self._status_condition:
+            while True:
+                if self._reader_exception is not None:
+                    raise RuntimeError('Splitflap reader thread failed') from self._reader_exception
+                if len(self._in_flight) < self._max_in_flight:
+                    break
+                self._status_condition.wait()
+
+            line = self._encode_set_text(text, force_refresh)
+            self._command_sequence += 1
+            if line is None:
+                # Nothing to move, so there won't be an echo or status of its own to wait for. The flaps only show the
+                # text once the commands still in flight have finished, so it completes along with the last of them.
+                command = PendingCommand(self._command_sequence, text)
+                if len(self._in_flight) > 0:
+                    _chain_future(self._in_flight[-1].accepted, command.accepted)
+                    _chain_future(self._in_flight[-1].done, command.done)
+                else:
+                    command.accepted.set_result(text)
+                    command.done.set_result(self._last_status)
+                return command
+
+            command = PendingCommand(self._command_sequence, self._last_command)
+            self._in_flight.append(command)
+            self._transport.write(line)
+            return command
+
+    def submit_text(self, text, force_refresh):
+        if self._reader_thread is None:
+            raise RuntimeError('Pipelined commands require the background reader')
+        return self._submit(text, force_refresh)
+
+    def set_text(self, text, force_refresh):
+        if self._reader_thread is not None:
+            return self._submit(text, force_refresh).done.result()
+
+        line = self._encode_set_text(text, force_refresh)
+        if line is None:
+            return self._last_status
+        return self._send_command(line)
 
     def recalibrate_all(self):
-        self._transport.write('@')
-        return self._loop_for_status()
+        return self._send_command('@\n')
@@ -0,0 +1,181 @@
+import re
+from array import array
+from itertools import repeat
+from operator import getitem
+
+# Matches the firmware's flap order (`flaps` in arduino/splitflap/splitflap.ino)
+FLAPS = [
+    ' ',
+    'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm',
+    'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z',
+    '0', '1', '2', '3', '4', '5', '6', '7', '8', '9',
+    '.',
+    ',',
+    '\'',
+]
+_FLAP_INDEX = {flap: index for index, flap in enumerate(FLAPS)}
+
+STATE_NORMAL = 0
+STATE_LOOK_FOR_HOME = 1
+STATE_SENSOR_ERROR = 2
+STATE_PANIC = 3
+STATE_NAMES = ['normal', 'look_for_home', 'sensor_error', 'panic']
+_STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+_MODULE_KEYS = ('state', 'flap', 'count_missed_home', 'count_unexpected_home')
+
+# Matches one module in a status line, as formatted by dump_status() in the firmware
+_MODULE_PATTERN = re.compile(
+    r'"state":"(\w+)", "flap":"(.)", "count_missed_home":(\d+), "count_unexpected_home":(\d+)'
+)
+
+# Translates flap characters to flap indexes in a single pass; anything that isn't a flap becomes 255
+_FLAP_TABLE = bytearray([255] * 256)
+for _index, _flap in enumerate(FLAPS):
+    _FLAP_TABLE[ord(_flap)] = _index
+_FLAP_TABLE = bytes(_FLAP_TABLE)
+
+# Splits a status line just before each module's flap, so that every part after the first starts with one
+_FLAP_PREFIX = '"flap":"'
+_FLAP_SLICE = slice(None, 1)
+_AFTER_FLAP_SLICE = slice(1, None)
+
+
+def flap_index(flap):
+    return _FLAP_INDEX[flap]
+
+
+# Status of every module attached to a controller, stored as one small integer per field per module rather than as a
+# dict per module. Indexing returns a ModuleStatus view that behaves like the dicts the controller sends.
+class SplitflapStatus(object):
+    __slots__ = ('states', 'flaps', 'count_missed_home', 'count_unexpected_home', '_line_layout')
+
+    def __init__(self, num_modules):
+        self.states = bytearray(num_modules)
+        self.flaps = bytearray(num_modules)
+        self.count_missed_home = array('H', bytes(2 * num_modules))
+        self.count_unexpected_home = array('H', bytes(2 * num_modules))
+        # Everything but the flaps in the last line parsed, and the fields parsed from it. See parse().
+        self._line_layout = None
+
+    def __len__(self):
+        return len(self.states)
+
+    def __getitem__(self, module_index):
+        if not -len(self.states) <= module_index < len(self.states):
+            raise IndexError('module index out of range')
+        return ModuleStatus(self, module_index % len(self.states))
+
+    def __iter__(self):
+        for module_index in range(len(self.states)):
+            yield ModuleStatus(self, module_index)
+
+    def __repr__(self):
+        return 'SplitflapStatus({!r})'.format(self.to_dicts())
+
+    def copy(self):
+        status = SplitflapStatus.__new__(SplitflapStatus)
+        status.states = bytearray(self.states)
+        status.flaps = bytearray(self.flaps)
+        status.count_missed_home = array('H', self.count_missed_home)
+        status.count_unexpected_home = array('H', self.count_unexpected_home)
+        status._line_layout = None
+        return status
+
+    def text(self):
+        return ''.join([FLAPS[flap] for flap in self.flaps])
+
+    def to_dicts(self):
+        return [module.to_dict() for module in self]
+
+    def parse(self, line):
+        # Fills in this status from a firmware status line. Returns False, leaving the status unchanged, if the line
+        # doesn't contain exactly one well-formed entry per module.
+        #
+        # While modules are moving, usually only their flaps change from one status to the next. So the line is split
+        # around the flaps, and if everything else matches the last line parsed, only the flaps are read.
+        parts = line.split(_FLAP_PREFIX)
+        if len(parts) != len(self.states) + 1:
+            return False
+        flaps = ''.join(map(getitem, parts[1:], repeat(_FLAP_SLICE)))
+        if len(flaps) != len(self.states):
+            return False
+        flaps = flaps.encode('latin-1', 'replace').translate(_FLAP_TABLE)
+        if 255 in flaps:
+            return False
+        layout = [parts[0]]
+        layout.extend(map(getitem, parts[1:], repeat(_AFTER_FLAP_SLICE)))
+
+        if self._line_layout is not None and self._line_layout[0] == layout:
+            _, states, count_missed_home, count_unexpected_home = self._line_layout
+        else:
+            matches = _MODULE_PATTERN.findall(line)
+            if len(matches) != len(self.states) or len(matches) == 0:
+                return False
+
+            states, _, count_missed_home, count_unexpected_home = zip(*matches)
+            try:
+                states = bytes(map(_STATE_CODES.__getitem__, states))
+            except KeyError:
+                return False
+            count_missed_home = array('H', map(int, count_missed_home))
+            count_unexpected_home = array('H', map(int, count_unexpected_home))
+            self._line_layout = (layout, states, count_missed_home, count_unexpected_home)
+
+        self.states[:] = states
+        self.flaps[:] = flaps
+        self.count_missed_home[:] = count_missed_home
+        self.count_unexpected_home[:] = count_unexpected_home
+        return True
+
+    def update_from_dicts(self, modules):
+        for module_index, module in enumerate(modules):
+            self.states[module_index] = _STATE_CODES[module['state']]
+            self.flaps[module_index] = _FLAP_INDEX[module['flap']]
+            self.count_missed_home[module_index] = module['count_missed_home']
+            self.count_unexpected_home[module_index] = module['count_unexpected_home']
+
+
+# Read-only, dict-like view of a single module within a SplitflapStatus
+class ModuleStatus(object):
+    __slots__ = ('_status', '_index')
+
+    def __init__(self, status, module_index):
+        self._status = status
+        self._index = module_index
+
+    def __getitem__(self, key):
+        if key == 'state':
+            return STATE_NAMES[self._status.states[self._index]]
+        elif key == 'flap':
+            return FLAPS[self._status.flaps[self._index]]
+        elif key == 'count_missed_home':
+            return self._status.count_missed_home[self._index]
+        elif key == 'count_unexpected_home':
+            return self._status.count_unexpected_home[self._index]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in _MODULE_KEYS
+
+    def __iter__(self):
+        return iter(_MODULE_KEYS)
+
+    def __eq__(self, other):
+        if isinstance(other, (ModuleStatus, dict)):
+            return self.to_dict() == {key: other[key] for key in other}
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def keys(self):
+        return _MODULE_KEYS
+
+    def get(self, key, default=None):
+        if key in _MODULE_KEYS:
+            return self[key]
+        return default
+
+    def to_dict(self):
+        return {key: self[key] for key in _MODULE_KEYS}
@@ -1,13 +1,60 @@
 import serial
 
 import socket
+import threading
 import requests
 
+from splitflap.line_reader import LineReader
+
+# Idle seconds before the first keep-alive probe, seconds between probes, and unanswered probes before the connection is
+# considered dead
+KEEPALIVE_IDLE = 10
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_COUNT = 3
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def http_session():
+    # One requests.Session shared by every ESP-Link transport, so reset calls reuse pooled HTTP connections instead of
+    # making a new one each time
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=16)
+            _http_session.mount('http://', adapter)
+        return _http_session
+
+
+def configure_socket(sock):
+    # Commands are tiny, so send them right away rather than waiting to coalesce them, and use TCP keep-alive to notice
+    # an ESP-Link that has gone away while we're idle
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # the keep-alive timings aren't available on every platform
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, KEEPALIVE_IDLE)
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL)
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_COUNT)
+
+
+def reset_url(host, http_port=80):
+    if http_port == 80:
+        return f'http://{host}/console/reset'
+    return f'http://{host}:{http_port}/console/reset'
+
+
 class SerialTransport(object):
     def __init__(self, device, baud_rate):
         self._serial = None
         self._device = device
         self._baud_rate = baud_rate
+        # called with everything written, before it's sent
+        self.on_write = None
 
     def __enter__(self):
         self.open()
@@ -26,14 +73,32 @@ class SerialTransport(object):
     def readline(self):
         return self._serial.readline().decode('utf-8')
 
+    def read(self):
+        return self._serial.read(max(1, self._serial.in_waiting))
+
     def write(self, data):
+        if self.on_write is not None:
+            self.on_write(data)
         return self._serial.write(data.encode('utf-8'))
 
 
 class EspLinkTransport(object):
-    def __init__(self, host):
+    def __init__(self, host, port=23, http_port=80):
         self._socket = None
         self._host = host
+        self._port = port
+        self._http_port = http_port
+        self._reader = LineReader(self._recv_into)
+        # Held for every write, and while reconnecting, so that the status request sent by the reader thread on a
+        # reconnect can't interleave with, or be overtaken by, a command written from another thread
+        self._write_lock = threading.Lock()
+        # called with everything written, before it's sent, including the status requests sent on a reconnect
+        self.on_write = None
+        # Times the reader has reconnected. Each reconnect asks for a status that answers no command, which a
+        # Splitflap can tell apart by this count having moved on since the last status it read.
+        self.reconnect_count = 0
+        # True if the last open() picked up a controller that had already inited instead of resetting it
+        self.resumed = False
 
     def __enter__(self):
         self.open()
@@ -43,10 +108,16 @@ class EspLinkTransport(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._socket.close()
 
-    def open(self):
+    def open(self, reset=True):
+        # Without a reset, the controller keeps its state and doesn't send init again. Ask it for a status instead so
+        # that a Splitflap can resume from there.
         self._open_socket()
 
-        requests.post(f'http://{self._host}/console/reset')
+        self.resumed = not reset
+        if reset:
+            http_session().post(reset_url(self._host, self._http_port))
+        else:
+            self.write('A\n')
 
     def close(self):
         if self._socket is not None:
@@ -55,25 +126,32 @@ class EspLinkTransport(object):
     def _open_socket(self):
         self.close()
 
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.connect((self._host, 23))
+        self._socket = socket.create_connection((self._host, self._port))
+        configure_socket(self._socket)
 
-    def readline(self):
-        line_buf = ''
-        eol = False
-        while not eol:
-            byte_buf = self._socket.recv(1)
-            if len(byte_buf) == 0:
+    def _recv_into(self, buf):
+        count = self._socket.recv_into(buf)
+        if count == 0:
+            # the connection dropped; anything already buffered is kept by the reader. The controller is still running,
+            # so don't reset it, but ask for a status in case one was sent while we were disconnected.
+            with self._write_lock:
                 self._open_socket()
-                byte_buf = self._socket.recv(1)
+                if self.on_write is not None:
+                    self.on_write('A\n')
+                self._socket.sendall(b'A\n')
+                self.reconnect_count += 1
+            count = self._socket.recv_into(buf)
+        return count
 
-            char_buf = byte_buf.decode('utf-8')
-            line_buf += char_buf
-            if char_buf[0] == '\n':
-                eol = True
+    def readline(self):
+        return self._reader.readline().decode('utf-8')
 
-        return line_buf
+    def read(self):
+        return self._reader.read()
 
     def write(self, string):
         byte_buf = string.encode('utf-8')
-        self._socket.send(byte_buf)
+        with self._write_lock:
+            if self.on_write is not None:
+                self.on_write(string)
+            self._socket.sendall(byte_buf)
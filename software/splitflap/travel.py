@@ -0,0 +1,90 @@
+import threading
+
+from splitflap.acceleration import ACCEL_STEP_PERIODS
+from splitflap.status import FLAPS, flap_index
+
+# Match arduino/splitflap/splitflap_module.h
+STEPS_PER_MOTOR_REVOLUTION = 32
+_GEAR_RATIO_INPUT = 128
+_GEAR_RATIO_OUTPUT = 2
+GEAR_RATIO_INPUT_STEPS = STEPS_PER_MOTOR_REVOLUTION * _GEAR_RATIO_INPUT
+GEAR_RATIO_OUTPUT_FLAPS = _GEAR_RATIO_OUTPUT * len(FLAPS)
+
+_predictor = None
+_predictor_lock = threading.Lock()
+
+
+def steps_between(from_flap_index, to_flap_index):
+    # Motor steps from resting on one flap to resting on another, as worked out by the firmware's
+    # GetTargetStepForFlapIndex(). Flaps only turn one way, so going to the same flap is a full revolution.
+    num_flaps = len(FLAPS)
+    if to_flap_index > from_flap_index:
+        delta_flaps = to_flap_index - from_flap_index
+    else:
+        delta_flaps = num_flaps + to_flap_index - from_flap_index
+
+    # a module at rest sits on the first step of its flap, rounding up
+    def first_step(flap):
+        return -(-flap * GEAR_RATIO_INPUT_STEPS // GEAR_RATIO_OUTPUT_FLAPS)
+
+    return first_step(from_flap_index + delta_flaps) - first_step(from_flap_index)
+
+
+def move_micros(steps, periods=ACCEL_STEP_PERIODS):
+    # Microseconds from starting a move of `steps` steps at rest until the module has stopped again, following the
+    # firmware's SplitflapModule::Update(): each update moves the speed one entry towards the lower of the steps left
+    # and the top speed, steps if the speed isn't zero, and waits for the period at the new speed
+    max_speed = len(periods) - 1
+    speed = 0
+    elapsed = 0
+    while True:
+        target_speed = min(steps, max_speed)
+        if speed < target_speed:
+            speed += 1
+        elif speed > target_speed:
+            speed -= 1
+        if speed == 0:
+            return elapsed
+        elapsed += periods[speed]
+        steps = max(steps - 1, 0)
+
+
+# Predicts how long modules take to move between flaps, from a table of the move time between every pair of flaps
+# worked out up front from the acceleration table and gear ratio
+class TravelTimePredictor(object):
+    def __init__(self, periods=ACCEL_STEP_PERIODS):
+        move_times = {}
+        self._table = []
+        for from_index in range(len(FLAPS)):
+            row = []
+            for to_index in range(len(FLAPS)):
+                steps = steps_between(from_index, to_index)
+                if steps not in move_times:
+                    move_times[steps] = move_micros(steps, periods)
+                row.append(move_times[steps])
+            self._table.append(row)
+
+    def flap_micros(self, from_flap, to_flap):
+        return self._table[flap_index(from_flap)][flap_index(to_flap)]
+
+    def module_times(self, from_text, to_text, force_refresh=False):
+        # Seconds each module takes to go from showing `from_text` to `to_text`. Modules already showing their flap
+        # don't move unless the refresh is forced, in which case they go all the way round.
+        return [
+            self._table[flap_index(from_flap)][flap_index(to_flap)] / 1000000.0
+            if force_refresh or from_flap != to_flap else 0
+            for from_flap, to_flap in zip(from_text, to_text)
+        ]
+
+    def settle_time(self, from_text, to_text, force_refresh=False):
+        # Seconds until the whole display is showing `to_text`
+        return max(self.module_times(from_text, to_text, force_refresh), default=0)
+
+
+def travel_predictor():
+    # A TravelTimePredictor for the firmware's acceleration table, shared so that its table is only worked out once
+    global _predictor
+    with _predictor_lock:
+        if _predictor is None:
+            _predictor = TravelTimePredictor()
+        return _predictor
@@ -0,0 +1,137 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from splitflap.splitflap import SplitflapBase
+
+
+class _SplitflapWallBase(SplitflapBase):
+    # Maps a logical grid of `rows` x `columns` modules, in row-major order, onto the modules of several controllers.
+    # `layout` gives the (controller index, module index) of each logical position; by default positions fill each
+    # controller in turn.
+    def __init__(self, splitflaps, rows, columns, layout=None):
+        super().__init__()
+        self._splitflaps = list(splitflaps)
+        self._rows = rows
+        self._columns = columns
+        self._num_modules = rows * columns
+
+        if layout is None:
+            layout = [
+                (controller_index, module_index)
+                for controller_index, splitflap in enumerate(self._splitflaps)
+                for module_index in range(splitflap.get_num_modules())
+            ][:self._num_modules]
+        if len(layout) != self._num_modules:
+            raise ValueError('Layout has {} positions but the wall is {}x{}'.format(len(layout), rows, columns))
+        for controller_index, module_index in layout:
+            if not 0 <= module_index < self._splitflaps[controller_index].get_num_modules():
+                raise ValueError('Controller {} has no module {}'.format(controller_index, module_index))
+        self._layout = layout
+
+        # modules the layout doesn't use are left showing whatever they were last sent
+        self._controller_text = []
+        for splitflap in self._splitflaps:
+            status = splitflap.get_status()
+            if status is not None:
+                self._controller_text.append([module['flap'] for module in status])
+            else:
+                self._controller_text.append([' '] * splitflap.get_num_modules())
+
+    def get_rows(self):
+        return self._rows
+
+    def get_columns(self):
+        return self._columns
+
+    def get_splitflaps(self):
+        return self._splitflaps
+
+    def get_status(self):
+        controller_statuses = [splitflap.get_status() for splitflap in self._splitflaps]
+        if any(status is None for status in controller_statuses):
+            return None
+        return [
+            controller_statuses[controller_index][module_index]
+            for controller_index, module_index in self._layout
+        ]
+
+    def _split_text(self, text):
+        text = text.ljust(self._num_modules)
+        if len(text) > self._num_modules:
+            raise ValueError('Text is longer than the {} modules in the wall'.format(self._num_modules))
+
+        for (controller_index, module_index), letter in zip(self._layout, text):
+            self._controller_text[controller_index][module_index] = letter
+        return [''.join(controller_text) for controller_text in self._controller_text]
+
+
+class SplitflapWall(_SplitflapWallBase):
+    # Drives each controller from its own worker thread, so a wall update takes as long as the slowest controller.
+    def __init__(self, splitflaps, rows, columns, layout=None):
+        super().__init__(splitflaps, rows, columns, layout)
+        self._executor = ThreadPoolExecutor(max_workers=len(self._splitflaps), thread_name_prefix='splitflap-wall')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def set_text(self, text, force_refresh):
+        texts = self._split_text(text)
+        list(self._executor.map(
+            lambda splitflap, controller_text: splitflap.set_text(controller_text, force_refresh),
+            self._splitflaps,
+            texts,
+        ))
+        return self.get_status()
+
+    def recalibrate_all(self):
+        list(self._executor.map(lambda splitflap: splitflap.recalibrate_all(), self._splitflaps))
+        return self.get_status()
+
+
+class AsyncSplitflapWall(_SplitflapWallBase):
+    # The asyncio counterpart of SplitflapWall, for AsyncSplitflap controllers. Construct it after the controllers have
+    # been started so that their module counts are known.
+    async def start(self):
+        return self
+
+    async def stop(self):
+        await asyncio.gather(*[splitflap.stop() for splitflap in self._splitflaps])
+
+    async def status_updates(self):
+        # The wall's status whenever any of its controllers reports a new one. Updates that arrive while the subscriber
+        # is busy are merged into the next status it gets.
+        changed = asyncio.Event()
+
+        async def watch(splitflap):
+            async for _ in splitflap.status_updates():
+                changed.set()
+
+        watch_tasks = [asyncio.ensure_future(watch(splitflap)) for splitflap in self._splitflaps]
+        try:
+            while True:
+                await changed.wait()
+                changed.clear()
+                status = self.get_status()
+                if status is not None:
+                    yield status
+        finally:
+            for task in watch_tasks:
+                task.cancel()
+
+    async def set_text(self, text, force_refresh):
+        texts = self._split_text(text)
+        await asyncio.gather(*[
+            splitflap.set_text(controller_text, force_refresh)
+            for splitflap, controller_text in zip(self._splitflaps, texts)
+        ])
+        return self.get_status()
+
+    async def recalibrate_all(self):
+        await asyncio.gather(*[splitflap.recalibrate_all() for splitflap in self._splitflaps])
+        return self.get_status()
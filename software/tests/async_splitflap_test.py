@@ -0,0 +1,124 @@
+import asyncio
+import json
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.async_splitflap import AsyncSplitflap
+from tests.mock_controller import AsyncMockControllerTransport
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+# See splitflap_test._ReconnectingTransport
+class _AsyncReconnectingTransport(AsyncMockControllerTransport):
+    def __init__(self, num_modules, move_delay):
+        super().__init__(num_modules, move_delay)
+        self.reconnect_count = 0
+        self._resync = False
+        # as if still moving, the status shows the flaps from before the command
+        self._resync_line = json.dumps(self.controller._status(), separators=(', ', ':')) + '\n'
+
+    async def readline(self):
+        if self._resync:
+            self._resync = False
+            self.reconnect_count += 1
+            return self._resync_line
+        line = await super().readline()
+        self._resync = 'move_echo' in line and self.reconnect_count == 0
+        return line
+
+
+class AsyncSplitflapTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self._transport = AsyncMockControllerTransport(4)
+        self._splitflap = AsyncSplitflap(self._transport)
+        run(self._splitflap.start())
+
+    def tearDown(self):
+        run(self._splitflap.stop())
+        asyncio.get_event_loop().close()
+
+    def test_start_waits_for_init(self):
+        self.assertEqual(4, self._splitflap.get_num_modules())
+        self.assertEqual(4, len(self._splitflap.get_status()))
+
+    def test_set_text(self):
+        status = run(self._splitflap.set_text('abcd', True))
+        self.assertEqual(['a', 'b', 'c', 'd'], [module['flap'] for module in status])
+        self.assertEqual(['=abcd'], self._transport.controller.commands)
+
+    def test_status_updates(self):
+        async def set_text_and_watch():
+            updates = self._splitflap.status_updates()
+            next_update = asyncio.ensure_future(updates.__anext__())
+            await asyncio.sleep(0)
+            await self._splitflap.set_text('dcba', True)
+            status = await next_update
+            await updates.aclose()
+            return status
+
+        status = run(set_text_and_watch())
+        self.assertEqual(['d', 'c', 'b', 'a'], [module['flap'] for module in status])
+
+    def test_slow_controller_does_not_block_loop(self):
+        self._transport.controller.move_delay = 0.2
+
+        async def set_text_and_tick():
+            ticks = 0
+            set_text = asyncio.ensure_future(self._splitflap.set_text('abcd', True))
+            while not set_text.done():
+                ticks += 1
+                await asyncio.sleep(0.01)
+            return ticks
+
+        self.assertGreater(run(set_text_and_tick()), 5)
+
+    def test_cancelled_set_text_finishes_before_next_command(self):
+        self._transport.controller.move_delay = 0.05
+
+        async def cancel_then_set_text():
+            cancelled = asyncio.ensure_future(self._splitflap.set_text('abcd', True))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            status = await self._splitflap.set_text('dcba', True)
+            return cancelled, status
+
+        cancelled, status = run(cancel_then_set_text())
+        self.assertTrue(cancelled.cancelled())
+        # the status for the cancelled command wasn't taken as this one's
+        self.assertEqual(['d', 'c', 'b', 'a'], [module['flap'] for module in status])
+        self.assertFalse(self._splitflap._reader_task.done())
+        self.assertEqual(['=abcd', '=dcba'], self._transport.controller.commands)
+
+    def test_reconnect_status_completes_no_command(self):
+        splitflap = AsyncSplitflap(_AsyncReconnectingTransport(4, move_delay=0.05))
+        run(splitflap.start())
+
+        async def set_text_across_reconnect():
+            updates = splitflap.status_updates()
+            next_update = asyncio.ensure_future(updates.__anext__())
+            await asyncio.sleep(0)
+            set_text = asyncio.ensure_future(splitflap.set_text('abcd', True))
+            await next_update
+            # subscribers see the status asked for on reconnecting, but the command is still waiting for its own
+            pending = not set_text.done()
+            status = await set_text
+            await updates.aclose()
+            return pending, status
+
+        try:
+            pending, status = run(set_text_across_reconnect())
+        finally:
+            run(splitflap.stop())
+        self.assertTrue(pending)
+        self.assertEqual(['a', 'b', 'c', 'd'], [module['flap'] for module in status])
+
+
+if __name__ == '__main__':
+    unittest.main()
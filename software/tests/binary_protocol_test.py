@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap import binary_protocol
+from splitflap.splitflap import Splitflap
+from splitflap.status import SplitflapStatus
+from tests.mock_controller import MockControllerTransport
+
+
+def make_status(text, states=None):
+    status = SplitflapStatus(len(text))
+    status.update_from_dicts([
+        {
+            'state': states[i] if states else 'normal',
+            'flap': flap,
+            'count_missed_home': 0,
+            'count_unexpected_home': 0,
+        }
+        for i, flap in enumerate(text)
+    ])
+    return status
+
+
+class FrameDecoderTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        decoder = binary_protocol.FrameDecoder()
+        decoder.feed(binary_protocol.encode_init(12, True) + binary_protocol.encode_no_op())
+
+        frame_type, body = decoder.next_frame()
+        self.assertEqual(binary_protocol.FRAME_INIT, frame_type)
+        self.assertEqual((12, True), binary_protocol.decode_init(body))
+
+        frame_type, body = decoder.next_frame()
+        self.assertEqual(binary_protocol.FRAME_NO_OP, frame_type)
+        self.assertEqual(0, len(body))
+        self.assertIsNone(decoder.next_frame())
+
+    def test_frame_split_across_reads(self):
+        decoder = binary_protocol.FrameDecoder()
+        data = binary_protocol.encode_move_echo('hello')
+        for i in range(len(data) - 1):
+            decoder.feed(data[i:i + 1])
+            self.assertIsNone(decoder.next_frame())
+        decoder.feed(data[-1:])
+        frame_type, body = decoder.next_frame()
+        self.assertEqual(binary_protocol.FRAME_MOVE_ECHO, frame_type)
+        self.assertEqual('hello', binary_protocol.decode_move_echo(body))
+
+    def test_body_is_view_into_buffer(self):
+        decoder = binary_protocol.FrameDecoder()
+        decoder.feed(binary_protocol.encode_move_echo('abc'))
+        _, body = decoder.next_frame()
+        self.assertIsInstance(body, memoryview)
+        decoder.feed(binary_protocol.encode_no_op())
+        self.assertEqual(b'abc', bytes(body))
+
+    def test_resync_after_corruption(self):
+        corrupted = bytearray(binary_protocol.encode_move_echo('abc'))
+        corrupted[5] ^= 0xFF
+        decoder = binary_protocol.FrameDecoder()
+        decoder.feed(b'junk' + bytes(corrupted) + binary_protocol.encode_no_op())
+        frame_type, _ = decoder.next_frame()
+        self.assertEqual(binary_protocol.FRAME_NO_OP, frame_type)
+        self.assertEqual(4 + len(corrupted), decoder.dropped_bytes)
+
+
+class StatusFrameTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        status = make_status("a z'", ['normal', 'look_for_home', 'sensor_error', 'panic'])
+        status.count_missed_home[2] = 7
+        status.count_unexpected_home[3] = 255
+
+        decoder = binary_protocol.FrameDecoder()
+        decoder.feed(binary_protocol.encode_status(status))
+        frame_type, body = decoder.next_frame()
+        self.assertEqual(binary_protocol.FRAME_STATUS, frame_type)
+
+        decoded = SplitflapStatus(4)
+        self.assertTrue(binary_protocol.decode_status(body, decoded))
+        self.assertEqual(status.to_dicts(), decoded.to_dicts())
+
+    def test_rejects_wrong_module_count(self):
+        body = binary_protocol.encode_status(make_status('abcd'))[4:-1]
+        self.assertFalse(binary_protocol.decode_status(body, SplitflapStatus(3)))
+        self.assertFalse(binary_protocol.decode_status(body, SplitflapStatus(5)))
+
+    def test_much_smaller_than_json(self):
+        status = make_status('abcdefghijkl')
+        json_line = '{"type":"status", "modules":[' + ', '.join(
+            '{"state":"normal", "flap":"a", "count_missed_home":0, "count_unexpected_home":0}' for _ in range(12)
+        ) + ']}\n'
+        self.assertLess(len(binary_protocol.encode_status(status)) * 10, len(json_line))
+
+
+class BinarySplitflapTestCase(unittest.TestCase):
+    def test_negotiates_binary(self):
+        transport = MockControllerTransport(4)
+        splitflap = Splitflap(transport, use_binary_protocol=True)
+        self.assertTrue(splitflap.is_binary_protocol())
+        self.assertTrue(transport.controller.binary)
+
+    def test_set_text(self):
+        splitflap = Splitflap(MockControllerTransport(12), use_binary_protocol=True)
+        self.assertEqual('abcdefghijkl', splitflap.set_text('abcdefghijkl', True).text())
+        self.assertEqual('abzdefghijkl', splitflap.set_text('abzdefghijkl', False).text())
+
+    def test_background_reader(self):
+        splitflap = Splitflap(MockControllerTransport(4), background_reader=True, use_binary_protocol=True)
+        self.assertEqual('abcd', splitflap.set_text('abcd', True).text())
+
+    def test_falls_back_to_json(self):
+        transport = MockControllerTransport(4, supports_binary=False)
+        splitflap = Splitflap(transport, use_binary_protocol=True)
+        self.assertFalse(splitflap.is_binary_protocol())
+        self.assertEqual('abcd', splitflap.set_text('abcd', True).text())
+
+
+if __name__ == '__main__':
+    unittest.main()
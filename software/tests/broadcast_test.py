@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.broadcast import Broadcaster
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class BroadcasterTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def tearDown(self):
+        asyncio.get_event_loop().close()
+
+    def test_every_subscriber_gets_each_value(self):
+        broadcaster = Broadcaster()
+
+        async def publish_and_receive():
+            subscriptions = [broadcaster.subscribe(), broadcaster.subscribe()]
+            receives = [asyncio.ensure_future(subscription.__anext__()) for subscription in subscriptions]
+            await asyncio.sleep(0)
+            self.assertEqual(2, len(broadcaster))
+            broadcaster.publish('a')
+            values = await asyncio.gather(*receives)
+            for subscription in subscriptions:
+                await subscription.aclose()
+            return values
+
+        self.assertEqual(['a', 'a'], run(publish_and_receive()))
+        self.assertEqual(0, len(broadcaster))
+
+    def test_slow_subscriber_skips_to_latest(self):
+        broadcaster = Broadcaster()
+
+        async def publish_burst():
+            subscription = broadcaster.subscribe()
+            first = asyncio.ensure_future(subscription.__anext__())
+            await asyncio.sleep(0)
+            broadcaster.publish('a')
+            self.assertEqual('a', await first)
+            # published while the subscriber was busy with 'a'
+            broadcaster.publish('b')
+            broadcaster.publish('c')
+            second = await subscription.__anext__()
+            await subscription.aclose()
+            return second
+
+        self.assertEqual('c', run(publish_burst()))
+
+    def test_replay_latest(self):
+        broadcaster = Broadcaster()
+        broadcaster.publish('a')
+
+        async def subscribe():
+            subscription = broadcaster.subscribe(replay_latest=True)
+            value = await subscription.__anext__()
+            await subscription.aclose()
+            return value
+
+        self.assertEqual('a', run(subscribe()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import select
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tests.mock_controller import MockController
+
+
+# A local TCP server standing in for the ESP-Link telnet port. Every connection is sent `payload` `repeat` times and then
+# closed.
+class EspLinkStandIn:
+    def __init__(self, payload, repeat=1):
+        self._payload = payload
+        self._repeat = repeat
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(8)
+        self._thread = None
+        self._closed = False
+        self.connection_count = 0
+
+    @property
+    def address(self):
+        return self._server.getsockname()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._closed = True
+        self._server.close()
+
+    def _serve(self):
+        while not self._closed:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            self.connection_count += 1
+            with conn:
+                for _ in range(self._repeat):
+                    conn.sendall(self._payload)
+
+
+# Stands in for a whole ESP-Link with a controller behind it: a telnet port speaking the controller protocol (emulated by
+# MockController) and an HTTP server answering /console/reset. As with a real ESP-Link, the controller keeps running
+# between telnet connections, output sent while nobody is connected is lost, and only a reset makes it init again.
+class EspLinkControllerStandIn:
+    def __init__(self, num_modules, move_delay=0, home_delay=0):
+        self._num_modules = num_modules
+        self._move_delay = move_delay
+        self._home_delay = home_delay
+        self._lock = threading.Lock()
+        self.controller = MockController(num_modules, move_delay, home_delay=home_delay)
+
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(8)
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._connection = None
+        self._closed = False
+        self._thread = None
+        self.connection_count = 0
+        self.reset_count = 0
+        self.http_connection_count = 0
+
+        stand_in = self
+
+        class ResetHandler(BaseHTTPRequestHandler):
+            # keep connections open between requests, like the ESP-Link's web server
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stand_in._lock:
+                    stand_in.http_connection_count += 1
+
+            def do_POST(self):
+                if self.path != '/console/reset':
+                    self.send_error(404)
+                    return
+                stand_in.reset()
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._http_server = ThreadingHTTPServer(('127.0.0.1', 0), ResetHandler)
+        self._http_server.daemon_threads = True
+        self._http_thread = None
+
+    @property
+    def address(self):
+        return self._server.getsockname()
+
+    @property
+    def http_port(self):
+        return self._http_server.server_address[1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        self._http_thread = threading.Thread(target=self._http_server.serve_forever, args=(0.05,), daemon=True)
+        self._http_thread.start()
+
+    def close(self):
+        self._closed = True
+        self._wake()
+        self._thread.join()
+        self._http_server.shutdown()
+        self._http_server.server_close()
+        self._server.close()
+        self._wake_reader.close()
+        self._wake_writer.close()
+
+    def reset(self):
+        with self._lock:
+            self.reset_count += 1
+            self.controller = MockController(self._num_modules, self._move_delay, home_delay=self._home_delay)
+        self._wake()
+
+    def drop_connection(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.shutdown(socket.SHUT_RDWR)
+
+    def _wake(self):
+        self._wake_writer.send(b'\0')
+
+    def _accept(self):
+        connection, _ = self._server.accept()
+        with self._lock:
+            # the ESP-Link only serves one telnet client at a time
+            if self._connection is not None:
+                self._connection.close()
+            self._connection = connection
+            self.connection_count += 1
+
+    def _serve(self):
+        while not self._closed:
+            with self._lock:
+                ready_time, _ = self.controller.next_line()
+            timeout = None if ready_time is None else max(0, ready_time - time.monotonic())
+
+            sockets = [self._server, self._wake_reader]
+            if self._connection is not None:
+                sockets.append(self._connection)
+            readable, _, _ = select.select(sockets, [], [], timeout)
+
+            if self._wake_reader in readable:
+                self._wake_reader.recv(4096)
+            if self._server in readable:
+                self._accept()
+            elif self._connection is not None and self._connection in readable:
+                try:
+                    data = self._connection.recv(4096)
+                except OSError:
+                    data = b''
+                with self._lock:
+                    if len(data) == 0:
+                        self._connection.close()
+                        self._connection = None
+                    else:
+                        self.controller.receive(data.decode('utf-8'))
+
+            # a client that connected since the select should still get output queued after it connected
+            if self._server in select.select([self._server], [], [], 0)[0]:
+                self._accept()
+
+            with self._lock:
+                while True:
+                    ready_time, _ = self.controller.next_line()
+                    if ready_time is None or ready_time > time.monotonic():
+                        break
+                    data = self.controller.pop_bytes()
+                    if self._connection is not None:
+                        try:
+                            self._connection.sendall(data)
+                        except OSError:
+                            self._connection.close()
+                            self._connection = None
+
+        if self._connection is not None:
+            self._connection.close()
@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.async_splitflap import AsyncSplitflap
+from splitflap.instrumentation import Histogram, InstrumentedTransport, AsyncInstrumentedTransport, \
+    TransportMetrics, format_prometheus
+from splitflap.splitflap import Splitflap
+from splitflap.transport import EspLinkTransport
+from tests.esp_link_stand_in import EspLinkControllerStandIn
+from tests.mock_controller import MockControllerTransport, AsyncMockControllerTransport
+
+
+class HistogramTestCase(unittest.TestCase):
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertIsNone(histogram.percentile(50))
+        self.assertIsNone(histogram.mean())
+
+    def test_percentiles_keep_relative_precision(self):
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000.0)
+        self.assertEqual(1000, histogram.count)
+        self.assertAlmostEqual(0.5005, histogram.mean())
+        for percentile, expected in ((50, 0.5), (90, 0.9), (99, 0.99)):
+            self.assertAlmostEqual(expected, histogram.percentile(percentile), delta=expected * 0.04)
+        self.assertEqual(1.0, histogram.percentile(100))
+
+    def test_small_values_are_exact(self):
+        histogram = Histogram()
+        histogram.record(0.000003)
+        self.assertAlmostEqual(0.000003, histogram.percentile(50))
+
+
+class InstrumentedTransportTestCase(unittest.TestCase):
+    def test_counts_traffic_and_latency(self):
+        transport = InstrumentedTransport(MockControllerTransport(4), name='test')
+        splitflap = Splitflap(transport)
+        splitflap.set_text('abcd', True)
+        splitflap.set_text('abce', True)
+
+        metrics = transport.metrics
+        self.assertEqual(2, metrics.commands_written)
+        self.assertEqual(len('=abcd\n=abce\n'), metrics.bytes_written)
+        # init and status on startup, then a move_echo and status per command
+        self.assertEqual(6, metrics.lines_read)
+        self.assertEqual(6, metrics.readline_seconds.count)
+        self.assertEqual(2, metrics.echo_latency_seconds.count)
+        self.assertEqual(2, metrics.status_latency_seconds.count)
+        self.assertGreater(metrics.bytes_read, 0)
+
+    def test_binary_frames(self):
+        transport = InstrumentedTransport(MockControllerTransport(4))
+        splitflap = Splitflap(transport, use_binary_protocol=True)
+        self.assertTrue(splitflap.is_binary_protocol())
+        splitflap.set_text('abcd', True)
+
+        metrics = transport.metrics
+        self.assertEqual(2, metrics.frames_read)
+        self.assertEqual(1, metrics.echo_latency_seconds.count)
+        self.assertEqual(1, metrics.status_latency_seconds.count)
+
+    def test_recalibrate_has_no_echo(self):
+        transport = InstrumentedTransport(MockControllerTransport(4))
+        splitflap = Splitflap(transport)
+        splitflap.recalibrate_all()
+        self.assertEqual(0, transport.metrics.echo_latency_seconds.count)
+        self.assertEqual(1, transport.metrics.status_latency_seconds.count)
+
+    def test_async(self):
+        loop = asyncio.new_event_loop()
+        transport = AsyncInstrumentedTransport(AsyncMockControllerTransport(4))
+        splitflap = AsyncSplitflap(transport)
+
+        async def run():
+            await splitflap.start()
+            await splitflap.set_text('abcd', False)
+            await splitflap.stop()
+
+        loop.run_until_complete(run())
+        loop.close()
+        self.assertEqual(1, transport.metrics.echo_latency_seconds.count)
+        self.assertEqual(1, transport.metrics.status_latency_seconds.count)
+
+
+class InstrumentedEspLinkTestCase(unittest.TestCase):
+    def setUp(self):
+        self._stand_in = EspLinkControllerStandIn(4)
+        self._stand_in.start()
+
+    def tearDown(self):
+        self._stand_in.close()
+
+    def test_counts_status_requests_sent_by_transport(self):
+        host, port = self._stand_in.address
+        transport = InstrumentedTransport(EspLinkTransport(host, port, self._stand_in.http_port))
+        transport.open(reset=False)
+        try:
+            splitflap = Splitflap(transport, background_reader=True)
+            resynced = threading.Event()
+            splitflap.add_status_callback(lambda status: resynced.set())
+            self._stand_in.drop_connection()
+            self.assertTrue(resynced.wait(1))
+            splitflap.set_text('abcd', True)
+        finally:
+            transport.close()
+
+        metrics = transport.metrics
+        # the status requests on open and on reconnecting, then the command
+        self.assertEqual(3, metrics.commands_written)
+        self.assertEqual(len('A\nA\n=abcd\n'), metrics.bytes_written)
+
+
+class PrometheusTestCase(unittest.TestCase):
+    def test_format(self):
+        metrics = TransportMetrics('wall "left"')
+        metrics.bytes_written = 12
+        metrics.echo_latency_seconds.record(0.25)
+        text = format_prometheus([metrics])
+
+        self.assertIn('# TYPE splitflap_transport_bytes_written_total counter\n', text)
+        self.assertIn('splitflap_transport_bytes_written_total{controller="wall \\"left\\""} 12\n', text)
+        self.assertIn('# TYPE splitflap_transport_echo_latency_seconds summary\n', text)
+        self.assertIn('splitflap_transport_echo_latency_seconds_count{controller="wall \\"left\\""} 1\n', text)
+        self.assertIn('splitflap_transport_status_latency_seconds{controller="wall \\"left\\"",quantile="0.5"} NaN\n',
+                      text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import inspect
+import sys
+import os
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from service.message_formatter import MessageFormatter, LINE_BREAKING_GREEDY, LINE_BREAKING_OPTIMAL
+from splitflap.splitflap import is_in_alphabet
+
+CORPUS_MODULES = ['argparse', 'asyncio', 'collections', 'email', 'http.client', 'json', 'logging', 'os', 're', 'socket',
+                  'subprocess', 'threading', 'unittest', 'urllib.request', 'xml.etree.ElementTree']
+
+
+def _corpus():
+    # English prose from the docstrings of some standard library modules, one paragraph per message
+    paragraphs = []
+    for module_name in CORPUS_MODULES:
+        module = __import__(module_name, fromlist=['_'])
+        for _, member in inspect.getmembers(module):
+            doc = inspect.getdoc(member)
+            if doc is None or member is module:
+                continue
+            for paragraph in doc.split('\n\n'):
+                paragraph = ' '.join(paragraph.split())
+                if len(paragraph) > 0:
+                    paragraphs.append(paragraph)
+    return paragraphs
+
+
+# The greedy breaker as it was before a word exactly as long as the display got a blank line in front of it
+class _GreedyBefore(MessageFormatter):
+    def _break_line(self, line):
+        broken_lines = []
+
+        if len(line) <= self._line_length:
+            broken_lines.append(line)
+        else:
+            words = deque(line.split(' '))
+            line = ''
+            word = words.popleft()
+            while word is not None:
+                if len(word) > self._line_length:
+                    if len(line) > 0:
+                        line += ' '
+
+                    break_index = self._line_length - len(line)
+                    first_part = word[0: break_index]
+                    second_part = word[break_index:]
+                    line += first_part
+                    broken_lines.append(line)
+                    line = ''
+                    word = second_part
+                else:
+                    if len(line) + len(word) < self._line_length:
+                        if len(line) > 0:
+                            line += ' '
+                        line += word
+                    else:
+                        broken_lines.append(line)
+                        line = word
+
+                    if len(words) > 0:
+                        word = words.popleft()
+                    else:
+                        word = None
+
+            if len(line) > 0:
+                broken_lines.append(line)
+
+        return broken_lines
+
+
+def run(name, formatter, corpus, line_length):
+    start = time.perf_counter()
+    messages = [formatter.format(paragraph) for paragraph in corpus]
+    elapsed = time.perf_counter() - start
+
+    line_count = sum(len(lines) for lines in messages)
+    # squared space left at the end of every line of a message but its last
+    raggedness = sum(
+        (line_length - len(line.rstrip())) ** 2
+        for lines in messages
+        for line in lines[:-1]
+    )
+    print('{:<16} {:8} lines  raggedness {:10}  {:8.0f} messages/s'.format(
+        name,
+        line_count,
+        raggedness,
+        len(corpus) / elapsed,
+    ))
+
+
+if __name__ == '__main__':
+    corpus = _corpus()
+    print('{} messages, {} characters'.format(len(corpus), sum(len(paragraph) for paragraph in corpus)))
+    for line_length in (12, 24):
+        print('line length {}:'.format(line_length))
+        run('greedy (before)', _GreedyBefore(line_length, is_in_alphabet, cache_size=0), corpus, line_length)
+        run('greedy', MessageFormatter(line_length, is_in_alphabet, cache_size=0,
+                                       line_breaking=LINE_BREAKING_GREEDY), corpus, line_length)
+        run('optimal', MessageFormatter(line_length, is_in_alphabet, cache_size=0,
+                                        line_breaking=LINE_BREAKING_OPTIMAL), corpus, line_length)
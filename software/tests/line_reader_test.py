@@ -0,0 +1,78 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.line_reader import LineReader
+
+
+class ChunkedSource:
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self.calls = 0
+
+    def recv_into(self, buf):
+        self.calls += 1
+        if len(self._chunks) == 0:
+            return 0
+        chunk = self._chunks[0]
+        count = min(len(buf), len(chunk))
+        buf[0:count] = chunk[0:count]
+        if count == len(chunk):
+            self._chunks.pop(0)
+        else:
+            self._chunks[0] = chunk[count:]
+        return count
+
+
+class LineReaderTestCase(unittest.TestCase):
+    def test_multiple_lines_per_chunk(self):
+        source = ChunkedSource([b'foo\nbar\nbaz\n'])
+        reader = LineReader(source.recv_into)
+        self.assertEqual(b'foo\n', reader.readline())
+        self.assertEqual(b'bar\n', reader.readline())
+        self.assertEqual(b'baz\n', reader.readline())
+        self.assertEqual(1, source.calls)
+
+    def test_line_split_across_chunks(self):
+        source = ChunkedSource([b'fo', b'o\nb', b'ar', b'\n'])
+        reader = LineReader(source.recv_into)
+        self.assertEqual(b'foo\n', reader.readline())
+        self.assertEqual(b'bar\n', reader.readline())
+
+    def test_leftover_bytes_kept(self):
+        source = ChunkedSource([b'foo\nba'])
+        reader = LineReader(source.recv_into)
+        self.assertEqual(b'foo\n', reader.readline())
+        self.assertEqual(2, reader.buffered())
+
+    def test_partial_line_compacted(self):
+        source = ChunkedSource([b'abc\nde', b'fgh\n'])
+        reader = LineReader(source.recv_into, buffer_size=6)
+        self.assertEqual(b'abc\n', reader.readline())
+        self.assertEqual(b'defgh\n', reader.readline())
+
+    def test_buffer_grows_for_long_line(self):
+        source = ChunkedSource([b'x' * 100 + b'\n'])
+        reader = LineReader(source.recv_into, buffer_size=8)
+        self.assertEqual(b'x' * 100 + b'\n', reader.readline())
+
+    def test_read_returns_buffered_bytes_first(self):
+        source = ChunkedSource([b'foo\nbar', b'baz'])
+        reader = LineReader(source.recv_into)
+        self.assertEqual(b'foo\n', reader.readline())
+        self.assertEqual(b'bar', reader.read())
+        self.assertEqual(b'baz', reader.read())
+        self.assertEqual(0, reader.buffered())
+
+    def test_eof_keeps_buffered_bytes(self):
+        source = ChunkedSource([b'foo'])
+        reader = LineReader(source.recv_into)
+        with self.assertRaises(EOFError):
+            reader.readline()
+        self.assertEqual(3, reader.buffered())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,14 @@
+import io
+import itertools
 import unittest
 import sys
 import os
+import time
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from service.message_formatter import MessageFormatter
+from service.message_formatter import MessageFormatter, Page, LINE_BREAKING_GREEDY, LINE_BREAKING_OPTIMAL, \
+    LONG_LINE_LENGTH
 
 invalid_chars = ['@']
 
@@ -92,6 +96,187 @@ class MessageFormatterTestCase(unittest.TestCase):
             ['fo f', 'ooba', 'r   '],
             lines)
 
+    def test_word_as_long_as_line(self):
+        lines = self._formatter.format('abcd ef gh')
+        self.assertEqual(['abcd', 'ef  ', 'gh  '], lines)
+
+
+class MessageFormatterOptimalTestCase(unittest.TestCase):
+    def setUp(self):
+        self._greedy = MessageFormatter(10, is_valid_char)
+        self._optimal = MessageFormatter(10, is_valid_char, line_breaking=LINE_BREAKING_OPTIMAL)
+
+    def test_evens_out_lines(self):
+        message = 'dddddd aaa ffff dddddd'
+        self.assertEqual(['dddddd aaa', 'ffff      ', 'dddddd    '], self._greedy.format(message))
+        self.assertEqual(['dddddd    ', 'aaa ffff  ', 'dddddd    '], self._optimal.format(message))
+
+    def test_never_more_lines_than_greedy(self):
+        words = ['a', 'bb', 'ccc', 'dddd', 'eeeee', 'ffffffffff', 'ggggggggggggggg']
+        for i in range(200):
+            message = ' '.join(words[(i * 7 + j * j) % len(words)] for j in range(i % 13 + 1))
+            optimal = self._optimal.format(message)
+            self.assertLessEqual(len(optimal), len(self._greedy.format(message)), message)
+            self.assertEqual(message.replace(' ', ''), ''.join(optimal).replace(' ', ''))
+
+    def test_long_word_after_full_line_is_kept(self):
+        for line_breaking in (LINE_BREAKING_GREEDY, LINE_BREAKING_OPTIMAL):
+            formatter = MessageFormatter(12, is_valid_char, line_breaking=line_breaking)
+            self.assertEqual(['abcdefghijkl', 'mnopqrstuvwx', 'yzab        '],
+                             formatter.format('abcdefghijkl mnopqrstuvwxyzab'))
+            self.assertEqual(['abcdefghijkl', 'mnopqrstuvwx', 'yzabcdefghij', 'klmno       '],
+                             formatter.format('abcdefghijkl mnopqrstuvwxyzabcdefghijklmno'))
+
+    def test_unknown_line_breaking(self):
+        with self.assertRaises(ValueError):
+            MessageFormatter(10, is_valid_char, line_breaking='best')
+
+
+class MessageFormatterCacheTestCase(unittest.TestCase):
+    def test_hits_and_misses(self):
+        formatter = MessageFormatter(4, is_valid_char, cache_size=2)
+        self.assertEqual(['foo '], formatter.format('foo'))
+        self.assertEqual(['foo '], formatter.format('foo'))
+        formatter.format('bar')
+        formatter.format('baz')
+        # evicted as the least recently used
+        formatter.format('foo')
+        info = formatter.cache_info()
+        self.assertEqual(1, info.hits)
+        self.assertEqual(4, info.misses)
+        self.assertEqual(2, info.currsize)
+
+    def test_results_are_copies(self):
+        formatter = MessageFormatter(4, is_valid_char)
+        formatter.format('foo').append('bar ')
+        self.assertEqual(['foo '], formatter.format('foo'))
+
+
+class MessageFormatterAlphabetTestCase(unittest.TestCase):
+    def setUp(self):
+        self._formatter = MessageFormatter(6, alphabet={' ', 'a', 'b', '1', '.'})
+
+    def test_alphabet(self):
+        self.assertEqual(['ab 1. ', 'ab    '], self._formatter.format('AbC 1.\nab@'))
+
+    def test_matches_validator(self):
+        formatter = MessageFormatter(6, lambda char: char in {' ', 'a', 'b', '1', '.'})
+        for message in ('AbC 1.', ':ÅB:', 'a\tb', 'ß b', 'İa'):
+            self.assertEqual(formatter.format(message), self._formatter.format(message))
+
+
+class MessageFormatterIterTestCase(unittest.TestCase):
+    MESSAGES = [
+        '',
+        'foo',
+        'foo\n',
+        ':foo bar baz:\nfoo\n:f\n\nfo foobar@  x',
+        'FOO  bar:\n:\n::',
+    ]
+
+    def setUp(self):
+        self._formatter = MessageFormatter(6, is_valid_char)
+
+    def test_matches_format(self):
+        for message in self.MESSAGES:
+            self.assertEqual(self._formatter.format(message), list(self._formatter.format_iter(message)))
+
+    def test_chunked_input(self):
+        for message in self.MESSAGES:
+            for chunk_size in (1, 2, 5):
+                chunks = [message[i:i + chunk_size] for i in range(0, len(message), chunk_size)]
+                self.assertEqual(self._formatter.format(message), list(self._formatter.format_iter(chunks)))
+            self.assertEqual(self._formatter.format(message),
+                             list(self._formatter.format_iter(io.StringIO(message))))
+
+    def test_lazy(self):
+        chunks_read = []
+
+        def chunks():
+            for i in itertools.count():
+                chunks_read.append(i)
+                yield 'line {}\n'.format(i)
+
+        lines = self._formatter.format_iter(chunks())
+        self.assertEqual('line 0', next(lines))
+        self.assertEqual([0], chunks_read)
+
+    def test_long_lines_match_whole_line_breaking(self):
+        line = ' '.join('w{}@x:'.format(i) * (i % 4) for i in range(LONG_LINE_LENGTH // 4))
+        for message in (line, ' ' + line + ':  ', ':' + line + ':', ':' + line, line + ':\n:' + line):
+            expected = []
+            for message_line in message.split('\n'):
+                normalized_line, leading_colon, trailing_colon = self._formatter._normalize_line(message_line)
+                expected += [self._formatter._justify(broken_line, leading_colon, trailing_colon)
+                             for broken_line in self._formatter._break_line(normalized_line)]
+            self.assertEqual(expected, list(self._formatter.format_iter(message)))
+            for chunk_size in (1000, 5000):
+                chunks = [message[i:i + chunk_size] for i in range(0, len(message), chunk_size)]
+                self.assertEqual(expected, list(self._formatter.format_iter(chunks)))
+
+    def test_first_line_of_long_line_is_not_held_up(self):
+        def time_to_first_line(message):
+            started = time.perf_counter()
+            next(self._formatter.format_iter(message))
+            return time.perf_counter() - started
+
+        short = 'lorem ipsum ' * 100
+        long = 'lorem ipsum ' * 100000
+        # best of a few, to keep scheduling noise out of it
+        short_time = min(time_to_first_line(short) for _ in range(5))
+        long_time = min(time_to_first_line(long) for _ in range(5))
+        self.assertLess(long_time, short_time * 10 + 0.005)
+
+
+class MessageFormatterPagesTestCase(unittest.TestCase):
+    def setUp(self):
+        self._formatter = MessageFormatter(8, is_valid_char)
+
+    def test_pages(self):
+        pages = self._formatter.format_pages('one two three four five', 2)
+        self.assertEqual([
+            Page(['one two ', 'three   ']),
+            Page(['four    ', 'five    ']),
+        ], pages)
+        self.assertEqual('one two three   ', pages[0].text())
+        self.assertEqual('one two \nthree   ', str(pages[0]))
+
+    def test_balanced(self):
+        # greedy breaking would leave 'aaaa bbb' over a lone 'cc'
+        self.assertEqual([Page(['aaaa    ', 'bbb cc  '])], self._formatter.format_pages('aaaa bbb cc', 2))
+
+    def test_justification_per_row(self):
+        self.assertEqual(
+            [Page(['      ab', '   cd   ', 'ef      '])],
+            self._formatter.format_pages(':ab\n:cd:\nef:', 3),
+        )
+
+    def test_long_words(self):
+        self.assertEqual(
+            [Page(['ab abcde', 'fghijklm', 'nop     '])],
+            self._formatter.format_pages('ab abcdefghijklmnop', 3),
+        )
+        self.assertEqual(
+            [Page(['ab abcd-', 'efghijk-', 'lmnop   '])],
+            self._formatter.format_pages('ab abcdefghijklmnop', 3, hyphen='-'),
+        )
+
+    def test_undisplayable_hyphen(self):
+        with self.assertRaises(ValueError):
+            self._formatter.format_pages('abc', 2, hyphen='@')
+
+    def test_iter_matches(self):
+        message = ':one two:\nthree four five six seven\n\neight'
+        self.assertEqual(self._formatter.format_pages(message, 3),
+                         list(self._formatter.format_pages_iter(io.StringIO(message), 3)))
+
+
+    def test_long_line_is_wrapped_as_it_arrives(self):
+        message = 'abc ' * LONG_LINE_LENGTH
+        pages = list(self._formatter.format_pages_iter(iter([message]), 2))
+        self.assertEqual(Page(['abc abc ', 'abc abc ']), pages[0])
+        self.assertEqual(LONG_LINE_LENGTH // 4, len(pages))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
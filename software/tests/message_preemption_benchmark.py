@@ -0,0 +1,47 @@
+import asyncio
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from service.web import create_app
+from splitflap.async_splitflap import AsyncSplitflap
+from tests.mock_controller import AsyncMockControllerTransport
+
+
+NUM_MODULES = 12
+MOVE_DELAY = 0.5
+NUM_MESSAGES = 20
+# pause between POSTs, shorter than both the flap travel time and the interval between lines
+POST_INTERVAL = 0.1
+MESSAGES = ['departures\narrivals\nboarding', 'delayed\non time\ncancelled']
+
+
+def _percentile(samples, percentile):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+async def _run(app):
+    latencies = []
+    async with app.test_app() as test_app:
+        client = test_app.test_client()
+        for i in range(NUM_MESSAGES):
+            start = time.perf_counter()
+            await client.post('/api/message', data=MESSAGES[i % len(MESSAGES)])
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(POST_INTERVAL)
+    return latencies
+
+
+if __name__ == '__main__':
+    transport = AsyncMockControllerTransport(NUM_MODULES, MOVE_DELAY)
+    latencies = asyncio.get_event_loop().run_until_complete(_run(create_app(AsyncSplitflap(transport))))
+    print(f'{NUM_MESSAGES} back-to-back POSTs {POST_INTERVAL}s apart, {MOVE_DELAY}s flap travel time')
+    print('/api/message p50 {:7.1f} ms   p99 {:7.1f} ms   max {:7.1f} ms'.format(
+        _percentile(latencies, 50) * 1000,
+        _percentile(latencies, 99) * 1000,
+        max(latencies) * 1000,
+    ))
+    print(f'{len(transport.controller.commands)} commands sent to the controller')
@@ -0,0 +1,94 @@
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from service.message_queue import MessageQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class MessageQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self._clock = FakeClock()
+        self._queue = MessageQueue(self._clock)
+
+    def _pages(self):
+        return [entry.pages[0] for entry in self._queue.entries()]
+
+    def test_priority_then_arrival_order(self):
+        self._queue.push(['a'])
+        self._queue.push(['b'], priority=1)
+        self._queue.push(['c'])
+        self._queue.push(['d'], priority=1)
+        self.assertEqual(['b', 'd', 'a', 'c'], self._pages())
+        self.assertEqual('b', self._queue.pop().pages[0])
+        self.assertEqual(3, len(self._queue))
+
+    def test_expiry(self):
+        self._queue.push(['a'], ttl=5)
+        self._queue.push(['b'])
+        self._clock.now = 4
+        self.assertEqual(['a', 'b'], self._pages())
+        self._clock.now = 5
+        self.assertEqual(['b'], self._pages())
+
+    def test_delayed_entries_wait_for_start(self):
+        self._queue.push(['a'], delay=5)
+        self._queue.push(['b'], delay=2)
+        self.assertIsNone(self._queue.peek())
+        self.assertEqual(2, self._queue.next_start())
+        self._clock.now = 2
+        self.assertEqual('b', self._queue.pop().pages[0])
+        self.assertIsNone(self._queue.pop())
+        self.assertEqual(5, self._queue.next_start())
+        self._clock.now = 5
+        self.assertEqual('a', self._queue.pop().pages[0])
+        self.assertIsNone(self._queue.next_start())
+
+    def test_coalesce_by_key(self):
+        first = self._queue.push(['a1'], key='ticker')
+        self._queue.push(['b'])
+        second = self._queue.push(['a2'], key='ticker')
+        self.assertIs(first, second)
+        self.assertEqual(['a2', 'b'], self._pages())
+
+        self._queue.push(['a3'], key='ticker', priority=-1)
+        self.assertEqual(['b', 'a3'], self._pages())
+
+    def test_drop(self):
+        entry = self._queue.push(['a'])
+        self._queue.push(['b'])
+        self.assertTrue(self._queue.drop(entry.id))
+        self.assertFalse(self._queue.drop(entry.id))
+        self.assertEqual(['b'], self._pages())
+
+    def test_move(self):
+        self._queue.push(['a'], priority=2)
+        self._queue.push(['b'], priority=1)
+        entry = self._queue.push(['c'])
+        self.assertTrue(self._queue.move(entry.id, 1))
+        self.assertEqual(['a', 'c', 'b'], self._pages())
+        self.assertEqual(1, entry.priority)
+
+        # stays ahead of later pushes at its new priority
+        self._queue.push(['d'], priority=1)
+        self.assertEqual(['a', 'c', 'b', 'd'], self._pages())
+
+    def test_set_priority(self):
+        self._queue.push(['a'])
+        entry = self._queue.push(['b'])
+        self.assertTrue(self._queue.set_priority(entry.id, 1))
+        self.assertEqual(['b', 'a'], self._pages())
+        self.assertFalse(self._queue.set_priority(99, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from splitflap import binary_protocol
+from splitflap.status import SplitflapStatus
+
+_OP_CODE_UPDATE_MASK = 0b00111100
+
+
+# Emulates the serial protocol of arduino/splitflap/splitflap.ino. Responses are queued with the time at which the
+# controller would send them, so that a reader sees a `status` only after `move_delay` seconds of simulated flap travel.
+class MockController:
+    def __init__(self, num_modules, move_delay=0, sparse_update=True, supports_binary=True, home_delay=0):
+        self.num_modules = num_modules
+        self.supports_binary = supports_binary
+        self.binary = False
+        self.move_delay = move_delay
+        self.flaps = [' '] * num_modules
+        self.states = ['normal'] * num_modules
+        self.commands = []
+        self._recv_buffer = ''
+        self._pending = deque()
+
+        init = {'type': 'init', 'num_modules': num_modules}
+        if sparse_update:
+            init['sparse_update'] = True
+        self._send(0, init)
+        # the first status comes once every module has homed
+        self._send(home_delay, self._status())
+
+    def _status(self):
+        return {
+            'type': 'status',
+            'modules': [
+                {'state': state, 'flap': flap, 'count_missed_home': 0, 'count_unexpected_home': 0}
+                for state, flap in zip(self.states, self.flaps)
+            ],
+        }
+
+    def _send(self, delay, message):
+        if self.binary:
+            data = self._encode_frame(message)
+        else:
+            # formatted the same way as the firmware's hand-built json
+            data = json.dumps(message, separators=(', ', ':')) + '\n'
+        self._pending.append((time.monotonic() + delay, data))
+
+    @staticmethod
+    def _encode_frame(message):
+        t = message['type']
+        if t == 'init':
+            return binary_protocol.encode_init(message['num_modules'], message.get('sparse_update', False))
+        elif t == 'move_echo':
+            return binary_protocol.encode_move_echo(message['dest'])
+        elif t == 'status':
+            status = SplitflapStatus(len(message['modules']))
+            status.update_from_dicts(message['modules'])
+            return binary_protocol.encode_status(status)
+        elif t == 'no_op':
+            return binary_protocol.encode_no_op()
+        raise ValueError(t)
+
+    def receive(self, data):
+        self._recv_buffer += data
+        while '\n' in self._recv_buffer:
+            command, self._recv_buffer = self._recv_buffer.split('\n', 1)
+            if len(command) > 0:
+                self._handle_command(command)
+
+    def _handle_command(self, command):
+        self.commands.append(command)
+        op_code = command[0]
+        if op_code == '@':
+            self._send(self.move_delay, self._status())
+        elif op_code == 'A':
+            self._send(0, self._status())
+        elif op_code == 'B' and self.supports_binary:
+            self._send(0, {'type': 'protocol', 'protocol': 'binary'})
+            self.binary = True
+        elif op_code == '%':
+            updates = command[1:]
+            self._send(0, {'type': 'move_echo', 'dest': updates})
+            for i in range(0, len(updates) - 2, 3):
+                self.flaps[int(updates[i:i + 2], 16)] = updates[i + 2]
+            self._send(self.move_delay, self._status())
+        elif ord(op_code) & _OP_CODE_UPDATE_MASK == _OP_CODE_UPDATE_MASK:
+            dest = command[1:self.num_modules + 1]
+            self._send(0, {'type': 'move_echo', 'dest': dest})
+            for i, flap in enumerate(dest):
+                self.flaps[i] = flap
+            self._send(self.move_delay, self._status())
+        else:
+            self._send(0, {'type': 'no_op'})
+
+    def next_line(self):
+        if len(self._pending) == 0:
+            return None, None
+        return self._pending[0]
+
+    def pop_line(self):
+        return self._pending.popleft()[1]
+
+    def pop_bytes(self):
+        data = self._pending.popleft()[1]
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return data
+
+
+class MockControllerTransport:
+    def __init__(self, num_modules, move_delay=0, sparse_update=True, supports_binary=True):
+        self.controller = MockController(num_modules, move_delay, sparse_update, supports_binary)
+        self._condition = threading.Condition()
+
+    def _wait_for_data(self):
+        while True:
+            ready_time, line = self.controller.next_line()
+            if line is None:
+                self._condition.wait()
+                continue
+            delay = ready_time - time.monotonic()
+            if delay > 0:
+                # wake early if a write queues something new
+                self._condition.wait(delay)
+                continue
+            return
+
+    def readline(self):
+        with self._condition:
+            self._wait_for_data()
+            return self.controller.pop_line()
+
+    def read(self):
+        with self._condition:
+            self._wait_for_data()
+            return self.controller.pop_bytes()
+
+    def write(self, data):
+        with self._condition:
+            self.controller.receive(data)
+            self._condition.notify_all()
+
+
+class AsyncMockControllerTransport:
+    def __init__(self, num_modules, move_delay=0, sparse_update=True):
+        self.controller = MockController(num_modules, move_delay, sparse_update)
+        self._written = None
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def readline(self):
+        if self._written is None:
+            self._written = asyncio.Event()
+        while True:
+            ready_time, line = self.controller.next_line()
+            if line is None:
+                self._written.clear()
+                await self._written.wait()
+                continue
+            delay = ready_time - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            return self.controller.pop_line()
+
+    async def write(self, data):
+        self.controller.receive(data)
+        if self._written is not None:
+            self._written.set()
@@ -0,0 +1,70 @@
+import sys
+import os
+import time
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.splitflap import Splitflap
+from splitflap.transport import EspLinkTransport, reset_url
+from tests.esp_link_stand_in import EspLinkControllerStandIn
+
+
+NUM_RECONNECTS = 20
+# time the stand-in controller takes to home its modules after a reset
+HOME_DELAY = 0.1
+
+
+def _open_fresh_reset(stand_in):
+    # the previous EspLinkTransport.open: a new HTTP connection for every reset
+    host, port = stand_in.address
+    transport = EspLinkTransport(host, port, stand_in.http_port)
+    transport._open_socket()
+    requests.post(reset_url(host, stand_in.http_port))
+    return transport
+
+
+def _open_pooled_reset(stand_in):
+    host, port = stand_in.address
+    transport = EspLinkTransport(host, port, stand_in.http_port)
+    transport.open()
+    return transport
+
+
+def _open_resume(stand_in):
+    host, port = stand_in.address
+    transport = EspLinkTransport(host, port, stand_in.http_port)
+    transport.open(reset=False)
+    return transport
+
+
+def run(name, open_transport):
+    with EspLinkControllerStandIn(12, home_delay=HOME_DELAY) as stand_in:
+        # make sure the controller has inited once, as it would have in a running fleet
+        transport = _open_pooled_reset(stand_in)
+        Splitflap(transport)
+        transport.close()
+
+        elapsed = []
+        for _ in range(NUM_RECONNECTS):
+            start = time.perf_counter()
+            transport = open_transport(stand_in)
+            Splitflap(transport)
+            elapsed.append(time.perf_counter() - start)
+            transport.close()
+
+    elapsed.sort()
+    print('{:<24} median {:7.2f} ms, max {:7.2f} ms, {:2} HTTP connections'.format(
+        name,
+        1000 * elapsed[len(elapsed) // 2],
+        1000 * elapsed[-1],
+        stand_in.http_connection_count,
+    ))
+
+
+if __name__ == '__main__':
+    print(f'{NUM_RECONNECTS} reconnects to a stand-in ESP-Link, {HOME_DELAY}s homing after a reset')
+    run('reset, new connection', _open_fresh_reset)
+    run('reset, pooled session', _open_pooled_reset)
+    run('resume without reset', _open_resume)
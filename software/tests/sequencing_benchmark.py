@@ -0,0 +1,65 @@
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from service.message_formatter import MessageFormatter
+from splitflap.sequencing import plan_sequence, total_steps, total_travel_time
+from splitflap.splitflap import is_in_alphabet
+
+LINE_LENGTH = 12
+
+# Multi-line messages whose lines can be shown in any order, as they're sent to the display
+PLAYLISTS = {
+    'departures': ['7:42 boston', '7:55 albany', '8:03 newark', '8:10 trenton', '8:26 stamford', '8:31 hartford',
+                   '8:47 new haven', '9:02 providence', '9:15 worcester', '9:40 springfield'],
+    'tickers': ['aapl 189.30', 'msft 402.11', 'goog 141.80', 'amzn 178.25', 'nvda 880.08', 'meta 496.24',
+                'tsla 175.79', 'nflx 610.56', 'intc 43.31', 'amd 180.49', 'ibm 190.96', 'orcl 126.84'],
+    'groceries': ['milk', 'eggs', 'bread', 'coffee', 'apples', 'yogurt', 'spinach', 'rice', 'tomatoes',
+                  'cheese', 'butter', 'onions', 'lemons', 'pasta', 'garlic', 'honey'],
+    'countdown': ['{} days left'.format(days) for days in range(10, 0, -1)],
+    'weather': ['mon sunny 72', 'tue cloudy 68', 'wed rain 61', 'thu storms 59', 'fri sunny 70', 'sat windy 66',
+                'sun fog 63'],
+}
+
+
+def run(name, lines, formatter, start_text):
+    texts = formatter.format('\n'.join(lines))
+
+    start = time.perf_counter()
+    order = plan_sequence(texts, start_text, blank_hold=True)
+    elapsed = time.perf_counter() - start
+
+    planned = [start_text if index is None else texts[index] for index in order]
+    # the same frames, with the blank hold shown at the end as it would have been without the optimizer
+    given = texts + [start_text]
+    given_steps = total_steps(given, start_text)
+    planned_steps = total_steps(planned, start_text)
+    print('{:<12} {:3} frames  {:7} -> {:7} steps ({:5.1f}% saved)  {:6.1f} -> {:6.1f} s travel  {:8.2f} ms'.format(
+        name,
+        len(planned),
+        given_steps,
+        planned_steps,
+        100.0 * (given_steps - planned_steps) / given_steps,
+        total_travel_time(given, start_text),
+        total_travel_time(planned, start_text),
+        elapsed * 1000,
+    ))
+    return given_steps, planned_steps
+
+
+if __name__ == '__main__':
+    formatter = MessageFormatter(LINE_LENGTH, is_in_alphabet, cache_size=0)
+    start_text = ' ' * LINE_LENGTH
+    total_given = 0
+    total_planned = 0
+    for playlist_name, playlist_lines in PLAYLISTS.items():
+        given_steps, planned_steps = run(playlist_name, playlist_lines, formatter, start_text)
+        total_given += given_steps
+        total_planned += planned_steps
+    print('total: {} steps saved of {} ({:.1f}%)'.format(
+        total_given - total_planned,
+        total_given,
+        100.0 * (total_given - total_planned) / total_given,
+    ))
@@ -0,0 +1,55 @@
+import itertools
+import random
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.sequencing import EXACT_FRAME_LIMIT, plan_sequence, total_steps, total_travel_time
+from splitflap.status import FLAPS
+from splitflap.travel import GEAR_RATIO_INPUT_STEPS, steps_between
+
+
+def _random_texts(rng, count, length=4):
+    return [''.join(rng.choice(FLAPS) for _ in range(length)) for _ in range(count)]
+
+
+class SequencingTestCase(unittest.TestCase):
+    def test_total_steps(self):
+        self.assertEqual(0, total_steps(['ab', 'ab']))
+        self.assertEqual(steps_between(1, 2), total_steps(['ab', 'bb']))
+        self.assertEqual(steps_between(1, 2) + GEAR_RATIO_INPUT_STEPS // 2,
+                         total_steps(['bb'], start_text='ab', force_refresh=True))
+
+    def test_keeps_order_unless_reordering(self):
+        texts = ['zz', 'aa', 'mm']
+        self.assertEqual([0, 1, 2], plan_sequence(texts, '  ', reorder=False))
+        self.assertEqual([1, 2, 0], plan_sequence(texts, '  '))
+
+    def test_blank_hold_goes_where_modules_wrap(self):
+        # going from z to a passes the blank flap anyway
+        self.assertEqual([0, None, 1, 2], plan_sequence(['zz', 'aa', 'mm'], 'yy', reorder=False, blank_hold=True))
+        self.assertEqual([None], plan_sequence([], blank_hold=True))
+
+    def test_best_order_matches_brute_force(self):
+        rng = random.Random(1)
+        for count in range(1, 7):
+            texts = _random_texts(rng, count)
+            start_text = _random_texts(rng, 1)[0]
+            best = min(total_travel_time(order, start_text) for order in itertools.permutations(texts))
+            order = plan_sequence(texts, start_text)
+            self.assertEqual(sorted(range(count)), sorted(order))
+            self.assertAlmostEqual(best, total_travel_time([texts[index] for index in order], start_text))
+
+    def test_large_sets_improve_on_given_order(self):
+        rng = random.Random(2)
+        texts = _random_texts(rng, EXACT_FRAME_LIMIT * 3)
+        order = plan_sequence(texts, '    ')
+        self.assertEqual(list(range(len(texts))), sorted(order))
+        self.assertLess(total_travel_time([texts[index] for index in order], '    '),
+                        total_travel_time(texts, '    '))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import json
+import threading
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.splitflap import Splitflap
+from tests.mock_controller import MockControllerTransport
+
+
+def flaps(status):
+    return ''.join(module['flap'] for module in status)
+
+
+# Reconnects, as EspLinkTransport does when the connection drops, once the first command's echo has been read. The status
+# it asks for on reconnecting comes back straight away, before the command has finished.
+class _ReconnectingTransport(MockControllerTransport):
+    def __init__(self, num_modules, move_delay):
+        super().__init__(num_modules, move_delay)
+        self.reconnect_count = 0
+        self._resync = False
+        # as if still moving, the status shows the flaps from before the command
+        self._resync_line = json.dumps(self.controller._status(), separators=(', ', ':')) + '\n'
+
+    def readline(self):
+        if self._resync:
+            self._resync = False
+            self.reconnect_count += 1
+            return self._resync_line
+        line = super().readline()
+        self._resync = 'move_echo' in line and self.reconnect_count == 0
+        return line
+
+
+class SplitflapTestCase(unittest.TestCase):
+    def setUp(self):
+        self._transport = MockControllerTransport(4)
+        self._splitflap = Splitflap(self._transport)
+
+    def test_init(self):
+        self.assertEqual(4, self._splitflap.get_num_modules())
+        self.assertEqual('    ', flaps(self._splitflap.get_status()))
+
+    def test_set_text(self):
+        self.assertEqual('abcd', flaps(self._splitflap.set_text('abcd', True)))
+        self.assertEqual(['=abcd'], self._transport.controller.commands)
+
+    def test_recalibrate_all(self):
+        self._splitflap.recalibrate_all()
+        self.assertEqual(['@'], self._transport.controller.commands)
+
+    def test_update_without_refresh(self):
+        self.assertEqual('abcd', flaps(self._splitflap.set_text('abcd', False)))
+        self.assertEqual(['<abcd'], self._transport.controller.commands)
+
+    def test_sparse_update(self):
+        self._splitflap.set_text('abcd', True)
+        self.assertEqual('abzd', flaps(self._splitflap.set_text('abzd', False)))
+        self.assertEqual(['=abcd', '%02z'], self._transport.controller.commands)
+
+    def test_unchanged_text_not_sent(self):
+        self._splitflap.set_text('abcd', True)
+        self.assertEqual('abcd', flaps(self._splitflap.set_text('abcd', False)))
+        self.assertEqual(['=abcd'], self._transport.controller.commands)
+
+    def test_force_refresh_always_sent(self):
+        self._splitflap.set_text('abcd', True)
+        self._splitflap.set_text('abcd', True)
+        self.assertEqual(['=abcd', '=abcd'], self._transport.controller.commands)
+
+    def test_module_in_error_is_resent(self):
+        transport = MockControllerTransport(8)
+        splitflap = Splitflap(transport)
+        splitflap.set_text('abcdefgh', True)
+        transport.controller.states[1] = 'sensor_error'
+        splitflap.set_text('abcdefgi', True)
+        transport.controller.states[1] = 'normal'
+        splitflap.set_text('abcdefgj', False)
+        self.assertEqual('%01b07j', transport.controller.commands[-1])
+
+    def test_reformatted_status_parsed(self):
+        self._transport.controller._pending.append((0, '{"type": "status", "modules": [' + ', '.join(
+            ['{"state": "normal", "flap": "z", "count_missed_home": 0, "count_unexpected_home": 0}'] * 4
+        ) + ']}\n'))
+        self._transport.write('A\n')
+        self.assertEqual('zzzz', flaps(self._splitflap._loop_for_status()))
+
+    def test_full_update_without_sparse_support(self):
+        transport = MockControllerTransport(4, sparse_update=False)
+        splitflap = Splitflap(transport)
+        splitflap.set_text('abzd', False)
+        self.assertEqual(['<abzd'], transport.controller.commands)
+
+
+class BackgroundReaderSplitflapTestCase(unittest.TestCase):
+    def setUp(self):
+        self._transport = MockControllerTransport(4)
+        self._splitflap = Splitflap(self._transport, background_reader=True)
+
+    def test_init(self):
+        self.assertEqual(4, self._splitflap.get_num_modules())
+        self.assertEqual('    ', flaps(self._splitflap.get_status()))
+
+    def test_set_text(self):
+        self.assertEqual('abcd', flaps(self._splitflap.set_text('abcd', True)))
+        self.assertEqual('abcd', flaps(self._splitflap.get_status()))
+
+    def test_unsolicited_status_is_parsed(self):
+        received = threading.Event()
+        self._splitflap.add_status_callback(lambda status: received.set())
+
+        # ask for a status dump without going through the driver
+        self._transport.write('A\n')
+        self.assertTrue(received.wait(1))
+
+    def test_status_callback(self):
+        statuses = []
+        self._splitflap.add_status_callback(statuses.append)
+        self._splitflap.set_text('dcba', True)
+        self._splitflap.remove_status_callback(statuses.append)
+        self._splitflap.set_text('abcd', True)
+        self.assertEqual(['dcba'], [flaps(status) for status in statuses])
+
+    def test_reader_failure_raised_to_caller(self):
+        # controllers must only init once
+        self._transport.controller._send(0, {'type': 'init', 'num_modules': 4})
+        with self.assertRaises(RuntimeError):
+            self._splitflap.set_text('abcd', True)
+
+
+class PipelinedSplitflapTestCase(unittest.TestCase):
+    def setUp(self):
+        self._transport = MockControllerTransport(4, move_delay=0.05)
+        self._splitflap = Splitflap(self._transport, background_reader=True, max_in_flight=2)
+
+    def test_requires_background_reader(self):
+        splitflap = Splitflap(MockControllerTransport(4))
+        with self.assertRaises(RuntimeError):
+            splitflap.submit_text('abcd', True)
+
+    def test_commands_resolve_in_order(self):
+        commands = [self._splitflap.submit_text(text, True) for text in ('aaaa', 'bbbb')]
+        self.assertEqual('aaaa', commands[0].accepted.result(1))
+        self.assertEqual('aaaa', flaps(commands[0].done.result(1)))
+        self.assertEqual('bbbb', commands[1].accepted.result(1))
+        self.assertEqual('bbbb', flaps(commands[1].done.result(1)))
+        self.assertEqual([1, 2], [command.sequence for command in commands])
+
+    def test_in_flight_window_is_bounded(self):
+        first = self._splitflap.submit_text('aaaa', True)
+        self._splitflap.submit_text('bbbb', True)
+        self._splitflap.submit_text('cccc', True)
+        # the third submission had to wait for the first command to finish
+        self.assertTrue(first.done.done())
+        self.assertEqual(['=aaaa', '=bbbb', '=cccc'], self._transport.controller.commands)
+
+    def test_unchanged_text_resolves_immediately(self):
+        self._splitflap.set_text('abcd', True)
+        command = self._splitflap.submit_text('abcd', False)
+        self.assertTrue(command.done.done())
+        self.assertEqual(['=abcd'], self._transport.controller.commands)
+
+    def test_unchanged_text_waits_for_commands_in_flight(self):
+        first = self._splitflap.submit_text('abcd', False)
+        second = self._splitflap.submit_text('abcd', False)
+        self.assertFalse(second.done.done())
+        self.assertEqual('abcd', flaps(second.done.result(1)))
+        self.assertTrue(first.done.done())
+        self.assertEqual('abcd', second.accepted.result())
+        self.assertEqual(1, len(self._transport.controller.commands))
+
+    def test_unchanged_set_text_waits_for_commands_in_flight(self):
+        self._splitflap.submit_text('abcd', False)
+        self.assertEqual('abcd', flaps(self._splitflap.set_text('abcd', False)))
+
+    def test_set_text_waits_behind_pipeline(self):
+        self._splitflap.submit_text('aaaa', True)
+        self.assertEqual('bbbb', flaps(self._splitflap.set_text('bbbb', True)))
+
+    def test_reconnect_status_completes_no_command(self):
+        splitflap = Splitflap(_ReconnectingTransport(4, move_delay=0.05), background_reader=True)
+        resynced = threading.Event()
+        splitflap.add_status_callback(lambda status: resynced.set())
+        command = splitflap.submit_text('abcd', True)
+        self.assertTrue(resynced.wait(1))
+        self.assertFalse(command.done.done())
+        self.assertEqual('    ', flaps(splitflap.get_status()))
+        self.assertEqual('abcd', flaps(command.done.result(1)))
+
+    def test_reconnect_status_skipped_without_background_reader(self):
+        transport = _ReconnectingTransport(4, move_delay=0.05)
+        splitflap = Splitflap(transport)
+        self.assertEqual('abcd', flaps(splitflap.set_text('abcd', True)))
+        # the command's own status, not the one asked for on reconnecting
+        self.assertIsNone(transport.controller.next_line()[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import sys
+import os
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.splitflap import _ControllerSplitflap
+
+
+def _status_line(num_modules, flap, count_missed_home=0):
+    return '{"type":"status", "modules":[' + ', '.join(
+        '{"state":"normal", "flap":"' + flap + '", "count_missed_home":' + str(count_missed_home) +
+        ', "count_unexpected_home":0}'
+        for _ in range(num_modules)
+    ) + ']}\n'
+
+
+def _json_status(line):
+    # what Splitflap used to do with every status line
+    modules = json.loads(line)['modules']
+    return [module['state'] == 'normal' for module in modules]
+
+
+def _time_lines(splitflap, lines, number):
+    lines = iter(lines * number)
+    return timeit.timeit(lambda: splitflap._handle_line(next(lines)), number=number) / number
+
+
+def run(num_modules, number=2000):
+    splitflap = _ControllerSplitflap()
+    splitflap._handle_line('{"type":"init", "num_modules":%d}\n' % num_modules)
+
+    line = _status_line(num_modules, 'a')
+    json_time = timeit.timeit(lambda: _json_status(line), number=number) / number
+    # while moving, only the flaps change
+    flaps_time = _time_lines(splitflap, [line, _status_line(num_modules, 'b')], number)
+    # anything else changing, such as a missed home being counted, means parsing the whole line
+    counts_time = _time_lines(splitflap, [line, _status_line(num_modules, 'a', 1)], number)
+    repeated_time = _time_lines(splitflap, [line], number)
+
+    print('{:4} modules: json.loads {:6.1f} us   flaps changed {:6.1f} us   counts changed {:6.1f} us   '
+          'repeated line {:4.1f} us'.format(
+              num_modules,
+              json_time * 1e6,
+              flaps_time * 1e6,
+              counts_time * 1e6,
+              repeated_time * 1e6,
+          ))
+
+
+if __name__ == '__main__':
+    for num_modules in (12, 96, 480):
+        run(num_modules)
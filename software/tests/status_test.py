@@ -0,0 +1,100 @@
+import json
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.status import SplitflapStatus, STATE_NORMAL, STATE_SENSOR_ERROR
+
+# formatted the way splitflap.ino prints it
+FIRMWARE_STATUS_LINE = (
+    '{"type":"status", "modules":['
+    '{"state":"normal", "flap":"a", "count_missed_home":0, "count_unexpected_home":0}, '
+    '{"state":"sensor_error", "flap":"\'", "count_missed_home":3, "count_unexpected_home":65535}'
+    ']}'
+)
+
+
+class SplitflapStatusTestCase(unittest.TestCase):
+    def test_parse_firmware_line(self):
+        status = SplitflapStatus(2)
+        self.assertTrue(status.parse(FIRMWARE_STATUS_LINE))
+        self.assertEqual(bytearray([STATE_NORMAL, STATE_SENSOR_ERROR]), status.states)
+        self.assertEqual("a'", status.text())
+        self.assertEqual([0, 3], list(status.count_missed_home))
+        self.assertEqual([0, 65535], list(status.count_unexpected_home))
+
+    def test_parse_matches_json(self):
+        status = SplitflapStatus(2)
+        status.parse(FIRMWARE_STATUS_LINE)
+        self.assertEqual(json.loads(FIRMWARE_STATUS_LINE)['modules'], status.to_dicts())
+
+    def test_parse_rejects_other_formatting(self):
+        # anything not formatted like the firmware's output is left for the caller to parse as json
+        modules = [{'state': 'panic', 'flap': 'z', 'count_missed_home': 1, 'count_unexpected_home': 2}]
+        self.assertFalse(SplitflapStatus(1).parse(json.dumps({'type': 'status', 'modules': modules})))
+
+    def test_update_from_dicts(self):
+        modules = [{'state': 'panic', 'flap': 'z', 'count_missed_home': 1, 'count_unexpected_home': 2}]
+        status = SplitflapStatus(1)
+        status.update_from_dicts(modules)
+        self.assertEqual(modules, status.to_dicts())
+
+    def test_parse_rejects_wrong_module_count(self):
+        self.assertFalse(SplitflapStatus(1).parse(FIRMWARE_STATUS_LINE))
+        self.assertFalse(SplitflapStatus(3).parse(FIRMWARE_STATUS_LINE))
+
+    def test_parse_rejects_unknown_state(self):
+        line = FIRMWARE_STATUS_LINE.replace('sensor_error', 'on_fire')
+        self.assertFalse(SplitflapStatus(2).parse(line))
+
+    def test_parse_rejects_unknown_flap(self):
+        line = FIRMWARE_STATUS_LINE.replace('"flap":"a"', '"flap":"!"')
+        self.assertFalse(SplitflapStatus(2).parse(line))
+
+    def test_module_view(self):
+        status = SplitflapStatus(2)
+        status.parse(FIRMWARE_STATUS_LINE)
+        self.assertEqual('sensor_error', status[1]['state'])
+        self.assertEqual("'", status[-1]['flap'])
+        self.assertEqual(3, status[1].get('count_missed_home'))
+        self.assertEqual(['normal', 'sensor_error'], [module['state'] for module in status])
+        with self.assertRaises(KeyError):
+            status[0]['type']
+        with self.assertRaises(IndexError):
+            status[2]
+
+    def test_parse_lines_with_changed_flaps(self):
+        status = SplitflapStatus(2)
+        self.assertTrue(status.parse(FIRMWARE_STATUS_LINE))
+        # only the flaps differ from the last line, and everything else is kept from it
+        self.assertTrue(status.parse(FIRMWARE_STATUS_LINE.replace('"flap":"a"', '"flap":","')))
+        self.assertEqual(json.loads(FIRMWARE_STATUS_LINE.replace('"flap":"a"', '"flap":","'))['modules'],
+                         status.to_dicts())
+        # overwritten in between, as a binary status would be
+        module = {'state': 'panic', 'flap': 'z', 'count_missed_home': 1, 'count_unexpected_home': 2}
+        status.update_from_dicts([module, module])
+        self.assertTrue(status.parse(FIRMWARE_STATUS_LINE.replace('"flap":"a"', '"flap":"b"')))
+        self.assertEqual(json.loads(FIRMWARE_STATUS_LINE.replace('"flap":"a"', '"flap":"b"'))['modules'],
+                         status.to_dicts())
+
+        self.assertFalse(status.parse(FIRMWARE_STATUS_LINE.replace('"flap":"a"', '"flap":"!"')))
+        self.assertFalse(status.parse(FIRMWARE_STATUS_LINE.replace('"flap":"a"', '"flap":""')))
+        self.assertEqual("b'", status.text())
+
+        # a count changed too, so the whole line is parsed again
+        line = FIRMWARE_STATUS_LINE.replace('"count_missed_home":3', '"count_missed_home":4')
+        self.assertTrue(status.parse(line))
+        self.assertEqual(json.loads(line)['modules'], status.to_dicts())
+
+    def test_copy_is_independent(self):
+        status = SplitflapStatus(2)
+        status.parse(FIRMWARE_STATUS_LINE)
+        copy = status.copy()
+        status.flaps[0] = 0
+        self.assertEqual("a'", copy.text())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import socket
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.line_reader import LineReader
+from tests.esp_link_stand_in import EspLinkStandIn
+
+
+NUM_LINES = 20000
+
+
+def _status_line(num_modules):
+    modules = [{'state': 'normal', 'flap': 'a', 'count_missed_home': 0, 'count_unexpected_home': 0}] * num_modules
+    return (json.dumps({'type': 'status', 'modules': modules}) + '\n').encode('utf-8')
+
+
+def _read_byte_at_a_time(sock, stats):
+    # the pre-LineReader EspLinkTransport.readline implementation
+    line_buf = ''
+    eol = False
+    while not eol:
+        byte_buf = sock.recv(1)
+        stats['syscalls'] += 1
+        if len(byte_buf) == 0:
+            raise EOFError()
+        char_buf = byte_buf.decode('utf-8')
+        line_buf += char_buf
+        if char_buf[0] == '\n':
+            eol = True
+    return line_buf
+
+
+def _read_line_reader(sock, stats):
+    reader = stats.get('reader')
+    if reader is None:
+        def recv_into(buf):
+            stats['syscalls'] += 1
+            return sock.recv_into(buf)
+        reader = stats['reader'] = LineReader(recv_into)
+    return reader.readline().decode('utf-8')
+
+
+def run(name, readline, num_modules):
+    line = _status_line(num_modules)
+    with EspLinkStandIn(line, repeat=NUM_LINES) as server:
+        sock = socket.create_connection(server.address)
+        stats = {'syscalls': 0}
+        start = time.perf_counter()
+        for _ in range(NUM_LINES):
+            readline(sock, stats)
+        elapsed = time.perf_counter() - start
+        sock.close()
+
+    print('{:<20} {:3} modules ({:5} bytes/line): {:10.0f} lines/s, {:8.2f} syscalls/line'.format(
+        name,
+        num_modules,
+        len(line),
+        NUM_LINES / elapsed,
+        stats['syscalls'] / NUM_LINES,
+    ))
+
+
+if __name__ == '__main__':
+    for num_modules in (12, 96):
+        run('recv(1) (before)', _read_byte_at_a_time, num_modules)
+        run('LineReader (after)', _read_line_reader, num_modules)
@@ -0,0 +1,138 @@
+import socket
+import threading
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.splitflap import Splitflap
+from splitflap.transport import EspLinkTransport, http_session
+from tests.esp_link_stand_in import EspLinkControllerStandIn
+
+
+class EspLinkTransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self._stand_in = EspLinkControllerStandIn(4)
+        self._stand_in.start()
+
+    def tearDown(self):
+        self._stand_in.close()
+
+    def _transport(self):
+        host, port = self._stand_in.address
+        return EspLinkTransport(host, port, self._stand_in.http_port)
+
+    def test_socket_options(self):
+        with self._transport() as transport:
+            self.assertNotEqual(0, transport._socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+            self.assertNotEqual(0, transport._socket.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE))
+
+    def test_resets_share_http_connection(self):
+        self.assertIs(http_session(), http_session())
+        for _ in range(3):
+            with self._transport() as transport:
+                Splitflap(transport)
+        self.assertEqual(3, self._stand_in.reset_count)
+        self.assertEqual(1, self._stand_in.http_connection_count)
+
+    def test_resume_without_reset(self):
+        with self._transport() as transport:
+            Splitflap(transport).set_text('abcd', False)
+
+        transport = self._transport()
+        transport.open(reset=False)
+        try:
+            self.assertTrue(transport.resumed)
+            splitflap = Splitflap(transport)
+            self.assertEqual(4, splitflap.get_num_modules())
+            self.assertEqual('abcd', ''.join(module['flap'] for module in splitflap.get_status()))
+
+            # without the init, the driver can't know sparse updates are supported, so it sends full ones
+            splitflap.set_text('abce', False)
+            self.assertEqual('<abce', self._stand_in.controller.commands[-1])
+        finally:
+            transport.close()
+        self.assertEqual(1, self._stand_in.reset_count)
+
+    def test_reconnect_requests_status(self):
+        with self._transport() as transport:
+            splitflap = Splitflap(transport, background_reader=True)
+            resynced = threading.Event()
+            splitflap.add_status_callback(lambda status: resynced.set())
+            self._stand_in.drop_connection()
+            # the answer to the status request sent on reconnecting updates the status, but answers no command
+            self.assertTrue(resynced.wait(1))
+            self.assertEqual(1, transport.reconnect_count)
+            self.assertEqual('abcd', ''.join(module['flap'] for module in splitflap.set_text('abcd', False)))
+        self.assertEqual(2, self._stand_in.connection_count)
+        self.assertEqual(1, self._stand_in.reset_count)
+
+
+# Stands in for a connected socket, logging each write to `log` once it's been sent. Writes block while `unblocked` is
+# clear, and once `data` has been received the connection drops.
+class _FakeSocket(object):
+    def __init__(self, log, data):
+        self._log = log
+        self._data = data
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+        self.sending = threading.Event()
+        self.receiving = threading.Event()
+
+    def sendall(self, data):
+        self.sending.set()
+        self.unblocked.wait()
+        self._log.append((self, data))
+
+    def recv_into(self, buf):
+        self.receiving.set()
+        count = len(self._data)
+        buf[:count] = self._data
+        self._data = b''
+        return count
+
+    def close(self):
+        pass
+
+
+class _FakeSocketTransport(EspLinkTransport):
+    def __init__(self, sockets):
+        super().__init__('localhost')
+        self._sockets = iter(sockets)
+
+    def _open_socket(self):
+        self.close()
+        self._socket = next(self._sockets)
+
+
+class EspLinkTransportReconnectTestCase(unittest.TestCase):
+    def test_reconnect_waits_for_writes(self):
+        log = []
+        dropped = _FakeSocket(log, b'')
+        reconnected = _FakeSocket(log, b'{"type":"no_op"}\n')
+        transport = _FakeSocketTransport([dropped, reconnected])
+        transport.open(reset=False)
+
+        # a command part way through being written from another thread when the reader finds the connection dropped
+        dropped.unblocked.clear()
+        dropped.sending.clear()
+        writer = threading.Thread(target=transport.write, args=('=abcd\n',))
+        writer.start()
+        self.assertTrue(dropped.sending.wait(1))
+        lines = []
+        reader = threading.Thread(target=lambda: lines.append(transport.readline()))
+        reader.start()
+        self.assertTrue(dropped.receiving.wait(1))
+
+        dropped.unblocked.set()
+        writer.join(1)
+        reader.join(1)
+        # the status request went out on the new connection only once the command had been written
+        self.assertEqual([(dropped, b'A\n'), (dropped, b'=abcd\n'), (reconnected, b'A\n')], log)
+        self.assertEqual(['{"type":"no_op"}\n'], lines)
+        self.assertEqual(1, transport.reconnect_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import re
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.splitflap import Splitflap
+from splitflap.travel import ACCEL_STEP_PERIODS, GEAR_RATIO_INPUT_STEPS, TravelTimePredictor, move_micros, \
+    steps_between
+from tests.mock_controller import MockControllerTransport
+
+
+class TravelTestCase(unittest.TestCase):
+    def test_steps_between(self):
+        self.assertEqual(52, steps_between(0, 1))
+        self.assertEqual(51, steps_between(1, 2))
+        # flaps only turn one way
+        self.assertEqual(GEAR_RATIO_INPUT_STEPS // 2 - 52, steps_between(1, 0))
+        self.assertEqual(GEAR_RATIO_INPUT_STEPS // 2, steps_between(5, 5))
+
+    def test_periods_match_firmware(self):
+        header_path = os.path.join(os.path.dirname(__file__), '..', '..', 'arduino', 'splitflap', 'acceleration.h')
+        with open(header_path) as f:
+            periods = re.search(r'ACCEL_STEP_PERIODS\[\] = \{([^}]*)\}', f.read()).group(1)
+        self.assertEqual([int(period) for period in periods.split(',')], ACCEL_STEP_PERIODS)
+
+    def test_move_micros(self):
+        self.assertEqual(0, move_micros(0))
+        self.assertEqual(ACCEL_STEP_PERIODS[1], move_micros(1))
+        self.assertEqual(2 * ACCEL_STEP_PERIODS[1], move_micros(2))
+        self.assertEqual(2 * ACCEL_STEP_PERIODS[1] + ACCEL_STEP_PERIODS[2], move_micros(3))
+        # once at top speed, each extra step takes the shortest period
+        long_move = 4 * len(ACCEL_STEP_PERIODS)
+        self.assertEqual(ACCEL_STEP_PERIODS[-1], move_micros(long_move + 1) - move_micros(long_move))
+
+    def test_settle_time(self):
+        predictor = TravelTimePredictor()
+        self.assertLess(predictor.flap_micros('a', 'b'), predictor.flap_micros('a', 'z'))
+        self.assertLess(predictor.flap_micros('a', 'z'), predictor.flap_micros('b', 'a'))
+
+        times = predictor.module_times(' ab', 'bab')
+        self.assertEqual([predictor.flap_micros(' ', 'b') / 1000000.0, 0, 0], times)
+        self.assertEqual(times[0], predictor.settle_time(' ab', 'bab'))
+        self.assertEqual(predictor.flap_micros('a', 'a') / 1000000.0, predictor.settle_time(' ab', ' ab', True))
+        self.assertEqual(0, predictor.settle_time(' ab', ' ab'))
+
+    def test_splitflap_estimate(self):
+        splitflap = Splitflap(MockControllerTransport(3))
+        splitflap.set_text('abc', True)
+        predictor = TravelTimePredictor()
+        self.assertEqual(predictor.settle_time('abc', 'abz'), splitflap.estimate_travel_time('abz', False))
+        self.assertEqual(0, splitflap.estimate_travel_time('abc', False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import asyncio
+import time
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from splitflap.async_splitflap import AsyncSplitflap
+from splitflap.splitflap import MockSplitflap, Splitflap
+from splitflap.wall import AsyncSplitflapWall, SplitflapWall
+from tests.mock_controller import AsyncMockControllerTransport, MockControllerTransport
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def flaps(status):
+    return ''.join(module['flap'] for module in status)
+
+
+class SplitflapWallTestCase(unittest.TestCase):
+    def setUp(self):
+        self._controllers = [MockSplitflap(4), MockSplitflap(4)]
+
+    def test_default_layout(self):
+        with SplitflapWall(self._controllers, 2, 4) as wall:
+            self.assertEqual(8, wall.get_num_modules())
+            status = wall.set_text('abcdefgh', True)
+            self.assertEqual('abcdefgh', flaps(status))
+            self.assertEqual('abcd', flaps(self._controllers[0].get_status()))
+            self.assertEqual('efgh', flaps(self._controllers[1].get_status()))
+
+    def test_custom_layout(self):
+        # each row is split across both controllers
+        layout = [(0, 0), (0, 1), (1, 0), (1, 1), (0, 2), (0, 3), (1, 2), (1, 3)]
+        with SplitflapWall(self._controllers, 2, 4, layout) as wall:
+            status = wall.set_text('abcdefgh', True)
+            self.assertEqual('abcdefgh', flaps(status))
+            self.assertEqual('abef', flaps(self._controllers[0].get_status()))
+            self.assertEqual('cdgh', flaps(self._controllers[1].get_status()))
+
+    def test_unused_modules_keep_their_flaps(self):
+        self._controllers[1].set_text('wxyz', True)
+        with SplitflapWall(self._controllers, 1, 6) as wall:
+            wall.set_text('abcdef', True)
+            self.assertEqual('efyz', flaps(self._controllers[1].get_status()))
+
+    def test_short_text_padded(self):
+        with SplitflapWall(self._controllers, 2, 4) as wall:
+            self.assertEqual('ab      ', flaps(wall.set_text('ab', True)))
+
+    def test_invalid_layout(self):
+        with self.assertRaises(ValueError):
+            SplitflapWall(self._controllers, 1, 4, [(0, 0), (0, 1), (1, 2), (1, 4)])
+
+    def test_controllers_updated_in_parallel(self):
+        move_delay = 0.2
+        controllers = [Splitflap(MockControllerTransport(4, move_delay)) for _ in range(4)]
+        with SplitflapWall(controllers, 4, 4) as wall:
+            start = time.monotonic()
+            wall.set_text('abcd' * 4, True)
+            self.assertLess(time.monotonic() - start, move_delay * 2)
+
+
+class AsyncSplitflapWallTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self._transports = [AsyncMockControllerTransport(4), AsyncMockControllerTransport(4)]
+        self._controllers = [AsyncSplitflap(transport) for transport in self._transports]
+        for controller in self._controllers:
+            run(controller.start())
+
+    def tearDown(self):
+        for controller in self._controllers:
+            run(controller.stop())
+        asyncio.get_event_loop().close()
+
+    def test_default_layout(self):
+        wall = AsyncSplitflapWall(self._controllers, 2, 4)
+        self.assertEqual(8, wall.get_num_modules())
+        status = run(wall.set_text('abcdefgh', True))
+        self.assertEqual('abcdefgh', flaps(status))
+        self.assertEqual(['=abcd'], self._transports[0].controller.commands)
+        self.assertEqual(['=efgh'], self._transports[1].controller.commands)
+
+    def test_custom_layout(self):
+        layout = [(0, 0), (0, 1), (1, 0), (1, 1), (0, 2), (0, 3), (1, 2), (1, 3)]
+        wall = AsyncSplitflapWall(self._controllers, 2, 4, layout)
+        status = run(wall.set_text('abcdefgh', True))
+        self.assertEqual('abcdefgh', flaps(status))
+        self.assertEqual('abef', flaps(self._controllers[0].get_status()))
+        self.assertEqual('cdgh', flaps(self._controllers[1].get_status()))
+
+    def test_unused_modules_keep_their_flaps(self):
+        run(self._controllers[1].set_text('wxyz', True))
+        wall = AsyncSplitflapWall(self._controllers, 1, 6)
+        run(wall.set_text('abcdef', True))
+        self.assertEqual('efyz', flaps(self._controllers[1].get_status()))
+        # a forced refresh sends the unused modules their own flaps again
+        self.assertEqual(['=wxyz', '=efyz'], self._transports[1].controller.commands)
+
+    def test_short_text_padded(self):
+        wall = AsyncSplitflapWall(self._controllers, 2, 4)
+        self.assertEqual('ab      ', flaps(run(wall.set_text('ab', True))))
+
+    def test_status_updates_merge_controllers(self):
+        wall = AsyncSplitflapWall(self._controllers, 2, 4)
+
+        async def watch():
+            updates = wall.status_updates()
+            next_update = asyncio.ensure_future(updates.__anext__())
+            await asyncio.sleep(0.01)
+            # only the second controller moves, but the update covers the whole wall
+            await self._controllers[1].set_text('efgh', True)
+            status = await next_update
+            await updates.aclose()
+            return status
+
+        self.assertEqual('    efgh', flaps(run(watch())))
+
+    def test_recalibrate_all(self):
+        wall = AsyncSplitflapWall(self._controllers, 2, 4)
+        status = run(wall.recalibrate_all())
+        self.assertEqual(8, len(status))
+        for transport in self._transports:
+            self.assertEqual(['@'], transport.controller.commands)
+
+    def test_controllers_updated_concurrently(self):
+        move_delay = 0.2
+        for transport in self._transports:
+            transport.controller.move_delay = move_delay
+        wall = AsyncSplitflapWall(self._controllers, 2, 4)
+        start = time.monotonic()
+        run(wall.set_text('abcdefgh', True))
+        self.assertLess(time.monotonic() - start, move_delay * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
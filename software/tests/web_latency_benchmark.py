@@ -0,0 +1,108 @@
+import asyncio
+import random
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from service.web import create_app
+from splitflap.async_splitflap import AsyncSplitflap
+from splitflap.broadcast import Broadcaster
+from splitflap.splitflap import Splitflap
+from tests.mock_controller import AsyncMockControllerTransport, MockControllerTransport
+
+
+NUM_MODULES = 12
+MOVE_DELAY = 0.5
+NUM_CLIENTS = 16
+REQUESTS_PER_CLIENT = 10
+WORDS = ['hello', 'world', 'splitflap', 'departures', 'arrivals', 'delayed', 'on time', 'boarding']
+
+
+# Exposes a blocking Splitflap through the awaitable interface expected by the web service, the way the service used to
+# call it: straight from the coroutine, stalling the event loop for the duration of every status read.
+class BlockingSplitflap:
+    def __init__(self, splitflap):
+        self._splitflap = splitflap
+        self._status_broadcaster = Broadcaster()
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def is_in_alphabet(self, letter):
+        return self._splitflap.is_in_alphabet(letter)
+
+    def get_alphabet(self):
+        return self._splitflap.get_alphabet()
+
+    def get_rows(self):
+        return self._splitflap.get_rows()
+
+    def get_columns(self):
+        return self._splitflap.get_columns()
+
+    def get_status(self):
+        return self._splitflap.get_status()
+
+    def get_num_modules(self):
+        return self._splitflap.get_num_modules()
+
+    def estimate_travel_time(self, text, force_refresh):
+        return self._splitflap.estimate_travel_time(text, force_refresh)
+
+    def status_updates(self):
+        return self._status_broadcaster.subscribe()
+
+    async def set_text(self, text, force_refresh):
+        status = self._splitflap.set_text(text, force_refresh)
+        self._status_broadcaster.publish(status)
+        return status
+
+    async def clear_text(self):
+        return self._splitflap.clear_text()
+
+
+def _percentile(samples, percentile):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+async def _run_load(app):
+    latencies = []
+
+    async with app.test_app() as test_app:
+        client = test_app.test_client()
+
+        async def run_client():
+            for _ in range(REQUESTS_PER_CLIENT):
+                start = time.perf_counter()
+                if random.random() < 0.5:
+                    await client.get('/api/message')
+                else:
+                    await client.put('/api/message', data=random.choice(WORDS))
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*[run_client() for _ in range(NUM_CLIENTS)])
+
+    return latencies
+
+
+def run(name, splitflap):
+    random.seed(0)
+    latencies = asyncio.get_event_loop().run_until_complete(_run_load(create_app(splitflap)))
+    print('{:<10} p50 {:7.1f} ms   p99 {:7.1f} ms   max {:7.1f} ms'.format(
+        name,
+        _percentile(latencies, 50) * 1000,
+        _percentile(latencies, 99) * 1000,
+        max(latencies) * 1000,
+    ))
+
+
+if __name__ == '__main__':
+    print(f'{NUM_CLIENTS} clients x {REQUESTS_PER_CLIENT} /api/message requests, {MOVE_DELAY}s flap travel time')
+    run('blocking', BlockingSplitflap(Splitflap(MockControllerTransport(NUM_MODULES, MOVE_DELAY))))
+    run('asyncio', AsyncSplitflap(AsyncMockControllerTransport(NUM_MODULES, MOVE_DELAY)))
@@ -0,0 +1,600 @@
+import asyncio
+import datetime
+import json
+import math
+import time
+import unittest
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from service.web import MODE_FACTORIES, SplitflapClock, SplitflapCountdown, SplitflapMessenger, create_app
+from splitflap.async_splitflap import AsyncSplitflap, AsyncMockSplitflap
+from tests.mock_controller import AsyncMockControllerTransport
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class RecordingSplitflap(AsyncMockSplitflap):
+    def __init__(self, num_modules, move_delay=0):
+        super().__init__(num_modules, move_delay)
+        self.texts = []
+        self.force_refreshes = []
+
+    async def set_text(self, text, force_refresh):
+        self.texts.append(text)
+        self.force_refreshes.append(force_refresh)
+        return await super().set_text(text, force_refresh)
+
+
+class PredictingSplitflap(RecordingSplitflap):
+    def __init__(self, num_modules, travel_time):
+        super().__init__(num_modules)
+        self.travel_time = travel_time
+        self.sent_at = []
+
+    def estimate_travel_time(self, text, force_refresh):
+        return self.travel_time
+
+    async def set_text(self, text, force_refresh):
+        self.sent_at.append(time.monotonic())
+        return await super().set_text(text, force_refresh)
+
+
+class RecordingWall(RecordingSplitflap):
+    def get_rows(self):
+        return 2
+
+    def get_columns(self):
+        return 4
+
+
+class SplitflapMessengerTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def tearDown(self):
+        asyncio.get_event_loop().close()
+
+    def test_new_message_preempts_line_interval(self):
+        splitflap = AsyncMockSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=10)
+
+        async def set_messages():
+            await messenger.set_message('ab\ncd', False)
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            await messenger.set_message('ef', False)
+            elapsed = time.perf_counter() - start
+            await asyncio.sleep(0.01)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+            return elapsed
+
+        self.assertLess(run(set_messages()), 0.1)
+        self.assertEqual('ef  ', ''.join(module['flap'] for module in splitflap.get_status()))
+
+    def test_new_message_preempts_moving_line(self):
+        transport = AsyncMockControllerTransport(4, move_delay=0.2)
+        splitflap = AsyncSplitflap(transport)
+
+        async def set_messages():
+            await splitflap.start()
+            messenger = SplitflapMessenger(splitflap, line_interval=10)
+            await messenger.set_message('ab', False)
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            await messenger.set_message('cd', False)
+            elapsed = time.perf_counter() - start
+            # the interrupted line still finishes moving before the new one is sent
+            await asyncio.sleep(0.5)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+            await splitflap.stop()
+            return elapsed
+
+        self.assertLess(run(set_messages()), 0.1)
+        self.assertEqual(['<ab  ', '<cd  '], transport.controller.commands)
+        self.assertEqual('cd  ', ''.join(module['flap'] for module in splitflap.get_status()))
+
+    def test_queued_messages_wait_their_turn(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=0.05)
+
+        async def enqueue():
+            await messenger.enqueue_message('ab\ncd', False)
+            await messenger.enqueue_message('ef', False)
+            await asyncio.sleep(0.01)
+            self.assertEqual(['EF  \n'], [entry['text'] for entry in messenger.get_queue()])
+            await asyncio.sleep(0.2)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+
+        run(enqueue())
+        self.assertEqual(['ab  ', 'cd  ', 'ef  '], splitflap.texts)
+
+    def test_higher_priority_preempts_after_dwell(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=10)
+
+        async def enqueue():
+            await messenger.enqueue_message('ab\ncd', False, min_dwell=0.1)
+            await asyncio.sleep(0.01)
+            await messenger.enqueue_message('ef', False, priority=1)
+            await asyncio.sleep(0.05)
+            self.assertEqual(['ab  '], splitflap.texts)
+            await asyncio.sleep(0.1)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+
+        run(enqueue())
+        self.assertEqual(['ab  ', 'ef  '], splitflap.texts)
+
+    def test_burst_from_one_producer_coalesces(self):
+        splitflap = RecordingSplitflap(4, move_delay=0.05)
+        messenger = SplitflapMessenger(splitflap, line_interval=0.05)
+
+        async def enqueue():
+            await messenger.enqueue_message('aa', False)
+            for i in range(10):
+                await messenger.enqueue_message('b{}'.format(i), False, key='ticker')
+            await asyncio.sleep(0.3)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+
+        run(enqueue())
+        self.assertEqual(['aa  ', 'b9  '], splitflap.texts)
+
+    def test_expired_messages_are_skipped(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=0.1)
+
+        async def enqueue():
+            await messenger.enqueue_message('aa', False)
+            await messenger.enqueue_message('bb', False, ttl=0.05)
+            await messenger.enqueue_message('cc', False)
+            await asyncio.sleep(0.3)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+
+        run(enqueue())
+        self.assertEqual(['aa  ', 'cc  '], splitflap.texts)
+
+    def test_long_message_is_streamed(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=10)
+        message = '\n'.join('{:04}'.format(i) for i in range(100000))
+
+        async def set_message():
+            text = await messenger.set_message(message, False)
+            await asyncio.sleep(0.01)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+            return text
+
+        text = run(set_message())
+        self.assertEqual(['0000'], splitflap.texts)
+        self.assertEqual(33, len(text.splitlines()))
+        self.assertTrue(text.endswith('0031\n...\n'))
+
+    def test_wall_shows_pages(self):
+        splitflap = RecordingWall(8)
+        messenger = SplitflapMessenger(splitflap, line_interval=0.01)
+
+        async def set_message():
+            text = await messenger.set_message('ab cd ef gh', False)
+            await asyncio.sleep(0.1)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+            return text
+
+        self.assertEqual('AB  \nCD  \nEF  \nGH  \n', run(set_message()))
+        self.assertEqual(['ab  cd  ', 'ef  gh  '], splitflap.texts)
+
+    def test_reordered_message_takes_least_travel(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=0.01)
+
+        async def set_message():
+            await splitflap.set_text('kk  ', False)
+            await messenger.set_message('zz\naa\nmm', False, reorder=True, blank_hold=True)
+            await asyncio.sleep(0.1)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+
+        run(set_message())
+        # the modules pass the blank flap on the way from z back round to a
+        self.assertEqual(['kk  ', 'mm  ', 'zz  ', '    ', 'aa  '], splitflap.texts)
+
+    def test_line_interval_starts_once_predicted_travel_is_over(self):
+        def gap_between_lines(travel_time):
+            splitflap = PredictingSplitflap(4, travel_time)
+            messenger = SplitflapMessenger(splitflap, line_interval=0.2)
+
+            async def show():
+                await messenger.set_message('ab\ncd', False)
+                await asyncio.sleep(0.5)
+                messenger.exit()
+                await asyncio.sleep(0.01)
+
+            run(show())
+            self.assertEqual(['ab  ', 'cd  '], splitflap.texts)
+            return splitflap.sent_at[1] - splitflap.sent_at[0]
+
+        # the mock's status comes back at once, so only the prediction says the flaps are still moving
+        self.assertAlmostEqual(0.2, gap_between_lines(0), delta=0.04)
+        self.assertAlmostEqual(0.35, gap_between_lines(0.15), delta=0.04)
+
+    def test_reentering_shows_only_the_last_page(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=0.01)
+
+        async def show_and_reenter():
+            await messenger.set_message('ab\ncd\nef', False)
+            await asyncio.sleep(0.1)
+            messenger.exit()
+            first_frame = messenger.prepare()
+            messenger.enter(first_frame)
+            await asyncio.sleep(0.1)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+            return first_frame
+
+        self.assertEqual(['ef  '], run(show_and_reenter()))
+        # the message isn't replayed from its first page
+        self.assertEqual(['ab  ', 'cd  ', 'ef  ', 'ef  '], splitflap.texts)
+
+    def test_timeline_plays_back_on_schedule(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap, line_interval=0.01)
+
+        async def play():
+            await messenger.load_timeline([
+                {'text': 'ab', 'duration': 0.05},
+                {'text': 'cd', 'duration': 0.05},
+                {'text': 'ef', 'start': 0.2, 'duration': 0.05},
+            ])
+            await asyncio.sleep(0.02)
+            first = list(splitflap.texts)
+            await asyncio.sleep(0.1)
+            second = list(splitflap.texts)
+            await asyncio.sleep(0.15)
+            messenger.exit()
+            await asyncio.sleep(0.01)
+            return first, second
+
+        first, second = run(play())
+        self.assertEqual(['ab  '], first)
+        self.assertEqual(['ab  ', 'cd  '], second)
+        self.assertEqual(['ab  ', 'cd  ', 'ef  '], splitflap.texts)
+
+    def test_invalid_timeline_keeps_current_one(self):
+        splitflap = RecordingSplitflap(4)
+        messenger = SplitflapMessenger(splitflap)
+
+        async def load():
+            await messenger.load_timeline([{'text': 'ab', 'start': 10, 'duration': 5}])
+            with self.assertRaises(ValueError):
+                await messenger.load_timeline([{'text': 'cd', 'duration': 5}, {'text': 'ef', 'duration': -1}])
+            queue = messenger.get_queue()
+            messenger.exit()
+            await asyncio.sleep(0.01)
+            return queue
+
+        self.assertEqual(['AB  \n'], [entry['text'] for entry in run(load())])
+
+
+class SplitflapClockTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def tearDown(self):
+        asyncio.get_event_loop().close()
+
+    def test_changes_on_the_second(self):
+        splitflap = RecordingSplitflap(4, move_delay=0.01)
+        # a clock that's 50ms short of a second boundary now
+        offset = math.ceil(time.time()) - time.time() - 0.05
+        clock = SplitflapClock(splitflap, clock=lambda: time.time() + offset)
+
+        async def tick():
+            clock.enter()
+            await asyncio.sleep(0.02)
+            before = list(splitflap.texts)
+            await asyncio.sleep(0.1)
+            clock.exit()
+            await asyncio.sleep(0.01)
+            return before
+
+        self.assertEqual([], run(tick()))
+        second = datetime.datetime.fromtimestamp(math.ceil(time.time() + offset - 0.1)).second
+        self.assertEqual(['{:02d}'.format(second)], [text[-2:] for text in splitflap.texts])
+
+    def test_countdown(self):
+        countdown = SplitflapCountdown(AsyncMockSplitflap(8), clock=lambda: 1000.0)
+        self.assertEqual('0.00.00'.rjust(8), countdown.prepare())
+        countdown.set_duration(3725)
+        self.assertEqual('1.02.05'.rjust(8), countdown.prepare())
+        self.assertEqual('1.02.04'.rjust(8), countdown._format_time(1001))
+        # stays on zero once it's run out
+        self.assertEqual('0.00.00'.rjust(8), countdown._format_time(1000 + 3725 + 10))
+        for seconds in (-1, 'soon', None, True, math.inf):
+            with self.assertRaises(ValueError):
+                countdown.set_duration(seconds)
+
+    def test_lead_time_is_learned_from_status_delay(self):
+        clock = SplitflapClock(AsyncMockSplitflap(4))
+        self.assertEqual(0, clock.get_lead_time('  0b'))
+
+        # the status came back 0.3s after moving the last module 3 flaps, and the one before it 1 flap
+        clock._learn([0, 0, 1, 3], 0.3)
+        self.assertAlmostEqual(0.2, clock.get_lead_time('  0b'))
+        self.assertEqual(0, clock.get_lead_time('  0 '))
+        self.assertEqual(0.9, clock.get_lead_time('   0'))
+
+
+class TimelineApiTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def tearDown(self):
+        asyncio.get_event_loop().close()
+
+    def test_load_timeline(self):
+        app = create_app(AsyncMockSplitflap(4))
+
+        async def load():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                response = await client.post('/api/timeline', json=[
+                    {'text': 'ab', 'start': 10, 'duration': 5},
+                    {'text': 'cd', 'duration': 5, 'force_refresh': True},
+                ])
+                entries = await response.get_json()
+                bad_response = await client.post('/api/timeline', json=[{'text': 'ab'}])
+                queue = await (await client.get('/api/queue')).get_json()
+                return response.status_code, entries, bad_response.status_code, queue
+
+        status_code, entries, bad_status_code, queue = run(load())
+        self.assertEqual(200, status_code)
+        self.assertEqual(['AB  \n', 'CD  \n'], [entry['text'] for entry in entries])
+        self.assertAlmostEqual(10, entries[0]['starts_in'], places=1)
+        self.assertAlmostEqual(15, entries[1]['starts_in'], places=1)
+        self.assertEqual(400, bad_status_code)
+        self.assertEqual([entry['id'] for entry in entries], [entry['id'] for entry in queue])
+
+    def test_times_come_from_the_messenger_clock(self):
+        mode_factories = dict(MODE_FACTORIES)
+        mode_factories['message'] = lambda splitflap, on_change: SplitflapMessenger(
+            splitflap, clock=lambda: 1000.0, on_change=on_change)
+        app = create_app(AsyncMockSplitflap(4), mode_factories=mode_factories)
+
+        async def load():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                response = await client.post('/api/timeline', json=[{'text': 'ab', 'start': 10, 'duration': 5}])
+                entries = await response.get_json()
+                zero_response = await client.post('/api/timeline', json=[{'text': 'ab', 'duration': 0}])
+                return entries, zero_response.status_code
+
+        entries, zero_status_code = run(load())
+        self.assertEqual(10, entries[0]['starts_in'])
+        self.assertEqual(400, zero_status_code)
+
+
+class QueueApiTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def tearDown(self):
+        asyncio.get_event_loop().close()
+
+    def test_patch_queued_message(self):
+        app = create_app(AsyncMockSplitflap(4))
+
+        async def patch():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                await client.post('/api/timeline', json=[
+                    {'text': 'ab', 'start': 10, 'duration': 5},
+                    {'text': 'cd', 'start': 20, 'duration': 5},
+                ])
+                queue = await (await client.get('/api/queue')).get_json()
+                message_id = queue[1]['id']
+                status_codes = []
+                for body in ({'position': 0}, {'priority': 'high'}, {'position': 1.5}, {'priority': True}, [1], None):
+                    response = await client.patch('/api/queue/{}'.format(message_id), json=body)
+                    status_codes.append(response.status_code)
+                response = await client.patch('/api/queue/{}'.format(message_id), data='not json')
+                status_codes.append(response.status_code)
+                response = await client.patch('/api/queue/999', json={'position': 0})
+                status_codes.append(response.status_code)
+                queue = await (await client.get('/api/queue')).get_json()
+                return message_id, status_codes, queue
+
+        message_id, status_codes, queue = run(patch())
+        self.assertEqual([200, 400, 400, 400, 400, 400, 400, 404], status_codes)
+        self.assertEqual(message_id, queue[0]['id'])
+
+
+    def test_enqueue_rejects_malformed_arguments(self):
+        app = create_app(AsyncMockSplitflap(4))
+
+        async def enqueue():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                # a scheduled message, so the queue isn't empty
+                await client.post('/api/timeline', json=[{'text': 'ab', 'start': 10, 'duration': 5}])
+                status_codes = []
+                for query_string in ({'priority': 'high'}, {'priority': '1.5'}, {'ttl': 'soon'}, {'ttl': '-1'},
+                                     {'dwell': 'nan'}, {'priority': '2', 'ttl': '30', 'dwell': '1.5'}):
+                    response = await client.post('/api/message', data='cd', query_string=query_string)
+                    status_codes.append(response.status_code)
+                queue = await (await client.get('/api/queue')).get_json()
+                return status_codes, queue
+
+        status_codes, queue = run(enqueue())
+        self.assertEqual([400, 400, 400, 400, 400, 200], status_codes)
+        # only the valid one was taken, and it's showing rather than queued
+        self.assertEqual(['AB  \n'], [entry['text'] for entry in queue])
+
+
+class ModeTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def tearDown(self):
+        asyncio.get_event_loop().close()
+
+    def test_switch_goes_straight_to_first_frame(self):
+        splitflap = RecordingSplitflap(4, move_delay=0.2)
+        app = create_app(splitflap)
+
+        async def switch():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                await client.put('/api/message', data='ab')
+                await asyncio.sleep(0.3)
+                start = time.perf_counter()
+                await client.put('/api/mode', data='clock')
+                elapsed = time.perf_counter() - start
+                await asyncio.sleep(0.3)
+                await client.put('/api/mode', data='message')
+                await asyncio.sleep(0.3)
+                return elapsed
+
+        self.assertLess(run(switch()), 0.1)
+        self.assertEqual('ab  ', splitflap.texts[0])
+        self.assertEqual('ab  ', splitflap.texts[-1])
+        # only the PUT to /api/message asked for a full refresh
+        self.assertEqual([True] + [False] * (len(splitflap.texts) - 1), splitflap.force_refreshes)
+
+    def test_switch_does_not_wait_for_clock_move(self):
+        transport = AsyncMockControllerTransport(4, move_delay=0.5)
+        app = create_app(AsyncSplitflap(transport))
+
+        async def switch():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                await client.put('/api/mode', data='clock')
+                await asyncio.sleep(0.05)
+                # the clock's first frame is still moving
+                start = time.perf_counter()
+                await client.put('/api/mode', data='message')
+                elapsed = time.perf_counter() - start
+                await asyncio.sleep(0.6)
+                return elapsed
+
+        self.assertLess(run(switch()), 0.1)
+        # the messenger's first frame went out once the clock's command was done
+        self.assertEqual('<    ', transport.controller.commands[-1])
+
+    def test_countdown(self):
+        app = create_app(AsyncMockSplitflap(8))
+
+        async def start_countdown():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                bad_response = await client.put('/api/countdown', data='soon')
+                response = await client.put('/api/countdown', data='90')
+                status = await (await client.get('/api/status')).get_json()
+                return bad_response.status_code, response.status_code, status['mode']
+
+        self.assertEqual((400, 200, 'countdown'), run(start_countdown()))
+
+    def test_registered_mode(self):
+        class CountdownMode:
+            def __init__(self, splitflap):
+                self.entered_with = None
+
+            def prepare(self):
+                return '3210'
+
+            def enter(self, first_frame=None):
+                self.entered_with = first_frame
+
+            def exit(self):
+                pass
+
+        mode_factories = dict(MODE_FACTORIES)
+        mode_factories['countdown'] = lambda splitflap, on_change: CountdownMode(splitflap)
+        app = create_app(AsyncMockSplitflap(4), mode_factories=mode_factories)
+
+        async def select():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                response = await client.put('/api/mode', data='countdown')
+                status = await (await client.get('/api/status')).get_json()
+                return response.status_code, status['mode']
+
+        self.assertEqual((200, 'countdown'), run(select()))
+
+
+class StatusEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+    def tearDown(self):
+        asyncio.get_event_loop().close()
+
+    def test_status_snapshot(self):
+        app = create_app(AsyncMockSplitflap(4))
+
+        async def get_status():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                await client.put('/api/message', data='ab')
+                await asyncio.sleep(0.01)
+                response = await client.get('/api/status')
+                return await response.get_json()
+
+        status = run(get_status())
+        self.assertEqual('message', status['mode'])
+        self.assertEqual('AB  \n', status['message'])
+        self.assertEqual(['a', 'b', ' ', ' '], [module['flap'] for module in status['modules']])
+
+    def test_events_stream_changes_to_every_client(self):
+        app = create_app(AsyncMockSplitflap(4))
+
+        async def read_event(connection):
+            data = b''
+            while not data.endswith(b'\n\n'):
+                data += await connection.receive()
+            return json.loads(data.decode('utf-8')[len('data: '):])
+
+        async def watch():
+            async with app.test_app() as test_app:
+                client = test_app.test_client()
+                async with client.request('/api/events') as first, client.request('/api/events') as second:
+                    connections = [first, second]
+                    for connection in connections:
+                        await connection.send_complete()
+                    initial = [await read_event(connection) for connection in connections]
+
+                    await client.put('/api/message', data='ab')
+                    # skip past intermediate states to the one with the message on the modules
+                    updated = []
+                    for connection in connections:
+                        event = await read_event(connection)
+                        while event['modules'][0]['flap'] != 'a':
+                            event = await read_event(connection)
+                        updated.append(event)
+
+                    for connection in connections:
+                        await connection.disconnect()
+                return initial, updated
+
+        initial, updated = run(watch())
+        for event in initial:
+            self.assertIsNone(event['mode'])
+            self.assertEqual([' '] * 4, [module['flap'] for module in event['modules']])
+        for event in updated:
+            self.assertEqual('message', event['mode'])
+            self.assertEqual('AB  \n', event['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()